@@ -2,16 +2,48 @@ import gradio as gr
 from dotenv import load_dotenv
 load_dotenv()
 import asyncio
+import contextlib
 import os
-from src.graph.graph import app_graph
+import sys
+import time
+# The modules under src/ import each other by their flat names (as in the tests)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from src.graph.graph import async_app_graph, acheckpointed_app_graph
+from serving import job_queue
+from search import SEARCH_MAX_RESULTS
+from workspace import WORKSPACE, ReviewWorkspace
+from checkpoints import CHECKPOINTS, compact_text_store, new_run_id, run_config
 
+# Minimum seconds between UI refreshes while sections stream in
+STREAM_RENDER_INTERVAL = 0.15
 
-def run_research(topic: str, existing_files=None, max_results=3, progress=gr.Progress()):
+def render_sections(sections: dict) -> str:
+    """
+    Renders the review sections produced so far as markdown.
+    """
+    body = "# Systematic Review\n\n"
+    for name, text in sections.items():
+        if name == "Critique":
+            continue
+        body += f"## {name}\n{text}\n\n"
+    if "Critique" in sections:
+        body += f"---\n### Editor's Critique\n{sections['Critique']}\n"
+    return body
+
+
+async def run_research(topic: str, existing_files=None, max_results=3, streaming=False, run_id="",
+                       request: gr.Request = None, progress=gr.Progress()):
     """
     Runs the LangGraph workflow for the given topic and/or selected files.
+    Given the run ID of an earlier run, resumes it after its last completed node.
     """
-    if not topic.strip() and not existing_files:
-        return "Please enter a topic OR select PDF files."
+    run_id = (run_id or "").strip()
+    if run_id and not CHECKPOINTS:
+        yield gr.update(value="Resuming needs checkpoints (CHECKPOINTS=1)."), gr.update()
+        return
+    if not run_id and not topic.strip() and not existing_files:
+        yield gr.update(value="Please enter a topic OR select PDF files."), gr.update()
+        return
         
     progress(0, desc="Starting Research...")
     
@@ -27,12 +59,59 @@ def run_research(topic: str, existing_files=None, max_results=3, progress=gr.Pro
         "topic": topic,
         "local_files": local_file_paths,
         "revision_count": 0,
-        "max_results": max_results
+        "max_results": max_results,
+        "streaming": streaming
     }
+    user_id = getattr(request, "session_hash", None) or "anonymous"
+    if WORKSPACE:
+        # Re-running a topic in this session after adding or removing papers only analyzes the difference
+        initial_state["workspace"] = ReviewWorkspace.id_for(topic, user_id)
+    if run_id:
+        initial_state = None  # Continue from the run's last checkpoint
+    elif CHECKPOINTS:
+        run_id = new_run_id()
     
+    # Wait for a slot in the shared job queue (round-robin across sessions)
+    ticket = job_queue.enqueue(user_id)
+    try:
+        while not ticket.done():
+            yield gr.update(value=f"Waiting in queue (position {job_queue.position(ticket)})...\n"), gr.update()
+            await asyncio.wait([ticket], timeout=2.0)
+
+        async with contextlib.AsyncExitStack() as stack:
+            graph = async_app_graph
+            if run_id:
+                # Checkpoint after every node so a failed run can be resumed by its ID
+                graph = await stack.enter_async_context(acheckpointed_app_graph())
+            async for update in _run_workflow(topic, local_file_paths, initial_state, graph, run_id, progress):
+                yield update
+    finally:
+        job_queue.release(ticket)
+
+async def _run_workflow(topic, local_file_paths, initial_state, graph, run_id, progress):
+    """
+    Streams the graph run for one admitted job as (logs, review) updates.
+    With a run_id the (checkpointed) graph runs under that thread; an
+    initial_state of None resumes the run instead of starting a new one.
+    """
     # Run the graph
     try:
-        log_buffer = "--- STARTING WORKFLOW ---\n"
+        config = run_config(run_id) if run_id else None
+        if initial_state is None:
+            snapshot = await graph.aget_state(config)
+            if not snapshot.values:
+                yield gr.update(value=f"No checkpointed run with ID {run_id}."), gr.update()
+                return
+            current_state = dict(snapshot.values)
+            log_buffer = f"--- RESUMING RUN {run_id} ---\n"
+            if snapshot.next:
+                log_buffer += f"Continuing with: {', '.join(snapshot.next)}\n"
+            else:
+                log_buffer += "Run already finished.\n"
+        else:
+            current_state = dict(initial_state)
+            log_buffer = "--- STARTING WORKFLOW ---\n"
+            if run_id: log_buffer += f"Run ID: {run_id} (enter it to resume if this run fails)\n"
         if topic: log_buffer += f"Topic: {topic}\n"
         if local_file_paths: log_buffer += f"Files: {len(local_file_paths)}\n"
         
@@ -41,8 +120,19 @@ def run_research(topic: str, existing_files=None, max_results=3, progress=gr.Pro
         progress(0.1, desc="Searching & Extracting Papers...")
         
         # Use stream to show progress
-        current_state = initial_state
-        for output in app_graph.stream(initial_state):
+        sections = {}
+        last_render = 0.0
+        # The async graph lets one server process interleave many sessions
+        async for mode, output in graph.astream(initial_state, config, stream_mode=["updates", "custom"], durability="sync"):
+            if mode == "custom":
+                # Partial section text streamed from the LLM
+                sections[output["section"]] = output["text"]
+                now = time.monotonic()
+                if now - last_render >= STREAM_RENDER_INTERVAL:
+                    last_render = now
+                    yield gr.update(), render_sections(sections)
+                continue
+
             for key, value in output.items():
                 msg = f"Finished node: {key}"
                 print(msg)
@@ -57,6 +147,9 @@ def run_research(topic: str, existing_files=None, max_results=3, progress=gr.Pro
                 elif key == "analyze":
                     progress(0.6, desc="Analysis Complete. Synthesizing...")
                     log_buffer += "Analysis complete. Synthesizing results...\n"
+                elif key == "pipeline":
+                    progress(0.6, desc="Papers Analyzed. Drafting...")
+                    log_buffer += "Papers extracted and analyzed. Synthesizing results...\n"
                 elif key == "write":
                     progress(0.8, desc="Drafting Review...")
                     log_buffer += "Draft generated. Running critique...\n"
@@ -66,14 +159,17 @@ def run_research(topic: str, existing_files=None, max_results=3, progress=gr.Pro
                 
                 # Update local state tracking
                 current_state.update(value)
-                # Yield log update
-                yield gr.update(value=log_buffer), gr.update()
+                # Yield log update (and every section received so far)
+                yield gr.update(value=log_buffer), render_sections(sections) if sections else gr.update()
         
         final_review = current_state.get("final_review")
         if not final_review:
              # Fallback if manual update failed
              final_review = "Review generation completed, but output was not captured correctly."
         
+        if run_id:
+            # Only a failed run needs its checkpoints for resuming
+            await graph.checkpointer.adelete_thread(run_id)
         log_buffer += "--- DONE ---\n"
         progress(1.0, desc="Done!")
         # Final yield with review and full logs
@@ -81,7 +177,8 @@ def run_research(topic: str, existing_files=None, max_results=3, progress=gr.Pro
         
     except Exception as e:
         print(f"ERROR: {e}")
-        yield gr.update(value=f"Error occurred: {str(e)}"), f"Error: {str(e)}"
+        resume = f"\nResume with run ID {run_id}." if run_id else ""
+        yield gr.update(value=f"Error occurred: {str(e)}{resume}"), f"Error: {str(e)}"
 
 def list_pdfs():
     return [f for f in os.listdir('.') if f.lower().endswith('.pdf')]
@@ -103,7 +200,9 @@ with gr.Blocks(title="AI Research Paper Summarizer") as demo:
             else:
                 file_selector = gr.CheckboxGroup(visible=False) # Hidden if no files
 
-            max_results = gr.Slider(minimum=1, maximum=10, value=3, step=1, label="Max Papers to Analyze")
+            max_results = gr.Slider(minimum=1, maximum=SEARCH_MAX_RESULTS, value=3, step=1, label="Max Papers to Analyze")
+            streaming = gr.Checkbox(label="Stream papers through download, extraction and analysis", value=False)
+            run_id = gr.Textbox(label="Resume Run ID", placeholder="Leave empty to start a new run", visible=CHECKPOINTS)
                 
             submit_btn = gr.Button("Generate Review", variant="primary")
     
@@ -115,7 +214,7 @@ with gr.Blocks(title="AI Research Paper Summarizer") as demo:
     # Event
     submit_btn.click(
         fn=run_research,
-        inputs=[topic_input, file_selector, max_results],
+        inputs=[topic_input, file_selector, max_results, streaming, run_id],
         outputs=[logs_output, output_display]
     )
 
@@ -152,4 +251,8 @@ def check_startup():
 
 if __name__ == "__main__":
     check_startup()
+    # Before any run starts, so no text in use is dropped; prunes abandoned runs first
+    compact_text_store()
+    # Admission is handled by serving.job_queue, so don't let Gradio serialize clicks
+    demo.queue(default_concurrency_limit=None)
     demo.launch(server_name="127.0.0.1")
@@ -1,73 +1,216 @@
 import os
-from typing import List, Dict
-from typing import List, Dict
-from llm import get_llm
+import json
+import math
+import concurrent.futures
+from typing import List, Dict, Optional
+import asyncio
+from cache import file_digest
+from llm import complete, acomplete, run_async
+from extraction import ensure_text, aensure_text, register_text_budget, strip_back_matter
+from vectors import select_relevant_text, get_embedder, cluster_vectors
+from summarize import areduce
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
-def analyze_paper(paper_text: str, paper_title: str) -> str:
-    """
-    Analyzes a single paper's text to extract key findings, methodology, and results.
-    """
-    llm = get_llm(temperature=0)
-    
+# Characters of each paper's text that analyze_paper sends to the model
+ANALYSIS_CHAR_BUDGET = 3000
+# With retrieval on, analysis reads further into each paper and sends only
+# the chunks most relevant to the topic, still within ANALYSIS_CHAR_BUDGET.
+# It picks from RETRIEVAL_BREADTH times the budget: enough to reach past
+# the introduction, without extracting whole papers lazily.
+RETRIEVAL = os.getenv("RETRIEVAL", "1") != "0"
+RETRIEVAL_BREADTH = int(os.getenv("RETRIEVAL_BREADTH", "4"))
+RETRIEVAL_SOURCE_CHARS = int(os.getenv("RETRIEVAL_SOURCE_CHARS", str(RETRIEVAL_BREADTH * ANALYSIS_CHAR_BUDGET)))
+ANALYSIS_SOURCE_CHARS = RETRIEVAL_SOURCE_CHARS if RETRIEVAL else ANALYSIS_CHAR_BUDGET
+register_text_budget("analysis", ANALYSIS_SOURCE_CHARS)
+
+def _pdf_digest(paper) -> Optional[str]:
+    # Keys the paper's chunk vectors, so a longer extraction reuses them
+    if paper.get('pdf_digest') is None and paper.get('pdf_path'):
+        try:
+            paper['pdf_digest'] = file_digest(paper['pdf_path'])
+        except OSError:
+            return None
+    return paper.get('pdf_digest')
+
+def _analysis_text(text: str, topic: Optional[str], paper=None) -> str:
+    # References and appendices would crowd the findings out of the budget
+    text = strip_back_matter(text)
+    if RETRIEVAL and topic:
+        try:
+            doc_key = _pdf_digest(paper) if paper is not None else None
+            return select_relevant_text(text, topic, ANALYSIS_CHAR_BUDGET, doc_key=doc_key)
+        except Exception as e:
+            print(f"Retrieval failed, using the start of the paper: {e}")
+    return text[:ANALYSIS_CHAR_BUDGET]
+
+def _analysis_prompt(paper_text: str):
     prompt = ChatPromptTemplate.from_messages([
         ("system", "Analyze briefly."),
         ("user", "{text}")
     ])
-    
+    # Ultra-aggressive truncation for speed and credits
+    safe_text = paper_text[:ANALYSIS_CHAR_BUDGET]
+    return prompt.invoke({"text": safe_text})
+
+def analyze_paper(paper_text: str, paper_title: str) -> str:
+    """
+    Analyzes a single paper's text to extract key findings, methodology, and results.
+    """
     try:
-        # Ultra-aggressive truncation for speed and credits
-        safe_text = paper_text[:3000]
-        formatted_prompt = prompt.invoke({"text": safe_text})
-        response = llm.invoke(formatted_prompt)
-        return response.content
+        return complete(_analysis_prompt(paper_text), temperature=0)
     except Exception as e:
         return f"Error: {e}"
 
-def synthesize_findings(analyses: List[Dict[str, str]]) -> str:
+async def aanalyze_paper(paper_text: str, paper_title: str) -> str:
     """
-    Synthesizes analyses from multiple papers to find common themes and contrasts.
+    Async version of analyze_paper().
     """
-    llm = get_llm(temperature=0)
-    
+    try:
+        return await acomplete(_analysis_prompt(paper_text), temperature=0)
+    except Exception as e:
+        return f"Error: {e}"
+
+def _synthesis_prompt(analyses: List[Dict[str, str]]):
     content_str = ""
-    for item in analyses[:2]:  # Only top 2 papers
-        content_str += f"{item['title']}: {item['analysis'][:200]}\n"
+    for item in analyses:
+        content_str += f"{item['title']}: {item['analysis']}\n"
     
     prompt = ChatPromptTemplate.from_messages([
         ("system", "Summarize."),
         ("user", "{content}")
     ])
-    
+    return prompt.invoke({"content": content_str})
+
+# Analyses per synthesis call; larger sets are clustered by similarity first
+SYNTHESIS_GROUP_SIZE = int(os.getenv("SYNTHESIS_GROUP_SIZE", "6"))
+SYNTHESIS_MERGE = ("Merge these syntheses of related groups of papers into one synthesis: common themes,"
+                   " contrasting findings and open gaps. Attribute findings to paper titles.")
+
+def _embed_analyses(analyses: List[Dict[str, str]]):
+    return get_embedder().embed([f"{a['title']}\n{a['analysis']}" for a in analyses])
+
+def group_analyses(analyses: List[Dict[str, str]], group_size: int = SYNTHESIS_GROUP_SIZE) -> List[List[Dict[str, str]]]:
+    """
+    Clusters analyses by embedding similarity into groups of at most
+    group_size, so each synthesis call covers papers on a common theme.
+    """
+    if len(analyses) <= group_size:
+        return [analyses]
+    vectors = _embed_analyses(analyses)
+    labels = cluster_vectors(vectors, math.ceil(len(analyses) / group_size))
+    groups = []
+    leftovers = []
+    for label in sorted(set(labels.tolist())):
+        members = [a for a, l in zip(analyses, labels) if l == label]
+        # Oversized clusters are split so no call exceeds group_size analyses
+        for i in range(0, len(members), group_size):
+            (groups if len(members) - i >= group_size else leftovers).append(members[i:i + group_size])
+
+    # Pack partial clusters together (first fit, largest first) instead of spending a call on each
+    packed = []
+    for part in sorted(leftovers, key=len, reverse=True):
+        target = next((g for g in packed if len(g) + len(part) <= group_size), None)
+        if target is None:
+            packed.append(list(part))
+        else:
+            target.extend(part)
+    return groups + packed
+
+def extend_groups(groups: List[List[Dict[str, str]]], new: List[Dict[str, str]],
+                  group_size: int = SYNTHESIS_GROUP_SIZE) -> List[List[Dict[str, str]]]:
+    """
+    Adds new analyses to existing groups without moving any existing
+    member: each goes to the group with room whose mean embedding is most
+    similar, and those that fit nowhere are clustered among themselves
+    with group_analyses(). Existing groups keep their order and new ones
+    follow, so one new paper changes at most one group's synthesis call.
+    """
+    groups = [list(g) for g in groups if g]
+    if not new:
+        return groups
+    if not groups:
+        return group_analyses(new, group_size)
+    members = [a for g in groups for a in g]
+    vectors = _embed_analyses(members + new)
+    centroids = []
+    start = 0
+    for group in groups:
+        centroid = vectors[start:start + len(group)].sum(axis=0)
+        centroids.append(centroid / max(float((centroid ** 2).sum()) ** 0.5, 1e-12))
+        start += len(group)
+
+    rest = []
+    for analysis, vector in zip(new, vectors[len(members):]):
+        room = [i for i, group in enumerate(groups) if len(group) < group_size]
+        if not room:
+            rest.append(analysis)
+            continue
+        best = max(room, key=lambda i: float(centroids[i] @ vector))
+        groups[best].append(analysis)
+    return groups + (group_analyses(rest, group_size) if rest else [])
+
+def synthesize_findings(analyses: List[Dict[str, str]], groups: Optional[List[List[Dict[str, str]]]] = None) -> str:
+    """
+    Synthesizes analyses from multiple papers to find common themes and contrasts.
+    Up to SYNTHESIS_GROUP_SIZE analyses go into one call; beyond that they
+    are clustered, the clusters synthesized in parallel and the results merged.
+    groups, if given, is used instead of clustering (see extend_groups()).
+    """
     try:
-        formatted_prompt = prompt.invoke({"content": content_str})
-        response = llm.invoke(formatted_prompt)
-        return response.content
+        groups = groups or group_analyses(analyses)
+        if len(groups) == 1:
+            return complete(_synthesis_prompt(groups[0]), temperature=0)
+        print(f"Synthesizing {len(analyses)} analyses in {len(groups)} clusters...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(groups), ANALYSIS_WORKERS)) as executor:
+            partials = list(executor.map(lambda g: complete(_synthesis_prompt(g), temperature=0), groups))
+        return run_async(areduce(partials, SYNTHESIS_MERGE))
     except Exception as e:
         return f"Error: {e}"
 
-import concurrent.futures
+async def asynthesize_findings(analyses: List[Dict[str, str]], groups: Optional[List[List[Dict[str, str]]]] = None) -> str:
+    """
+    Async version of synthesize_findings().
+    """
+    try:
+        groups = groups or await asyncio.to_thread(group_analyses, analyses)
+        if len(groups) == 1:
+            return await acomplete(_synthesis_prompt(groups[0]), temperature=0)
+        print(f"Synthesizing {len(analyses)} analyses in {len(groups)} clusters...")
+        partials = await asyncio.gather(*[acomplete(_synthesis_prompt(g), temperature=0) for g in groups])
+        return await areduce(list(partials), SYNTHESIS_MERGE)
+    except Exception as e:
+        return f"Error: {e}"
 
-def analyze_single_paper_wrapper(paper):
+def analyze_single_paper_wrapper(paper, topic: Optional[str] = None):
     """
     Wrapper to call analyze_paper and return the result structure.
     """
-    text = paper.get('full_text', '')
+    text = ensure_text(paper, ANALYSIS_SOURCE_CHARS)
     title = paper.get('title', 'Unknown')
     if text:
+        text = _analysis_text(text, topic, paper)
         print(f"Analyzing {title[:30]}...")
         anim = analyze_paper(text, title)
+        if anim.startswith("Error:"):
+            # Don't let a failed call end up in the synthesis as if it were an analysis
+            print(f"Analysis failed for {title[:30]}: {anim}")
+            return None
         return {"title": title, "analysis": anim}
     return None
 
-def analyze_papers_concurrently(papers):
+# Upper bound on analysis threads; the LLM scheduler decides how many calls actually run at once.
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "16"))
+
+def analyze_papers_concurrently(papers, topic: Optional[str] = None):
     """
     Analyzes multiple papers in parallel.
     """
     analyses = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        results = list(executor.map(analyze_single_paper_wrapper, papers))
+    if not papers:
+        return analyses
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(papers), ANALYSIS_WORKERS)) as executor:
+        results = list(executor.map(lambda paper: analyze_single_paper_wrapper(paper, topic), papers))
     
     # Filter out None results
     for r in results:
@@ -75,3 +218,139 @@ def analyze_papers_concurrently(papers):
             analyses.append(r)
             
     return analyses
+
+async def aanalyze_single_paper_wrapper(paper, topic: Optional[str] = None):
+    """
+    Async version of analyze_single_paper_wrapper().
+    """
+    text = await aensure_text(paper, ANALYSIS_SOURCE_CHARS)
+    title = paper.get('title', 'Unknown')
+    if text:
+        # Embedding is CPU work; keep it off the event loop
+        text = await asyncio.to_thread(_analysis_text, text, topic, paper)
+        print(f"Analyzing {title[:30]}...")
+        anim = await aanalyze_paper(text, title)
+        if anim.startswith("Error:"):
+            # Don't let a failed call end up in the synthesis as if it were an analysis
+            print(f"Analysis failed for {title[:30]}: {anim}")
+            return None
+        return {"title": title, "analysis": anim}
+    return None
+
+async def aanalyze_papers_concurrently(papers, topic: Optional[str] = None):
+    """
+    Async version of analyze_papers_concurrently(); the LLM scheduler bounds concurrency.
+    """
+    results = await asyncio.gather(*[aanalyze_single_paper_wrapper(paper, topic) for paper in papers])
+    return [r for r in results if r]
+
+# Batched analysis packs several papers' excerpts into one request.
+ANALYSIS_BATCH_CHARS = int(os.getenv("ANALYSIS_BATCH_CHARS", "12000"))
+ANALYSIS_BATCH_TOKENS_PER_PAPER = 250
+
+def pack_batches(items: List[Dict[str, str]], context_budget: int = ANALYSIS_BATCH_CHARS) -> List[List[Dict[str, str]]]:
+    """
+    Groups {'title', 'text'} items into batches whose excerpts fit in context_budget characters.
+    """
+    batches = []
+    current = []
+    used = 0
+    for item in items:
+        size = len(item['text']) + len(item['title'])
+        if current and used + size > context_budget:
+            batches.append(current)
+            current = []
+            used = 0
+        current.append(item)
+        used += size
+    if current:
+        batches.append(current)
+    return batches
+
+_json_decoder = json.JSONDecoder()
+
+def parse_batch_response(response: str, count: int) -> Dict[int, str]:
+    """
+    Collects the {"id": n, "analysis": "..."} objects in a batch response into {n: analysis}.
+    Each object is decoded on its own with raw_decode, so code fences,
+    chatter, a missing bracket or a reply cut off mid-array only lose the
+    objects they actually break.
+    """
+    parsed = {}
+    pos = response.find("{")
+    while pos != -1:
+        try:
+            entry, end = _json_decoder.raw_decode(response, pos)
+        except json.JSONDecodeError:
+            pos = response.find("{", pos + 1)
+            continue
+        pos = response.find("{", end)
+        if not isinstance(entry, dict):
+            continue
+        try:
+            paper_id = int(entry.get("id"))
+        except (TypeError, ValueError):
+            continue
+        analysis = entry.get("analysis")
+        if 1 <= paper_id <= count and isinstance(analysis, str) and analysis.strip():
+            parsed[paper_id] = analysis.strip()
+    return parsed
+
+def analyze_batch(batch: List[Dict[str, str]]) -> List[Optional[str]]:
+    """
+    Analyzes several papers in one request. Returns one analysis per item,
+    with None for papers missing from (or unparseable in) the response.
+    """
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Analyze each paper briefly. Respond only with a JSON array containing one object per paper, "
+                   "in input order: [{{\"id\": <paper number>, \"analysis\": \"<analysis>\"}}]."),
+        ("user", "{papers}")
+    ])
+    papers_str = "\n\n".join(
+        f"[Paper {i}] {item['title']}\n{item['text']}" for i, item in enumerate(batch, start=1)
+    )
+    try:
+        formatted_prompt = prompt.invoke({"papers": papers_str})
+        response = complete(formatted_prompt, temperature=0, max_tokens=ANALYSIS_BATCH_TOKENS_PER_PAPER * len(batch))
+    except Exception as e:
+        print(f"Batched analysis failed: {e}")
+        return [None] * len(batch)
+
+    parsed = parse_batch_response(response, len(batch))
+    return [parsed.get(i) for i in range(1, len(batch) + 1)]
+
+def analyze_papers_batched(papers, context_budget: int = ANALYSIS_BATCH_CHARS, topic: Optional[str] = None):
+    """
+    Analyzes papers in as few requests as the context budget allows.
+    Papers the batched response doesn't cover are analyzed individually.
+    """
+    items = []
+    for paper in papers:
+        text = ensure_text(paper, ANALYSIS_SOURCE_CHARS)
+        if text:
+            items.append({"title": paper.get('title', 'Unknown'), "text": _analysis_text(text, topic, paper), "paper": paper})
+    if not items:
+        return []
+
+    batches = pack_batches(items, context_budget)
+    print(f"Analyzing {len(items)} papers in {len(batches)} batched request(s)...")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(batches), ANALYSIS_WORKERS)) as executor:
+        batch_results = list(executor.map(analyze_batch, batches))
+
+    results = {}
+    fallback = []
+    for batch, analyses in zip(batches, batch_results):
+        for item, analysis in zip(batch, analyses):
+            if analysis is None:
+                fallback.append(item)
+            else:
+                results[id(item)] = {"title": item['title'], "analysis": analysis}
+
+    if fallback:
+        print(f"Falling back to single-paper analysis for {len(fallback)} paper(s).")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(fallback), ANALYSIS_WORKERS)) as executor:
+            for item, r in zip(fallback, executor.map(lambda it: analyze_single_paper_wrapper(it['paper'], topic), fallback)):
+                if r:
+                    results[id(item)] = r
+
+    return [results[id(item)] for item in items if id(item) in results]
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Iterable, Optional
+
+CACHE_ROOT = os.getenv("PAPER_CACHE_DIR", ".cache")
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Returns the SHA-256 hex digest of a file's bytes.
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class ExtractionCache:
+    """
+    Content-addressed on-disk cache for extracted markdown.
+
+    Entries are keyed on the SHA-256 of the PDF bytes plus the extractor
+    version, stored zlib-compressed, and evicted least-recently-used once
+    the directory grows past max_bytes. Access time is tracked through the
+    entry's mtime, so the cache survives restarts without an index file.
+    The directory is walked once to learn its size, then the total is kept
+    up to date on every write; it is only walked again to pick entries to evict.
+    """
+
+    def __init__(self, directory: Optional[str] = None, version: str = "", max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory or os.path.join(CACHE_ROOT, "extraction")
+        self.version = version
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total: Optional[int] = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, digest: str) -> str:
+        return hashlib.sha256(f"{digest}:{self.version}".encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.md.z")
+
+    def get(self, digest: str) -> Optional[str]:
+        path = self._path(self.key(digest))
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # Mark as recently used
+            return zlib.decompress(data).decode("utf-8")
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Discarding unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+    def put(self, digest: str, text: str) -> None:
+        path = self._path(self.key(digest))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        data = zlib.compress(text.encode("utf-8"), 6)
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            replaced = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Failed to write cache entry {path}: {e}")
+            self._remove(tmp_path)
+            return
+        with self._lock:
+            if self._total is not None:
+                self._total += len(data) - replaced
+        self.evict()
+
+    def _entries(self) -> list:
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".md.z"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self) -> None:
+        """
+        Removes least-recently-used entries until the cache fits in max_bytes.
+        """
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._entries())
+            if self._total <= self.max_bytes:
+                return
+            # Walk again: the exact sizes and access times decide what goes
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+            self._total = total
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+class ResponseCache:
+    """
+    SQLite-backed key/value cache for API responses.
+
+    Values are stored zlib-compressed. Entries older than ttl seconds are
+    treated as misses. Expired rows are deleted, and the least-recently-used
+    entries dropped down to max_entries, on every prune_every-th write, so
+    the table can briefly run prune_every rows over its limit.
+    """
+
+    def __init__(self, name: str, ttl: float = 7 * 24 * 3600, max_entries: int = 10000, path: Optional[str] = None):
+        self.path = path or os.path.join(CACHE_ROOT, f"{name}.sqlite3")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prune_every = max(1, max_entries // 100)
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """
+        Returns the fresh entries among keys, looked up in one transaction.
+        """
+        now = time.time()
+        rows = {}
+        try:
+            with self._lock, self._conn:
+                for key in keys:
+                    row = self._conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+                    if row is None:
+                        continue
+                    if now - row[1] > self.ttl:
+                        self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                        continue
+                    self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                    rows[key] = row[0]
+            return {key: zlib.decompress(value).decode("utf-8") for key, value in rows.items()}
+        except Exception as e:
+            print(f"Response cache read failed: {e}")
+            return {}
+
+    def put(self, key: str, value: str) -> None:
+        self.put_many({key: value})
+
+    def put_many(self, entries: Dict[str, str]) -> None:
+        """
+        Stores every entry in one transaction (a single commit).
+        """
+        if not entries:
+            return
+        now = time.time()
+        rows = [(key, zlib.compress(value.encode("utf-8")), now, now) for key, value in entries.items()]
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, value, created, accessed) VALUES (?, ?, ?, ?)", rows
+                )
+                self._writes += len(rows)
+                if self._writes >= self.prune_every:
+                    self._writes = 0
+                    self._prune(now)
+        except Exception as e:
+            print(f"Response cache write failed: {e}")
+
+    def _prune(self, now: float) -> None:
+        self._conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed LIMIT ?)",
+                (count - self.max_entries,),
+            )
@@ -0,0 +1,201 @@
+import os
+import re
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import asynccontextmanager, closing
+from typing import Any, AsyncIterator, Dict, Optional
+
+import aiosqlite
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from cache import CACHE_ROOT
+from papers import PaperRecord, TextStore, get_text_store
+
+# Durable per-node checkpoints, so a failed run resumes instead of starting over
+CHECKPOINTS = os.getenv("CHECKPOINTS", "1") != "0"
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", os.path.join(CACHE_ROOT, "checkpoints.sqlite"))
+# A finished run's checkpoints are deleted; an unfinished one can be resumed this long
+CHECKPOINT_TTL = float(os.getenv("CHECKPOINT_TTL_HOURS", "72")) * 3600
+
+# Paper fields written to the text store and checkpointed as a reference
+TEXT_REF_FIELDS = ("full_text",)
+TEXT_REF_MIN_CHARS = 1024
+TEXT_REF = "__text_ref__"
+PAPER_RECORD = "__paper_record__"
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+def run_config(run_id: str) -> Dict[str, Any]:
+    """
+    Graph config that checkpoints (and resumes) the run under run_id.
+    """
+    return {"configurable": {"thread_id": run_id}}
+
+class TextRefSerializer(JsonPlusSerializer):
+    """
+    Checkpoint serializer that keeps large text out of the checkpoint rows.
+
+    PaperRecords are checkpointed as their metadata plus their text
+    handle. Long TEXT_REF_FIELDS values in plain dicts are written to the
+    same TextStore and replaced by {TEXT_REF: handle}. Either way the
+    checkpoint after every node costs a few bytes per paper instead of a
+    copy of each paper's markdown.
+    """
+
+    def __init__(self, store: Optional[TextStore] = None):
+        super().__init__()
+        self._store = store
+
+    @property
+    def store(self) -> TextStore:
+        return self._store or get_text_store()
+
+    def _ref(self, text: str) -> Dict[str, str]:
+        return {TEXT_REF: self.store.put(text)}
+
+    def _deref(self, ref: Dict[str, str]) -> str:
+        text = self.store.get(ref[TEXT_REF])
+        if text is None:
+            print(f"Checkpointed text {ref[TEXT_REF][:12]} is gone from the store; the paper will have no text.")
+            return ""
+        return text
+
+    def _externalize(self, obj):
+        if isinstance(obj, PaperRecord):
+            return {PAPER_RECORD: self._externalize(obj.metadata()), TEXT_REF: obj.text_handle}
+        if isinstance(obj, dict):
+            return {
+                k: self._ref(v) if k in TEXT_REF_FIELDS and isinstance(v, str) and len(v) >= TEXT_REF_MIN_CHARS
+                else self._externalize(v)
+                for k, v in obj.items()
+            }
+        if isinstance(obj, list):
+            return [self._externalize(v) for v in obj]
+        return obj
+
+    def _internalize(self, obj):
+        if isinstance(obj, dict) and PAPER_RECORD in obj:
+            return PaperRecord(self._internalize(obj[PAPER_RECORD]), text_handle=obj[TEXT_REF], store=self._store)
+        if isinstance(obj, dict):
+            return {
+                k: self._deref(v) if k in TEXT_REF_FIELDS and isinstance(v, dict) and TEXT_REF in v
+                else self._internalize(v)
+                for k, v in obj.items()
+            }
+        if isinstance(obj, list):
+            return [self._internalize(v) for v in obj]
+        return obj
+
+    def dumps_typed(self, obj: Any) -> tuple:
+        return super().dumps_typed(self._externalize(obj))
+
+    def loads_typed(self, data: tuple) -> Any:
+        return self._internalize(super().loads_typed(data))
+
+_serde: Optional[TextRefSerializer] = None
+_saver: Optional[SqliteSaver] = None
+_saver_lock = threading.Lock()
+
+def _get_serde() -> TextRefSerializer:
+    global _serde
+    with _saver_lock:
+        if _serde is None:
+            _serde = TextRefSerializer()
+        return _serde
+
+def get_checkpointer() -> SqliteSaver:
+    """
+    Returns the shared SQLite checkpointer for synchronous graphs.
+    """
+    global _saver
+    serde = _get_serde()
+    with _saver_lock:
+        if _saver is None:
+            os.makedirs(os.path.dirname(CHECKPOINT_DB) or ".", exist_ok=True)
+            _saver = SqliteSaver(sqlite3.connect(CHECKPOINT_DB, check_same_thread=False), serde=serde)
+        return _saver
+
+@asynccontextmanager
+async def open_async_checkpointer() -> AsyncIterator[AsyncSqliteSaver]:
+    """
+    Opens a SQLite checkpointer for async graphs, closed on exit. aiosqlite
+    connections are bound to one event loop and keep a worker thread alive,
+    so each run opens its own instead of sharing one for the process.
+    """
+    os.makedirs(os.path.dirname(CHECKPOINT_DB) or ".", exist_ok=True)
+    async with aiosqlite.connect(CHECKPOINT_DB) as conn:
+        yield AsyncSqliteSaver(conn, serde=_get_serde())
+
+def checkpoint_time(checkpoint_id: str) -> Optional[float]:
+    """
+    Unix time a checkpoint was written, read from its UUIDv6 id.
+    """
+    try:
+        u = uuid.UUID(checkpoint_id)
+    except ValueError:
+        return None
+    if u.version != 6:
+        return None
+    ticks = (u.int >> 80) << 12 | (u.int >> 64) & 0xFFF  # 100ns intervals since 1582-10-15
+    return (ticks - 0x01B21DD213814000) / 1e7
+
+def prune_checkpoints(db_path: Optional[str] = None, ttl: float = CHECKPOINT_TTL, now: Optional[float] = None) -> int:
+    """
+    Deletes the checkpoints of runs abandoned for longer than ttl, i.e.
+    whose latest checkpoint is older; returns how many runs were pruned.
+    """
+    db_path = db_path or (CHECKPOINT_DB if CHECKPOINTS else None)
+    if not db_path or not os.path.exists(db_path):
+        return 0
+    now = time.time() if now is None else now
+    try:
+        with closing(sqlite3.connect(db_path)) as conn, conn:
+            latest = conn.execute("SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id").fetchall()
+            stale = [(thread_id,) for thread_id, checkpoint_id in latest
+                     if (checkpoint_time(checkpoint_id) or now) < now - ttl]
+            conn.executemany("DELETE FROM checkpoints WHERE thread_id = ?", stale)
+            conn.executemany("DELETE FROM writes WHERE thread_id = ?", stale)
+    except sqlite3.Error as e:
+        print(f"Could not prune checkpoints: {e}")
+        return 0
+    if stale:
+        print(f"Checkpoints: pruned {len(stale)} abandoned run(s).")
+    return len(stale)
+
+HANDLE_PATTERN = re.compile(rb"[0-9a-f]{64}")
+
+def compact_text_store(store: Optional[TextStore] = None, db_path: Optional[str] = None,
+                       ttl: float = CHECKPOINT_TTL, now: Optional[float] = None) -> int:
+    """
+    Prunes abandoned runs (see prune_checkpoints), then drops from the text
+    store every text that no remaining checkpoint refers to, and returns
+    the bytes freed. Finished runs have deleted their checkpoints, so only
+    the texts of runs that can still be resumed are kept. Checkpoint rows
+    are searched for anything shaped like a handle, so a text is kept when
+    in doubt. Texts of runs in flight in other processes are not seen:
+    call this before serving.
+    """
+    store = store or get_text_store()
+    db_path = db_path or (CHECKPOINT_DB if CHECKPOINTS else None)
+    keep = set()
+    if db_path and os.path.exists(db_path):
+        prune_checkpoints(db_path, ttl, now)
+        try:
+            with closing(sqlite3.connect(db_path)) as conn:
+                for table, column in (("checkpoints", "checkpoint"), ("checkpoints", "metadata"), ("writes", "value")):
+                    for (blob,) in conn.execute(f"SELECT {column} FROM {table}"):
+                        if isinstance(blob, str):
+                            blob = blob.encode()
+                        keep.update(m.decode() for m in HANDLE_PATTERN.findall(blob or b""))
+        except sqlite3.Error as e:
+            print(f"Could not read checkpoints, keeping every stored text: {e}")
+            return 0
+    freed = store.compact(keep)
+    if freed:
+        print(f"Text store: freed {freed} bytes of unreferenced text.")
+    return freed
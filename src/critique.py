@@ -1,22 +1,36 @@
-from llm import get_llm
+from llm import complete, acomplete
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
 
-def critique_draft(draft_text: str) -> str:
-    """
-    Critiques the generated draft review, identifying areas for improvement.
-    """
-    llm = get_llm(temperature=0.1)
-    
+def _critique_prompt(draft_text: str):
     prompt = ChatPromptTemplate.from_messages([
         ("system", "You are a strict academic editor. Review the following draft."),
         ("user", "Draft:\n{draft}\n\nPlease provide critical feedback on clarity, coherence, and depth. List specific actionable improvements.")
     ])
-    
-    chain = prompt | llm | StrOutputParser()
-    
+    return prompt.invoke({"draft": draft_text})
+
+def _revision_prompt(draft_text: str, critique: str):
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "You are an academic writer. Revise the draft based on the feedback."),
+        ("user", "Draft:\n{draft}\n\nCritique:\n{critique}\n\nPlease rewrite the draft to address the critique while maintaining the original structure.")
+    ])
+    return prompt.invoke({"draft": draft_text, "critique": critique})
+
+def critique_draft(draft_text: str, on_partial=None) -> str:
+    """
+    Critiques the generated draft review, identifying areas for improvement.
+    on_partial, if given, receives the critique text as it streams in.
+    """
+    try:
+        return complete(_critique_prompt(draft_text), temperature=0.1, on_partial=on_partial)
+    except Exception as e:
+        return "Critique failed."
+
+async def acritique_draft(draft_text: str, on_partial=None) -> str:
+    """
+    Async version of critique_draft().
+    """
     try:
-        return chain.invoke({"draft": draft_text})
+        return await acomplete(_critique_prompt(draft_text), temperature=0.1, on_partial=on_partial)
     except Exception as e:
         return "Critique failed."
 
@@ -24,16 +38,16 @@ def revise_draft(draft_text: str, critique: str) -> str:
     """
     Revises the draft based on the provided critique.
     """
-    llm = get_llm(temperature=0.3)
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are an academic writer. Revise the draft based on the feedback."),
-        ("user", "Draft:\n{draft}\n\nCritique:\n{critique}\n\nPlease rewrite the draft to address the critique while maintaining the original structure.")
-    ])
-    
-    chain = prompt | llm | StrOutputParser()
-    
     try:
-        return chain.invoke({"draft": draft_text, "critique": critique})
+        return complete(_revision_prompt(draft_text, critique), temperature=0.3)
+    except Exception as e:
+        return draft_text # Return original if revision fails
+
+async def arevise_draft(draft_text: str, critique: str) -> str:
+    """
+    Async version of revise_draft().
+    """
+    try:
+        return await acomplete(_revision_prompt(draft_text, critique), temperature=0.3)
     except Exception as e:
         return draft_text # Return original if revision fails
@@ -0,0 +1,142 @@
+import os
+import asyncio
+import threading
+import concurrent.futures
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from serving import single_flight
+
+PER_HOST_LIMIT = int(os.getenv("DOWNLOAD_PER_HOST_LIMIT", "4"))
+TOTAL_LIMIT = int(os.getenv("DOWNLOAD_TOTAL_LIMIT", "20"))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "15"))
+DOWNLOAD_RETRIES = 3
+CHUNK_SIZE = 64 * 1024
+
+def is_valid_pdf(path: str) -> bool:
+    """
+    Cheap integrity check: PDF header at the start and an EOF marker near the end.
+    """
+    try:
+        size = os.path.getsize(path)
+        if size < 16:
+            return False
+        with open(path, 'rb') as f:
+            if not f.read(5) == b"%PDF-":
+                return False
+            f.seek(max(0, size - 2048))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+class AsyncDownloader:
+    """
+    Streams PDFs over a single pooled HTTP client.
+
+    Concurrency is capped both globally and per host. Bytes are written to
+    '<output>.part' and renamed into place only once the file verifies, so a
+    failed transfer never leaves a truncated PDF behind; the next attempt
+    resumes the .part file with an HTTP Range request.
+    """
+
+    def __init__(self, per_host_limit: int = PER_HOST_LIMIT, total_limit: int = TOTAL_LIMIT,
+                 timeout: float = DOWNLOAD_TIMEOUT, retries: int = DOWNLOAD_RETRIES):
+        self.per_host_limit = per_host_limit
+        self.total_limit = total_limit
+        self.timeout = timeout
+        self.retries = retries
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.total_limit, max_keepalive_connections=self.total_limit),
+                headers={"User-Agent": "research-paper-summarizer/1.0"},
+            )
+        return self._client
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_limits[host]
+
+    async def download(self, url: str, output_path: str) -> bool:
+        """Downloads url to output_path. Returns True if a verified PDF is in place."""
+        if is_valid_pdf(output_path):
+            print(f"Using existing {os.path.basename(output_path)}")
+            return True
+
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        part_path = f"{output_path}.part"
+        async with self._host_limit(url):
+            for attempt in range(1, self.retries + 1):
+                try:
+                    await self._fetch(url, part_path)
+                    if not is_valid_pdf(part_path):
+                        # Not resumable: the bytes we have are not a PDF
+                        os.remove(part_path)
+                        raise ValueError("response is not a complete PDF")
+                    os.replace(part_path, output_path)
+                    return True
+                except Exception as e:
+                    if attempt == self.retries:
+                        print(f"Failed to download {url}: {e}")
+                        return False
+                    await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+        return False
+
+    async def _fetch(self, url: str, part_path: str) -> None:
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        async with self.client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 416:
+                # Range past the end: the .part file already holds the whole body
+                return
+            response.raise_for_status()
+            mode = 'ab' if offset and response.status_code == 206 else 'wb'
+            with open(part_path, mode) as f:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    f.write(chunk)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# A single background event loop owns the pooled client so synchronous
+# callers (thread pools, graph nodes) share keep-alive connections.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_downloader: Optional[AsyncDownloader] = None
+_loop_lock = threading.Lock()
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _downloader
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _downloader = AsyncDownloader()
+            threading.Thread(target=_loop.run_forever, name="pdf-downloader", daemon=True).start()
+        return _loop
+
+def get_downloader() -> AsyncDownloader:
+    _get_loop()
+    return _downloader
+
+def submit_download(url: str, output_path: str) -> concurrent.futures.Future:
+    """
+    Schedules a download on the shared downloader. The returned future resolves to True on success.
+    """
+    loop = _get_loop()
+    # Concurrent sessions asking for the same file share one transfer
+    return single_flight.submit(
+        ("download", os.path.abspath(output_path)),
+        lambda: asyncio.run_coroutine_threadsafe(_downloader.download(url, output_path), loop),
+    )
@@ -1,17 +1,27 @@
 import os
-import requests
+import re
+import asyncio
 import pymupdf4llm
-from typing import Dict, Optional
+from typing import Dict, Iterable, List, Optional
+try:
+    import pymupdf
+except ImportError:  # Older PyMuPDF releases only ship the fitz module name
+    import fitz as pymupdf
+from cache import ExtractionCache, file_digest
+from download import submit_download
+from serving import single_flight
+
+# Bump the suffix when post-processing of the markdown changes so stale
+# cache entries are not served.
+EXTRACTOR_VERSION = f"pymupdf4llm-{getattr(pymupdf4llm, '__version__', getattr(pymupdf4llm, 'version', 'unknown'))}/1"
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+extraction_cache = ExtractionCache(version=EXTRACTOR_VERSION, max_bytes=EXTRACTION_CACHE_MAX_BYTES)
 
 def download_pdf(url: str, output_path: str) -> bool:
     """Downloads a PDF from a URL to the specified path."""
     try:
-        response = requests.get(url, stream=True, timeout=15)
-        response.raise_for_status()
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        return True
+        return submit_download(url, output_path).result()
     except Exception as e:
         print(f"Failed to download {url}: {e}")
         return False
@@ -26,63 +36,707 @@ def extract_text_from_pdf(pdf_path: str) -> str:
         print(f"Error extracting text from {pdf_path}: {e}")
         return ""
 
-# Placeholder for smarter segmentation if needed, 
-# though pymupdf4llm's markdown is often structure-aware.
-def segment_text(text: str) -> Dict[str, str]:
+def extract_page_range(pdf_path: str, start: int, end: int) -> str:
+    """Extracts markdown for pages [start, end) of a PDF."""
+    return pymupdf4llm.to_markdown(pdf_path, pages=list(range(start, end)))
+
+def _header_info(doc):
+    """
+    Header levels from font sizes across the whole document, so converting
+    a few pages at a time assigns the same levels as a full conversion.
+    The layout-based converter classifies headers itself and takes none.
+    """
+    if getattr(pymupdf4llm, "_use_layout", False):
+        return None
+    try:
+        return pymupdf4llm.helpers.pymupdf_rag.IdentifyHeaders(doc)
+    except Exception as e:
+        print(f"Could not scan header sizes: {e}")
+        return None
+
+def _convert_pages(doc, pages: List[int], hdr_info) -> str:
+    if hdr_info is None:
+        return pymupdf4llm.to_markdown(doc, pages=pages)
+    return pymupdf4llm.to_markdown(doc, pages=pages, hdr_info=hdr_info)
+
+def extract_pages_until(pdf_path: str, start_page: int, min_chars: int, page_timeout: Optional[float] = None) -> tuple:
+    """
+    Converts pages, starting at start_page, until at least min_chars of
+    markdown have been produced or the document ends. After the first page
+    the batch size follows the characters per page seen so far (up to
+    PAGES_PER_TASK), and each batch gets page_timeout seconds per page
+    (see run_with_deadline); a batch that overruns becomes a placeholder.
+    Returns (markdown, next_page, page_count).
+    """
+    if page_timeout is None:
+        page_timeout = PAGE_TIMEOUT
+    parts = []
+    total = 0
+    with pymupdf.open(pdf_path) as doc:
+        page_count = doc.page_count
+        hdr_info = _header_info(doc)
+        page = start_page
+        while page < page_count and total < min_chars:
+            size = 1
+            if total:
+                per_page = total / (page - start_page)
+                size = min(PAGES_PER_TASK, max(1, int((min_chars - total) / per_page) + 1))
+            pages = list(range(page, min(page + size, page_count)))
+            try:
+                md = run_with_deadline(_convert_pages, page_timeout * len(pages), doc, pages, hdr_info)
+            except ExtractionTimeout:
+                print(f"Timed out extracting pages {page + 1}-{pages[-1] + 1} of {os.path.basename(pdf_path)}")
+                md = f"\n\n<!-- pages {page + 1}-{pages[-1] + 1} {SKIPPED_PAGES_MARKER} -->\n\n"
+            parts.append(md)
+            total += len(md)
+            page = pages[-1] + 1
+    return "".join(parts), page, page_count
+
+def get_page_count(pdf_path: str) -> int:
+    """Returns the number of pages in a PDF, or 0 if it cannot be opened."""
+    try:
+        with pymupdf.open(pdf_path) as doc:
+            return doc.page_count
+    except Exception as e:
+        print(f"Error opening {pdf_path}: {e}")
+        return 0
+
+def extract_text_cached(pdf_path: str) -> str:
     """
-    Naive segmentation of markdown text into standard research sections.
-    Real-world usage might require an LLM or regex to robustly identify headers.
-    For this prototype, we'll store the full text and let the LLM analyze it directly,
-    or do simple keyword splitting.
+    Returns the markdown for a PDF, reusing a cached extraction of identical bytes if available.
     """
-    # Simply returning full text as 'Full Content' for now to allow LLM to parse structure
-    return {"Full Content": text}
+    try:
+        digest = file_digest(pdf_path)
+    except OSError as e:
+        print(f"Error reading {pdf_path}: {e}")
+        return ""
+
+    text = extraction_cache.get(digest)
+    if text is not None:
+        print(f"Cache hit for {os.path.basename(pdf_path)}")
+        return text
+
+    text = extract_text_from_pdf(pdf_path)
+    if text:
+        extraction_cache.put(digest, text)
+    return text
+
+# Downstream consumers declare how much paper text they read so extraction
+# can stop early instead of converting every page.
+CHARS_PER_TOKEN = 4
+LAZY_EXTRACTION = os.getenv("LAZY_EXTRACTION", "1") != "0"
 
+_text_budgets: Dict[str, int] = {}
+
+def register_text_budget(consumer: str, chars: Optional[int] = None, tokens: Optional[int] = None) -> None:
+    """
+    Declares how many characters (or tokens) of paper text a stage consumes.
+    Registering None for both removes the consumer's budget.
+    """
+    if chars is None and tokens is not None:
+        chars = tokens * CHARS_PER_TOKEN
+    if chars is None:
+        _text_budgets.pop(consumer, None)
+    else:
+        _text_budgets[consumer] = chars
+
+def get_text_budget(consumers: Optional[Iterable[str]] = None) -> Optional[int]:
+    """
+    Returns the largest text budget declared by consumers (default: every
+    registered consumer), or None when extraction should convert whole documents.
+    """
+    budgets = [chars for consumer, chars in _text_budgets.items() if consumers is None or consumer in consumers]
+    if not LAZY_EXTRACTION or not budgets:
+        return None
+    return max(budgets)
+
+# Section kinds recognised from header text, checked in order
+SECTION_KINDS = [
+    ("abstract", re.compile(r"^(abstract|summary)\b")),
+    ("introduction", re.compile(r"^(introduction|background|motivation)\b")),
+    ("related_work", re.compile(r"^(related work|prior work|literature review)\b")),
+    ("methods", re.compile(r"^(methods?|methodology|materials and methods|approach|proposed method|system design|experimental setup)\b")),
+    ("results", re.compile(r"^(results?|experiments?|experimental results|evaluation|findings)\b")),
+    ("discussion", re.compile(r"^(discussion|limitations)\b")),
+    ("conclusion", re.compile(r"^(conclusions?|concluding remarks|future work)\b")),
+    ("acknowledgements", re.compile(r"^acknowledge?ments?\b")),
+    ("references", re.compile(r"^(references|bibliography|works cited|literature cited)\b")),
+    ("appendix", re.compile(r"^(appendix|appendices|supplementary|supplemental)\b")),
+]
+# Never sent to the model
+BACK_MATTER = frozenset({"acknowledgements", "references", "appendix"})
+
+# pymupdf4llm headers ("## **2. Methods**"), whole-line bold headers, and
+# an inline "Abstract -" / "**Abstract.**" opening a paragraph
+_HEADER_RE = re.compile(
+    r"^(?:#{1,6}[ \t]+(?P<md>[^\n]+?)[ \t]*$"
+    r"|\*\*(?P<bold>[^*\n]{2,80})\*\*[ \t]*$"
+    r"|(?P<inline>[*_ ]*abstract[*_ ]*)[\s.:—-])",
+    re.MULTILINE | re.IGNORECASE,
+)
+_MARKUP_RE = re.compile(r"</?u>|[*_`]")
+_NUMBERING_RE = re.compile(r"^(?:[ivxlc]+|\d+(?:\.\d+)*|[a-h])[.):]?\s+")
+_SUBSECTION_RE = re.compile(r"^(?:\d+(?:\.\d+)+\.?|[a-h][.)])\s")
+
+def _header_kind(title: str) -> Optional[str]:
+    plain = _NUMBERING_RE.sub("", title.lower(), count=1)
+    for kind, pattern in SECTION_KINDS:
+        if pattern.match(plain):
+            return kind
+    return None
+
+def segment_text(text: str) -> List[Dict]:
+    """
+    Splits pymupdf4llm markdown into sections in one pass over its headers.
+    Returns [{"title", "kind", "start", "end"}, ...] with character offsets
+    into text. kind is one of SECTION_KINDS, "front" for text before the
+    first header, or "body" for headers we don't recognise. Unrecognised
+    sub-headers numbered like "2.1", "3.1.2." or "B." keep the kind of the section
+    they sit in, as does anything in back matter. (Markdown header levels
+    follow font sizes, so they say little about nesting.)
+    """
+    sections = []
+    kind = "front"
+    title = ""
+    start = 0
+    for match in _HEADER_RE.finditer(text):
+        header = _MARKUP_RE.sub("", match.group("md") or match.group("bold") or match.group("inline")).strip()
+        found = _header_kind(header)
+        if found is None:
+            if kind in BACK_MATTER:
+                continue
+            subsection = _SUBSECTION_RE.match(header) and kind not in ("front", "abstract")
+            found = kind if subsection else "body"
+        if match.start() > start:
+            sections.append({"title": title, "kind": kind, "start": start, "end": match.start()})
+        title, kind, start = header, found, match.start()
+    if len(text) > start:
+        sections.append({"title": title, "kind": kind, "start": start, "end": len(text)})
+    return sections
+
+def strip_back_matter(text: str) -> str:
+    """
+    Removes references, acknowledgements and appendices wherever they
+    appear (two-column layouts often put the conclusion after the
+    reference list).
+    """
+    sections = segment_text(text)
+    if not any(s["kind"] in BACK_MATTER for s in sections):
+        return text
+    return "".join(text[s["start"]:s["end"]] for s in sections if s["kind"] not in BACK_MATTER)
+
+import atexit
+import signal
+import threading
+import multiprocessing
 import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
 
-def process_single_paper(paper):
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+
+# Documents longer than this are split into page ranges and converted in parallel.
+LARGE_PDF_PAGES = int(os.getenv("LARGE_PDF_PAGES", "40"))
+PAGES_PER_TASK = int(os.getenv("PAGES_PER_TASK", "8"))
+PAGE_TIMEOUT = float(os.getenv("PAGE_TIMEOUT", "20"))
+# Extra seconds a conversion stuck in native code gets before its worker is killed
+WATCHDOG_GRACE = float(os.getenv("EXTRACTION_WATCHDOG_GRACE", "10"))
+SKIPPED_PAGES_MARKER = "skipped: extraction timed out"
+
+class ExtractionTimeout(Exception):
+    """Raised in a pool worker when a conversion overruns its deadline."""
+
+def _on_deadline(signum, frame):
+    raise ExtractionTimeout()
+
+def run_with_deadline(fn, seconds: Optional[float], *args):
     """
-    Helper function to process a single paper: download -> extract.
-    Returns the modified paper dictionary.
+    Runs fn(*args) with a deadline that starts when the worker picks the
+    task up, so time spent queued behind other work does not count.
+    SIGALRM interrupts the conversion between Python-level calls, which
+    frees the worker for the next task. If a single native call never
+    returns, a watchdog exits the worker process after WATCHDOG_GRACE
+    seconds; only the timed pool breaks, and _submit_to_pool retries the
+    tasks it took down. The watchdog is only armed in pool workers, never
+    in the main process.
+    """
+    if not seconds or not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        return fn(*args)
+    watchdog = None
+    if multiprocessing.parent_process() is not None:
+        watchdog = threading.Timer(seconds + WATCHDOG_GRACE, os._exit, (1,))
+        watchdog.daemon = True
+    previous = signal.signal(signal.SIGALRM, _on_deadline)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    if watchdog:
+        watchdog.start()
+    try:
+        return fn(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+        if watchdog:
+            watchdog.cancel()
+
+def _pool_context():
+    """
+    Start method for extraction workers. By the time a pool is created the
+    process runs the downloader and LLM event loop threads and holds SQLite
+    connections, and forking it could copy a lock some thread holds into
+    the child. A fork server forks from a clean, single-threaded process
+    with pymupdf already imported; spawn is the fallback where it is missing.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["pymupdf", "pymupdf4llm"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+_extraction_pools: Dict[str, concurrent.futures.ProcessPoolExecutor] = {}
+_extraction_pool_lock = threading.Lock()
+
+def get_extraction_pool(kind: str = "convert") -> concurrent.futures.ProcessPoolExecutor:
+    """
+    Returns the process-wide pool used for markdown conversion.
+    The pool is created on first use and reused across graph runs so worker
+    start-up (interpreter + pymupdf import) is only paid once. Conversions
+    under a deadline run on their own "timed" pool: a watchdog that exits
+    a stuck worker breaks that pool, never the one untimed work runs on.
+    """
+    with _extraction_pool_lock:
+        if kind not in _extraction_pools:
+            _extraction_pools[kind] = concurrent.futures.ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS,
+                                                                             mp_context=_pool_context())
+        return _extraction_pools[kind]
+
+def shutdown_extraction_pool():
+    with _extraction_pool_lock:
+        for pool in _extraction_pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _extraction_pools.clear()
+
+atexit.register(shutdown_extraction_pool)
+
+def _reset_broken_pool(kind: str, pool) -> None:
+    with _extraction_pool_lock:
+        if _extraction_pools.get(kind) is pool:
+            del _extraction_pools[kind]
+
+def _run_isolated(fn, *args):
+    """
+    Runs fn(*args) in a single-use worker, so a task that hangs again
+    after its pool broke can only take itself down.
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=_pool_context()) as executor:
+        return executor.submit(fn, *args).result()
+
+# Bounds how many single-use workers retries start at once
+_isolated_executor = concurrent.futures.ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS, thread_name_prefix="extract-retry")
+
+def _submit_to_pool(fn, *args, timed: bool = False) -> concurrent.futures.Future:
+    """
+    Submits fn(*args) to the extraction pool (the timed one for work that
+    runs under run_with_deadline). When a watchdog kills a worker, every
+    task in flight on that pool fails with BrokenProcessPool: the pool is
+    replaced and each such task is retried once in a worker of its own,
+    so the healthy ones still succeed and only the stuck one fails.
+    """
+    kind = "timed" if timed else "convert"
+    result = concurrent.futures.Future()
+    current = []
+
+    def settle(future, retry: bool):
+        if future.cancelled():
+            result.cancel()
+            return
+        exc = future.exception()
+        if isinstance(exc, BrokenProcessPool) and retry:
+            # New work goes to a fresh pool; this task gets a worker of its own
+            _reset_broken_pool(kind, pool)
+            attach(_isolated_executor.submit(_run_isolated, fn, *args), retry=False)
+            return
+        try:
+            if exc is not None:
+                result.set_exception(exc)
+            else:
+                result.set_result(future.result())
+        except concurrent.futures.InvalidStateError:
+            pass  # Cancelled by the caller meanwhile
+
+    def attach(future, retry: bool):
+        current[:] = [future]
+        future.add_done_callback(lambda f: settle(f, retry))
+
+    pool = get_extraction_pool(kind)
+    try:
+        future = pool.submit(fn, *args)
+    except (BrokenProcessPool, RuntimeError):
+        _reset_broken_pool(kind, pool)
+        pool = get_extraction_pool(kind)
+        future = pool.submit(fn, *args)
+    attach(future, retry=True)
+    result.add_done_callback(lambda r: r.cancelled() and current and current[0].cancel())
+    return result
+
+def page_ranges(page_count: int, pages_per_task: int = PAGES_PER_TASK) -> List[tuple]:
+    """Splits a document into consecutive [start, end) page ranges."""
+    step = max(1, pages_per_task)
+    return [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+def extract_text_paged(pdf_path: str, page_count: Optional[int] = None, page_timeout: float = PAGE_TIMEOUT) -> str:
+    """
+    Converts a large PDF by splitting it into page ranges that are extracted
+    concurrently on the process pool and joined back in page order.
+
+    Each range gets page_timeout seconds per page, counted from when a
+    worker starts on it (see run_with_deadline). A range that overruns
+    (e.g. a page of huge vector figures) is stopped in its worker and
+    replaced by a placeholder so it cannot stall the batch.
+    """
+    if page_count is None:
+        page_count = get_page_count(pdf_path)
+    if page_count == 0:
+        return ""
+
+    def submit(start, end):
+        return _submit_to_pool(run_with_deadline, extract_page_range, page_timeout * (end - start), pdf_path, start, end,
+                               timed=True)
+
+    ranges = page_ranges(page_count)
+    futures = [submit(start, end) for start, end in ranges]
+
+    parts = []
+    for (start, end), future in zip(ranges, futures):
+        try:
+            parts.append(future.result())
+        except (ExtractionTimeout, BrokenProcessPool):
+            # BrokenProcessPool after the retry: the range hung in native code and its watchdog fired
+            print(f"Timed out extracting pages {start + 1}-{end} of {os.path.basename(pdf_path)}")
+            parts.append(f"\n\n<!-- pages {start + 1}-{end} {SKIPPED_PAGES_MARKER} -->\n\n")
+        except Exception as e:
+            print(f"Error extracting pages {start + 1}-{end} of {os.path.basename(pdf_path)}: {e}")
+            parts.append("")
+    return "".join(parts)
+
+# Joins page-parallel extractions without blocking the caller.
+_paged_join_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="paged-extract")
+
+def submit_extraction(pdf_path: str) -> concurrent.futures.Future:
+    """
+    Schedules markdown conversion of a PDF on the extraction process pool.
+    Cache lookups and writes happen in the calling process; only the
+    CPU-bound conversion is shipped to a worker.
+    """
+    try:
+        digest = file_digest(pdf_path)
+    except OSError as e:
+        print(f"Error reading {pdf_path}: {e}")
+        digest = None
+
+    if digest:
+        text = extraction_cache.get(digest)
+        if text is not None:
+            print(f"Cache hit for {os.path.basename(pdf_path)}")
+            done = concurrent.futures.Future()
+            done.set_result(text)
+            return done
+
+    def start():
+        page_count = get_page_count(pdf_path)
+        if page_count > LARGE_PDF_PAGES:
+            print(f"Splitting {os.path.basename(pdf_path)} ({page_count} pages) into page ranges...")
+            future = _paged_join_executor.submit(extract_text_paged, pdf_path, page_count)
+        else:
+            future = _submit_to_pool(extract_text_from_pdf, pdf_path)
+
+        if digest:
+            def _store(f):
+                # Never cache a partial document; a later run may get through the slow pages.
+                if not f.cancelled() and f.exception() is None and f.result() and SKIPPED_PAGES_MARKER not in f.result():
+                    extraction_cache.put(digest, f.result())
+            future.add_done_callback(_store)
+        return future
+
+    # Sessions extracting the same bytes at the same time share one conversion
+    return single_flight.submit(("extract", digest or os.path.abspath(pdf_path)), start)
+
+# Lazy extractions that stopped before the last page are cached under this
+# suffix as "next_page page_count\n" + markdown, and resumed from next_page.
+PARTIAL_SUFFIX = ":partial"
+
+def load_partial(digest: str, cache: Optional[ExtractionCache] = None) -> Optional[tuple]:
+    """
+    Returns (markdown, next_page, page_count) cached by an earlier lazy
+    extraction of the document, or None.
+    """
+    entry = (cache or extraction_cache).get(digest + PARTIAL_SUFFIX)
+    if entry is None:
+        return None
+    header, _, text = entry.partition("\n")
+    try:
+        next_page, page_count = (int(n) for n in header.split())
+    except ValueError:
+        return None
+    return text, next_page, page_count
+
+def store_partial(digest: str, text: str, next_page: int, page_count: int) -> None:
+    """
+    Caches the result of a lazy extraction: as the full document once every
+    page is converted, as a resumable partial otherwise. Results with
+    timed-out pages are not kept; a later run may get through them.
+    """
+    if not text or SKIPPED_PAGES_MARKER in text:
+        return
+    if next_page >= page_count:
+        extraction_cache.put(digest, text)
+        return
+    cached = load_partial(digest)
+    if cached is None or cached[1] < next_page:
+        extraction_cache.put(digest + PARTIAL_SUFFIX, f"{next_page} {page_count}\n{text}")
+
+def submit_partial_extraction(pdf_path: str, min_chars: int, start_page: int = 0, prefix: str = "") -> concurrent.futures.Future:
+    """
+    Schedules page-by-page conversion that stops once min_chars are available.
+    prefix is the markdown of the pages before start_page. The future
+    resolves to (markdown, next_page, page_count), the markdown running
+    from the first page. A cached full extraction is returned as
+    (markdown, None, None); a cached partial one is returned if it is long
+    enough, and extended from its next page otherwise.
+    """
+    try:
+        digest = file_digest(pdf_path)
+    except OSError as e:
+        print(f"Error reading {pdf_path}: {e}")
+        digest = None
+
+    if digest:
+        text = extraction_cache.get(digest)
+        if text is not None:
+            print(f"Cache hit for {os.path.basename(pdf_path)}")
+            done = concurrent.futures.Future()
+            done.set_result((text, None, None))
+            return done
+        cached = load_partial(digest)
+        if cached is not None and cached[1] >= start_page and len(cached[0]) >= len(prefix):
+            text, next_page, page_count = cached
+            if len(text) >= min_chars:
+                print(f"Partial cache hit for {os.path.basename(pdf_path)} ({next_page}/{page_count} pages)")
+                done = concurrent.futures.Future()
+                done.set_result(cached)
+                return done
+            start_page, prefix = next_page, text
+
+    def start():
+        future = _submit_to_pool(extract_pages_until, pdf_path, start_page, min_chars - len(prefix), timed=True)
+        result = concurrent.futures.Future()
+
+        def _finish(f):
+            try:
+                more, next_page, page_count = f.result()
+            except Exception as e:
+                result.set_exception(e)
+                return
+            text = prefix + more
+            if digest:
+                store_partial(digest, text, next_page, page_count)
+            result.set_result((text, next_page, page_count))
+        future.add_done_callback(_finish)
+        return result
+
+    key = ("extract-pages", digest or os.path.abspath(pdf_path), start_page, min_chars)
+    return single_flight.submit(key, start)
+
+def _apply_partial_result(paper, pdf_path: str, result: tuple) -> None:
+    text, next_page, page_count = result
+    paper['pdf_path'] = pdf_path
+    paper['full_text'] = text
+    if next_page is None:
+        # Complete text came from the cache
+        paper.pop('pages_extracted', None)
+        paper.pop('page_count', None)
+    else:
+        paper['pages_extracted'] = next_page
+        paper['page_count'] = page_count
+
+def _submit_more_text(paper, min_chars: int) -> Optional[concurrent.futures.Future]:
+    """
+    Schedules conversion of further pages if the paper has fewer than
+    min_chars extracted and pages left. Returns None if nothing to do.
+    """
+    text = paper.get('full_text', '')
+    pages_extracted = paper.get('pages_extracted')
+    page_count = paper.get('page_count')
+    if len(text) >= min_chars or pages_extracted is None or page_count is None or pages_extracted >= page_count:
+        return None
+
+    pdf_path = paper.get('pdf_path')
+    if not pdf_path or not os.path.exists(pdf_path):
+        return None
+
+    print(f"Extracting more of {paper.get('title', 'Unknown')[:30]} (from page {pages_extracted + 1})...")
+    return submit_partial_extraction(pdf_path, min_chars, start_page=pages_extracted, prefix=text)
+
+def _apply_more_text(paper, result: tuple) -> str:
+    _apply_partial_result(paper, paper['pdf_path'], result)
+    return paper['full_text']
+
+def ensure_text(paper, min_chars: int) -> str:
+    """
+    Returns the paper's text, converting further pages if fewer than
+    min_chars have been extracted so far. Extraction resumes from the
+    first page not yet converted.
+    """
+    future = _submit_more_text(paper, min_chars)
+    if future is None:
+        return paper.get('full_text', '')
+    try:
+        result = future.result()
+    except Exception as e:
+        print(f"Error extracting {paper.get('title', 'Unknown')[:30]}: {e}")
+        return paper.get('full_text', '')
+    return _apply_more_text(paper, result)
+
+async def aensure_text(paper, min_chars: int) -> str:
     """
+    Async version of ensure_text().
+    """
+    future = _submit_more_text(paper, min_chars)
+    if future is None:
+        return paper.get('full_text', '')
+    try:
+        result = await asyncio.wrap_future(future)
+    except Exception as e:
+        print(f"Error extracting {paper.get('title', 'Unknown')[:30]}: {e}")
+        return paper.get('full_text', '')
+    return _apply_more_text(paper, result)
+
+def _pdf_filename(paper) -> str:
+    paper_id = paper.get('paperId') or "unknown"
+    return f"temp_pdfs/{paper_id}.pdf"
+
+def submit_pdf_path(paper) -> concurrent.futures.Future:
+    """
+    Returns a future resolving to a local path to the paper's PDF, or None
+    if no PDF is available. Online papers are fetched by the shared async
+    downloader; an already verified temp_pdfs/{paperId}.pdf is reused.
+    """
+    result = concurrent.futures.Future()
+
     # Check if it's a local file first
     if paper.get('is_local') and paper.get('pdf_path'):
         pdf_path = paper.get('pdf_path')
         if os.path.exists(pdf_path):
             print(f"Processing local file: {paper['title']}...")
-            text = extract_text_from_pdf(pdf_path)
-            paper['full_text'] = text
+            result.set_result(pdf_path)
         else:
             print(f"Error: Local file not found: {pdf_path}")
-        return paper
+            result.set_result(None)
+        return result
 
     # Online download logic
-    if paper.get('pdf_url'):
-        paper_id = paper.get('paperId') or "unknown"
-        filename = f"temp_pdfs/{paper_id}.pdf"
-        
-        # Create temp dir if not exists (thread safe check usually needed, but os.makedirs(exist_ok=True) is fine)
-        os.makedirs("temp_pdfs", exist_ok=True)
-        
-        print(f"Downloading {paper['title'][:30]}...")
-        if download_pdf(paper['pdf_url'], filename):
-            print(f"Extracting {paper['title'][:30]}...")
-            text = extract_text_from_pdf(filename)
-            paper['full_text'] = text
-        else:
-            print(f"Skipping {paper['title'][:30]} (Download failed)")
-    else:
+    if not paper.get('pdf_url'):
         print(f"Skipping {paper['title'][:30]} (No PDF URL)")
+        result.set_result(None)
+        return result
+
+    filename = _pdf_filename(paper)
+    print(f"Downloading {paper['title'][:30]}...")
+
+    def _done(f):
+        ok = not f.cancelled() and f.exception() is None and f.result()
+        if not ok:
+            print(f"Skipping {paper['title'][:30]} (Download failed)")
+        result.set_result(filename if ok else None)
+
+    submit_download(paper['pdf_url'], filename).add_done_callback(_done)
+    return result
+
+def resolve_pdf_path(paper) -> Optional[str]:
+    """
+    Returns a local path to the paper's PDF, downloading it first if needed.
+    Returns None if no PDF is available.
+    """
+    return submit_pdf_path(paper).result()
+
+def process_single_paper(paper):
+    """
+    Helper function to process a single paper: download -> extract.
+    Returns the modified paper dictionary.
+    """
+    pdf_path = resolve_pdf_path(paper)
+    if pdf_path:
+        print(f"Extracting {paper['title'][:30]}...")
+        paper['full_text'] = extract_text_cached(pdf_path)
     return paper
 
-def process_papers_concurrently(papers):
+def process_papers_concurrently(papers, char_budget: Optional[int] = None):
     """
     Downloads and extracts text for multiple papers in parallel.
+    Downloads run on the shared async downloader; each finished download is
+    handed straight to the extraction process pool so parsing overlaps the
+    remaining downloads.
+    Only char_budget characters (default: the largest registered consumer
+    budget) are converted per paper; ensure_text() extends a paper later.
+    """
+    if char_budget is None:
+        char_budget = get_text_budget()
+    extraction_futures = {}
+    pdf_paths = {}
+    download_futures = {submit_pdf_path(paper): i for i, paper in enumerate(papers)}
+    for future in concurrent.futures.as_completed(download_futures):
+        i = download_futures[future]
+        try:
+            pdf_path = future.result()
+        except Exception as e:
+            print(f"Error fetching {papers[i].get('title', 'Unknown')[:30]}: {e}")
+            continue
+        if pdf_path:
+            print(f"Extracting {papers[i]['title'][:30]}...")
+            pdf_paths[i] = pdf_path
+            if char_budget:
+                extraction_futures[i] = submit_partial_extraction(pdf_path, char_budget)
+            else:
+                extraction_futures[i] = submit_extraction(pdf_path)
+
+    for i, future in extraction_futures.items():
+        try:
+            result = future.result()
+            if char_budget:
+                _apply_partial_result(papers[i], pdf_paths[i], result)
+            else:
+                papers[i]['full_text'] = result
+        except Exception as e:
+            print(f"Error extracting {papers[i].get('title', 'Unknown')[:30]}: {e}")
+            papers[i]['full_text'] = ""
+    return papers
+
+async def aextract_paper(paper, char_budget: Optional[int] = None):
+    """
+    Downloads (if needed) and extracts a single paper without blocking the event loop.
+    The paper dict is updated in place and returned.
+    """
+    pdf_path = await asyncio.wrap_future(submit_pdf_path(paper))
+    if not pdf_path:
+        return paper
+
+    print(f"Extracting {paper['title'][:30]}...")
+    try:
+        if char_budget:
+            result = await asyncio.wrap_future(submit_partial_extraction(pdf_path, char_budget))
+            _apply_partial_result(paper, pdf_path, result)
+        else:
+            paper['full_text'] = await asyncio.wrap_future(submit_extraction(pdf_path))
+    except Exception as e:
+        print(f"Error extracting {paper.get('title', 'Unknown')[:30]}: {e}")
+        paper['full_text'] = ""
+    return paper
+
+async def aprocess_papers_concurrently(papers, char_budget: Optional[int] = None):
+    """
+    Async version of process_papers_concurrently().
     """
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        # Map the helper function to the papers
-        results = list(executor.map(process_single_paper, papers))
-    return results
+    if char_budget is None:
+        char_budget = get_text_budget()
+    return list(await asyncio.gather(*[aextract_paper(paper, char_budget) for paper in papers]))
 
 if __name__ == "__main__":
     # Test
@@ -1,7 +1,13 @@
+import asyncio
 import operator
-from typing import Annotated, List, TypedDict, Union
+import itertools
+import threading
+import concurrent.futures
+from contextlib import aclosing, asynccontextmanager
+from typing import Annotated, Iterable, Iterator, List, Optional, TypedDict, Union
 
 from langgraph.graph import StateGraph, END
+from langgraph.config import get_stream_writer
 from langchain_core.messages import BaseMessage
 
 # Import our core modules
@@ -10,16 +16,35 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from search import search_papers
-from extraction import download_pdf, extract_text_from_pdf, process_papers_concurrently
-from analysis import analyze_paper, synthesize_findings, analyze_papers_concurrently
-from writing import write_review_section, format_references
-from critique import critique_draft, revise_draft
+from providers import federated_search, afederated_search, iter_federated, aiter_federated, normalize_title
+from index import search_local, LOCAL_INDEX
+from extraction import (
+    download_pdf, extract_text_from_pdf, process_papers_concurrently,
+    aprocess_papers_concurrently, aextract_paper, get_text_budget,
+)
+from analysis import (
+    analyze_paper, synthesize_findings, analyze_papers_concurrently, analyze_papers_batched,
+    aanalyze_papers_concurrently, aanalyze_single_paper_wrapper, asynthesize_findings,
+    analyze_single_paper_wrapper, ANALYSIS_WORKERS,
+)
+from writing import write_review_section, write_sections, format_references, DEFAULT_SECTIONS
+from llm import run_async, MODEL_NAME
+from critique import critique_draft, revise_draft, acritique_draft, arevise_draft
+from summarize import (
+    MAP_REDUCE, summarize_paper, summarize_papers, synthesize_summaries,
+    asummarize_paper, asummarize_papers, asynthesize_summaries,
+)
+from pipeline import run_streaming_pipeline, QUEUE_SIZE as PIPELINE_QUEUE_SIZE
+from workspace import get_workspace, analysis_settings
+from checkpoints import get_checkpointer, open_async_checkpointer
+from papers import PaperRecord, as_record
+
+BATCH_ANALYSIS = os.getenv("BATCH_ANALYSIS", "0") == "1"
 
 class ResearchState(TypedDict):
     topic: str
     local_files: List[str] # List of file paths
-    papers: List[dict]
+    papers: List[PaperRecord] # Metadata plus a handle to the text in the shared TextStore
     analyses: List[dict]
     synthesis: str
     draft: dict
@@ -27,129 +52,544 @@ class ResearchState(TypedDict):
     final_review: str
     revision_count: int
     max_results: int
+    streaming: bool # Overlap download, extraction and analysis per paper
+    batch_analysis: bool # Pack several papers into each analysis request
+    sections: List[dict] # Review sections to write; defaults to writing.DEFAULT_SECTIONS
+    map_reduce: bool # Summarize whole papers chunk by chunk and reduce in a tree
+    workspace: str # Id of a persisted review workspace; only changed papers and reduce inputs are recomputed
+
+def _local_papers(local_files: List[str]) -> List[dict]:
+    papers = []
+    print(f"Found {len(local_files)} local files.")
+    for file_path in local_files:
+        # Create a paper object for the local file
+        file_name = os.path.basename(file_path)
+        papers.append({
+            "title": file_name, # Use filename as title initially
+            "paperId": file_name,
+            "pdf_path": file_path,
+            "is_local": True,
+            "year": "Local",
+            "authors": ["Local Upload"],
+            "url": "Local File"
+        })
+    return papers
+
+def _indexed_count(papers: List[dict]) -> int:
+    return sum(1 for p in papers if p.get('source') == "local_index")
+
+def _top_up(papers: List[dict], online: Iterable[dict], limit: int) -> Iterator[dict]:
+    """
+    Yields online results not already covered by papers, until papers
+    found in the local index plus online results reach limit. Results
+    without a PDF are skipped: there would be nothing to analyze.
+    """
+    remaining = limit - _indexed_count(papers)
+    known_ids = {p.get('paperId') for p in papers}
+    known_titles = {normalize_title(p.get('title')) for p in papers}
+    for paper in online:
+        if remaining <= 0:
+            return
+        if paper.get('paperId') in known_ids or normalize_title(paper.get('title')) in known_titles:
+            continue
+        if not paper.get('pdf_url'):
+            continue
+        remaining -= 1
+        yield paper
+
+def _with_text(papers: List[dict]) -> List[dict]:
+    """
+    Drops papers that yielded no text, so later stages and the references
+    only carry papers the review actually read. Papers with an analysis
+    stored in the workspace were read in an earlier run and are kept.
+    """
+    kept = [p for p in papers if p.get('full_text') or p.get('analysis_key')]
+    if len(kept) < len(papers):
+        print(f"Dropping {len(papers) - len(kept)} paper(s) without extractable text.")
+    return kept
+
+def _workspace(state: ResearchState):
+    """
+    Returns (workspace, analysis settings), or (None, None) without a workspace.
+    """
+    workspace = get_workspace(state.get('workspace'))
+    if workspace is None:
+        return None, None
+    return workspace, analysis_settings(state.get('topic'), state.get('map_reduce', MAP_REDUCE))
+
+def _text_budget(state: ResearchState) -> Optional[int]:
+    """
+    Characters to extract per paper up front: what the stage this run
+    analyzes with reads, map-reduce summaries or topic analyses.
+    """
+    return get_text_budget(["summary"] if state.get('map_reduce', MAP_REDUCE) else ["analysis"])
+
+def _failed(output) -> bool:
+    # Error placeholders are returned, but never stored for reuse
+    if isinstance(output, dict):
+        return any(_failed(v) for v in output.values())
+    return not output or output.startswith("Error") or output == "Critique failed."
+
+def _memoized(workspace, step: str, inputs, compute):
+    """
+    Returns the workspace's output of step for inputs, or compute() stored for next time.
+    """
+    if workspace is not None:
+        output = workspace.recall(step, inputs)
+        if output is not None:
+            return output
+    output = compute()
+    if workspace is not None and not _failed(output):
+        workspace.remember(step, inputs, output)
+    return output
+
+async def _amemoized(workspace, step: str, inputs, compute):
+    """
+    Async version of _memoized(); compute() returns an awaitable.
+    """
+    if workspace is not None:
+        output = await asyncio.to_thread(workspace.recall, step, inputs)
+        if output is not None:
+            return output
+    output = await compute()
+    if workspace is not None and not _failed(output):
+        await asyncio.to_thread(workspace.remember, step, inputs, output)
+    return output
 
 def search_node(state: ResearchState):
     print("--- SEARCHING / LOADING PAPERS ---")
     topic = state.get('topic')
     local_files = state.get('local_files', [])
+    limit = state.get('max_results', 3)
     papers = []
 
     # 1. Process Local Files
     if local_files:
-        print(f"Found {len(local_files)} local files.")
-        for file_path in local_files:
-            # Create a paper object for the local file
-            file_name = os.path.basename(file_path)
-            papers.append({
-                "title": file_name, # Use filename as title initially
-                "paperId": file_name,
-                "pdf_path": file_path,
-                "is_local": True,
-                "year": "Local",
-                "authors": ["Local Upload"],
-                "url": "Local File"
-            })
-
-    # 2. Online Search (if topic provided)
-    if topic:
+        papers.extend(_local_papers(local_files))
+
+    # 2. Previously processed PDFs that match the topic
+    if topic and LOCAL_INDEX:
+        papers.extend(search_local(topic, limit, exclude=local_files))
+
+    # 3. Online Search (if topic provided) tops up what the local index didn't cover
+    if topic and state.get('streaming'):
+        # pipeline_node pages through the results itself so extraction starts with the first page
+        print(f"Deferring search for '{topic}' to the streaming pipeline.")
+    elif topic and _indexed_count(papers) >= limit:
+        print(f"Local index covered all {limit} results for '{topic}'; skipping online search.")
+    elif topic:
         print(f"Searching for topic: {topic}")
-        # Adjust limit based on how many local files we have? 
-        # For now, let's keep search independent but maybe reduce if we have many local files.
-        limit = state.get('max_results', 3)
-        online_papers = search_papers(topic, limit=limit)
-        papers.extend(online_papers)
+        # Fan out to every configured source; slow ones are skipped after their timeout
+        online_papers = federated_search(topic, limit=limit)
+        papers.extend(list(_top_up(papers, online_papers, limit)))
+    else:
+        print("No topic provided. Skipping online search.")
+
+    return {"papers": [as_record(p) for p in papers]}
+
+async def asearch_node(state: ResearchState):
+    print("--- SEARCHING / LOADING PAPERS ---")
+    topic = state.get('topic')
+    local_files = state.get('local_files', [])
+    limit = state.get('max_results', 3)
+    papers = []
+
+    if local_files:
+        papers.extend(_local_papers(local_files))
+
+    if topic and LOCAL_INDEX:
+        # Index lookups read files; keep them off the event loop
+        papers.extend(await asyncio.to_thread(search_local, topic, limit, local_files))
+
+    if topic and state.get('streaming'):
+        print(f"Deferring search for '{topic}' to the streaming pipeline.")
+    elif topic and _indexed_count(papers) >= limit:
+        print(f"Local index covered all {limit} results for '{topic}'; skipping online search.")
+    elif topic:
+        print(f"Searching for topic: {topic}")
+        online_papers = await afederated_search(topic, limit=limit)
+        papers.extend(list(_top_up(papers, online_papers, limit)))
     else:
         print("No topic provided. Skipping online search.")
 
-    return {"papers": papers}
+    return {"papers": [as_record(p) for p in papers]}
 
 def extraction_node(state: ResearchState):
     print("--- EXTRACTING TEXT (PARALLEL) ---")
     papers = state.get('papers', [])
+    workspace, settings = _workspace(state)
     
-    # Limit to first 3 papers only for speed
-    papers = papers[:3]
-    
+    if workspace is not None:
+        # Papers analyzed in an earlier run need no text
+        known = [p for p in papers if workspace.lookup(p, settings)]
+        print(f"Workspace: {len(known)} of {len(papers)} papers already analyzed.")
+        process_papers_concurrently([p for p in papers if not p.get('analysis_key')], _text_budget(state))
+        return {"papers": _with_text(papers)}
+
     # Use concurrent processing
-    extracted_papers = process_papers_concurrently(papers)
+    extracted_papers = process_papers_concurrently(papers, _text_budget(state))
             
-    return {"papers": extracted_papers}
+    return {"papers": _with_text(extracted_papers)}
+
+async def aextraction_node(state: ResearchState):
+    print("--- EXTRACTING TEXT (ASYNC) ---")
+    papers = state.get('papers', [])
+    workspace, settings = _workspace(state)
+    if workspace is not None:
+        # Hashing PDFs reads files; keep it off the event loop
+        known = await asyncio.to_thread(lambda: [p for p in papers if workspace.lookup(p, settings)])
+        print(f"Workspace: {len(known)} of {len(papers)} papers already analyzed.")
+        await aprocess_papers_concurrently([p for p in papers if not p.get('analysis_key')], _text_budget(state))
+        return {"papers": _with_text(papers)}
+    return {"papers": _with_text(await aprocess_papers_concurrently(papers, _text_budget(state)))}
+
+def _synthesize(workspace, settings, analyses: List[dict], map_reduce: bool, papers: List[dict] = ()) -> str:
+    if map_reduce:
+        compute = lambda: synthesize_summaries(analyses)
+    else:
+        # Stored analyses keep their synthesis groups across runs
+        compute = lambda: synthesize_findings(analyses, workspace.groups_for(papers) if workspace is not None else None)
+    return _memoized(workspace, "synthesis", [settings, analyses], compute)
+
+async def _asynthesize(workspace, settings, analyses: List[dict], map_reduce: bool, papers: List[dict] = ()) -> str:
+    async def compute():
+        if map_reduce:
+            return await asynthesize_summaries(analyses)
+        groups = await asyncio.to_thread(workspace.groups_for, papers) if workspace is not None else None
+        return await asynthesize_findings(analyses, groups)
+    return await _amemoized(workspace, "synthesis", [settings, analyses], compute)
 
 def analysis_node(state: ResearchState):
     print("--- ANALYZING PAPERS (PARALLEL) ---")
     papers = state.get('papers', [])
+    workspace, settings = _workspace(state)
     
-    # Use concurrent analysis
-    analyses = analyze_papers_concurrently(papers)
+    if workspace is not None:
+        # Paper by paper, so each analysis can be stored and reused on its own
+        topic = state.get('topic')
+        map_reduce = state.get('map_reduce', MAP_REDUCE)
+        analyze_fn = summarize_paper if map_reduce else analyze_single_paper_wrapper
+        if papers:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(papers), ANALYSIS_WORKERS)) as executor:
+                list(executor.map(lambda paper: workspace.analyze_one(paper, settings, lambda p: analyze_fn(p, topic)), papers))
+        workspace.prune()
+        analyses = workspace.analyses_for(papers)
+        return {"analyses": analyses, "synthesis": _synthesize(workspace, settings, analyses, map_reduce, papers)}
+
+    if state.get('map_reduce', MAP_REDUCE):
+        # Whole papers, summarized chunk by chunk and reduced in a tree
+        analyses = summarize_papers(papers, state.get('topic'))
+        return {"analyses": analyses, "synthesis": synthesize_summaries(analyses)}
+
+    if state.get('batch_analysis', BATCH_ANALYSIS):
+        analyses = analyze_papers_batched(papers, topic=state.get('topic'))
+    else:
+        # Use concurrent analysis
+        analyses = analyze_papers_concurrently(papers, state.get('topic'))
             
     # Synthesize
     synthesis = synthesize_findings(analyses)
     return {"analyses": analyses, "synthesis": synthesis}
 
-def writing_node(state: ResearchState):
-    print("--- WRITING DRAFT ---")
-    synthesis = state.get('synthesis')
-    papers = state.get('papers')
+async def aanalysis_node(state: ResearchState):
+    print("--- ANALYZING PAPERS (ASYNC) ---")
+    papers = state.get('papers', [])
+    workspace, settings = _workspace(state)
+    
+    if workspace is not None:
+        topic = state.get('topic')
+        map_reduce = state.get('map_reduce', MAP_REDUCE)
+        analyze_fn = asummarize_paper if map_reduce else aanalyze_single_paper_wrapper
+        await asyncio.gather(*[workspace.aanalyze_one(paper, settings, lambda p: analyze_fn(p, topic)) for paper in papers])
+        await asyncio.to_thread(workspace.prune)
+        analyses = await asyncio.to_thread(workspace.analyses_for, papers)
+        return {"analyses": analyses, "synthesis": await _asynthesize(workspace, settings, analyses, map_reduce, papers)}
+
+    if state.get('map_reduce', MAP_REDUCE):
+        analyses = await asummarize_papers(papers, state.get('topic'))
+        return {"analyses": analyses, "synthesis": await asynthesize_summaries(analyses)}
+
+    if state.get('batch_analysis', BATCH_ANALYSIS):
+        # Batched mode has no async variant; keep it off the event loop
+        analyses = await asyncio.to_thread(analyze_papers_batched, papers, topic=state.get('topic'))
+    else:
+        analyses = await aanalyze_papers_concurrently(papers, state.get('topic'))
     
-    abstract = write_review_section("Abstract", synthesis)
-    methods = write_review_section("Methodology Comparison", synthesis)
-    results = write_review_section("Results Synthesis", synthesis)
+    synthesis = await asynthesize_findings(analyses)
+    return {"analyses": analyses, "synthesis": synthesis}
+
+def pipeline_node(state: ResearchState):
+    print("--- STREAMING DOWNLOAD / EXTRACT / ANALYZE ---")
+    papers = state.get('papers', [])
+    topic = state.get('topic')
+    if topic:
+        # Results arrive as each source pages them in; the first papers download while later ones load
+        limit = state.get('max_results', 3)
+        papers = itertools.chain(papers, map(as_record, _top_up(papers, iter_federated(topic, limit), limit)))
+    map_reduce = state.get('map_reduce', MAP_REDUCE)
+    analyze_fn = summarize_paper if map_reduce else analyze_single_paper_wrapper
+    workspace, settings = _workspace(state)
+    
+    if workspace is not None:
+        known = []
+        def unanalyzed(papers):
+            # Papers analyzed in an earlier run skip download, extraction and analysis
+            for paper in papers:
+                if workspace.lookup(paper, settings):
+                    known.append(paper)
+                else:
+                    yield paper
+        papers, _ = run_streaming_pipeline(
+            unanalyzed(papers), char_budget=_text_budget(state), topic=topic,
+            analyze_fn=lambda paper, topic: workspace.analyze_one(paper, settings, lambda p: analyze_fn(p, topic))
+        )
+        papers = known + papers
+        workspace.prune()
+        analyses = workspace.analyses_for(papers)
+    else:
+        papers, analyses = run_streaming_pipeline(papers, char_budget=_text_budget(state), topic=topic,
+                                                   analyze_fn=analyze_fn)
+    synthesis = _synthesize(workspace, settings, analyses, map_reduce, papers)
+    return {"papers": _with_text(papers), "analyses": analyses, "synthesis": synthesis}
+
+async def apipeline_node(state: ResearchState):
+    print("--- STREAMING DOWNLOAD / EXTRACT / ANALYZE (ASYNC) ---")
+    local_papers = state.get('papers', [])
+    topic = state.get('topic')
+    map_reduce = state.get('map_reduce', MAP_REDUCE)
+    workspace, settings = _workspace(state)
+    char_budget = _text_budget(state)
+    # Bounds how many papers are between download and analysis at once
+    in_flight = asyncio.Semaphore(PIPELINE_QUEUE_SIZE)
+
+    async def analyze(paper):
+        await aextract_paper(paper, char_budget)
+        if map_reduce:
+            return await asummarize_paper(paper, topic)
+        return await aanalyze_single_paper_wrapper(paper, topic)
+
+    async def run(paper):
+        async with in_flight:
+            if workspace is None:
+                return await analyze(paper)
+            if await asyncio.to_thread(workspace.lookup, paper, settings):
+                return None  # Analyzed in an earlier run; analyses_for() picks it up
+            result = await analyze(paper)
+            await asyncio.to_thread(workspace.store, paper, settings, result)
+            return result
+
+    async def all_papers():
+        for paper in local_papers:
+            yield paper
+        if not topic:
+            return
+        limit = state.get('max_results', 3)
+        remaining = limit - _indexed_count(local_papers)
+        known_ids = {p.get('paperId') for p in local_papers}
+        known_titles = {normalize_title(p.get('title')) for p in local_papers}
+        # Closing the search on an early return cancels the providers still running
+        async with aclosing(aiter_federated(topic, limit)) as online:
+            async for paper in online:
+                if remaining <= 0:
+                    return
+                if paper.get('paperId') in known_ids or normalize_title(paper.get('title')) in known_titles:
+                    continue
+                if not paper.get('pdf_url'):
+                    continue
+                remaining -= 1
+                yield as_record(paper)
+
+    papers = []
+    tasks = []
+    async for paper in all_papers():
+        papers.append(paper)
+        tasks.append(asyncio.create_task(run(paper)))
+
+    results = await asyncio.gather(*tasks)
+    if workspace is not None:
+        await asyncio.to_thread(workspace.prune)
+        analyses = await asyncio.to_thread(workspace.analyses_for, papers)
+    else:
+        analyses = [r for r in results if r]
+    synthesis = await _asynthesize(workspace, settings, analyses, map_reduce, papers)
+    return {"papers": _with_text(papers), "analyses": analyses, "synthesis": synthesis}
+
+def section_streamer(section: str):
+    """
+    Returns a callback that forwards partial section text to the graph's
+    custom stream (a no-op unless the caller streams with mode "custom").
+    """
+    writer = get_stream_writer()
+    return lambda text: writer({"section": section, "text": text})
+
+def _compose_draft(sections: dict, papers: List[dict]) -> dict:
     refs = format_references(papers)
     
-    draft = {
-        "Abstract": abstract,
-        "Methodology": methods,
-        "Results": results,
-        "References": refs
-    }
+    draft = dict(sections)
+    draft["References"] = refs
     
-    full_text = f"# Systematic Review\n\n## Abstract\n{abstract}\n\n## Methodology\n{methods}\n\n## Results\n{results}\n\n## References\n{refs}"
+    full_text = "# Systematic Review\n\n"
+    for name, text in sections.items():
+        full_text += f"## {name}\n{text}\n\n"
+    full_text += f"## References\n{refs}"
     
     return {"draft": draft, "final_review": full_text}
 
+def writing_node(state: ResearchState):
+    print("--- WRITING DRAFT ---")
+    synthesis = state.get('synthesis')
+    papers = state.get('papers')
+    specs = state.get('sections') or DEFAULT_SECTIONS
+    workspace = get_workspace(state.get('workspace'))
+    
+    # Independent sections are written concurrently on the shared async client
+    writer = get_stream_writer()
+    sections = _memoized(workspace, "write", [MODEL_NAME, synthesis, specs], lambda: run_async(write_sections(
+        synthesis,
+        specs,
+        on_partial=lambda name, text: writer({"section": name, "text": text})
+    )))
+    for name, text in sections.items():
+        writer({"section": name, "text": text})
+    return _compose_draft(sections, papers)
+
+async def awriting_node(state: ResearchState):
+    print("--- WRITING DRAFT ---")
+    synthesis = state.get('synthesis')
+    specs = state.get('sections') or DEFAULT_SECTIONS
+    workspace = get_workspace(state.get('workspace'))
+    writer = get_stream_writer()
+    sections = await _amemoized(workspace, "write", [MODEL_NAME, synthesis, specs], lambda: write_sections(
+        synthesis,
+        specs,
+        on_partial=lambda name, text: writer({"section": name, "text": text})
+    ))
+    for name, text in sections.items():
+        writer({"section": name, "text": text})
+    return _compose_draft(sections, state.get('papers'))
+
 def critique_node(state: ResearchState):
     print("--- CRITIQUING ---")
     current_text = state.get('final_review')
-    critique = critique_draft(current_text)
+    stream = section_streamer("Critique")
+    critique = _memoized(get_workspace(state.get('workspace')), "critique", [MODEL_NAME, current_text],
+                         lambda: critique_draft(current_text, on_partial=stream))
+    stream(critique)
+    return {"critique": critique, "revision_count": state.get('revision_count', 0) + 1}
+
+async def acritique_node(state: ResearchState):
+    print("--- CRITIQUING ---")
+    current_text = state.get('final_review')
+    stream = section_streamer("Critique")
+    critique = await _amemoized(get_workspace(state.get('workspace')), "critique", [MODEL_NAME, current_text],
+                                lambda: acritique_draft(current_text, on_partial=stream))
+    stream(critique)
     return {"critique": critique, "revision_count": state.get('revision_count', 0) + 1}
 
 def revision_node(state: ResearchState):
     print("--- REVISING ---")
     current_text = state.get('final_review')
     critique = state.get('critique')
-    revised = revise_draft(current_text, critique)
+    revised = _memoized(get_workspace(state.get('workspace')), "revise", [MODEL_NAME, current_text, critique],
+                        lambda: revise_draft(current_text, critique))
+    return {"final_review": revised}
+
+async def arevision_node(state: ResearchState):
+    print("--- REVISING ---")
+    current_text = state.get('final_review')
+    critique = state.get('critique')
+    revised = await _amemoized(get_workspace(state.get('workspace')), "revise", [MODEL_NAME, current_text, critique],
+                               lambda: arevise_draft(current_text, critique))
     return {"final_review": revised}
 
+def route_after_search(state: ResearchState):
+    return "pipeline" if state.get('streaming') else "extract"
+
 def should_continue(state: ResearchState):
     # Skip revision for speed - just end
     return "end"
 
+def build_graph(nodes: dict, checkpointer=None):
+    """
+    Wires the research workflow from a {name: node function} mapping.
+    Used for both the synchronous and the asyncio node sets. With a
+    checkpointer, state is saved after every node under the run's
+    thread_id, and invoking with None input resumes a failed run.
+    """
+    workflow = StateGraph(ResearchState)
+
+    for name, node in nodes.items():
+        workflow.add_node(name, node)
+
+    workflow.set_entry_point("search")
+
+    workflow.add_conditional_edges(
+        "search",
+        route_after_search,
+        {
+            "extract": "extract",
+            "pipeline": "pipeline"
+        }
+    )
+    workflow.add_edge("extract", "analyze")
+    workflow.add_edge("analyze", "write")
+    workflow.add_edge("pipeline", "write")
+    workflow.add_edge("write", "critique")
+
+    workflow.add_conditional_edges(
+        "critique",
+        should_continue,
+        {
+            "revise": "revise",
+            "end": END
+        }
+    )
+
+    workflow.add_edge("revise", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+SYNC_NODES = {
+    "search": search_node,
+    "extract": extraction_node,
+    "analyze": analysis_node,
+    "pipeline": pipeline_node,
+    "write": writing_node,
+    "critique": critique_node,
+    "revise": revision_node,
+}
+
+# Native asyncio variant, driven with astream()/ainvoke(): no thread per blocking call
+ASYNC_NODES = {
+    "search": asearch_node,
+    "extract": aextraction_node,
+    "analyze": aanalysis_node,
+    "pipeline": apipeline_node,
+    "write": awriting_node,
+    "critique": acritique_node,
+    "revise": arevision_node,
+}
+
 # Build Graph
-workflow = StateGraph(ResearchState)
-
-workflow.add_node("search", search_node)
-workflow.add_node("extract", extraction_node)
-workflow.add_node("analyze", analysis_node)
-workflow.add_node("write", writing_node)
-workflow.add_node("critique", critique_node)
-workflow.add_node("revise", revision_node)
-
-workflow.set_entry_point("search")
-
-workflow.add_edge("search", "extract")
-workflow.add_edge("extract", "analyze")
-workflow.add_edge("analyze", "write")
-workflow.add_edge("write", "critique")
-
-workflow.add_conditional_edges(
-    "critique",
-    should_continue,
-    {
-        "revise": "revise",
-        "end": END
-    }
-)
+app_graph = build_graph(SYNC_NODES)
+async_app_graph = build_graph(ASYNC_NODES)
+
+_checkpointed_graph = None
+_checkpointed_graph_lock = threading.Lock()
 
-workflow.add_edge("revise", END)
+def checkpointed_app_graph():
+    """
+    app_graph with SQLite checkpoints; run it with checkpoints.run_config(run_id).
+    """
+    global _checkpointed_graph
+    with _checkpointed_graph_lock:
+        if _checkpointed_graph is None:
+            _checkpointed_graph = build_graph(SYNC_NODES, get_checkpointer())
+        return _checkpointed_graph
 
-app_graph = workflow.compile()
+@asynccontextmanager
+async def acheckpointed_app_graph():
+    """
+    Yields async_app_graph with SQLite checkpoints for the duration of one run.
+    """
+    async with open_async_checkpointer() as checkpointer:
+        yield build_graph(ASYNC_NODES, checkpointer)
@@ -0,0 +1,390 @@
+import os
+import re
+import json
+import math
+import time
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cache import CACHE_ROOT, ExtractionCache, file_digest
+from extraction import extraction_cache, extract_text_cached, load_partial
+from search import get_client, _parse_paper
+
+PDF_DIR = "temp_pdfs"
+INDEX_DIR = os.path.join(CACHE_ROOT, "index")
+INDEX_VERSION = 1
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were with we our
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+def _encode_varint(value: int, out: bytearray) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _decode_postings(data: bytes) -> List[Tuple[int, int]]:
+    """
+    Decodes a postings list of (doc id delta, term frequency) varint pairs
+    into [(doc_id, tf), ...].
+    """
+    postings = []
+    doc_id = 0
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value)
+        value = shift = 0
+        if len(values) == 2:
+            doc_id += values[0]
+            postings.append((doc_id, values[1]))
+            values = []
+    return postings
+
+def _title_from_markdown(text: str, fallback: str) -> str:
+    for line in text.splitlines():
+        line = line.strip().lstrip("#").strip().strip("*_").strip()
+        if len(line) > 8:
+            return line[:200]
+    return fallback
+
+class LocalIndex:
+    """
+    BM25 inverted index over the PDFs in temp_pdfs/.
+
+    Documents come from the extraction cache, so indexing costs no PDF
+    parsing unless asked to. Each term's postings are stored as varint
+    (doc id delta, term frequency) pairs; doc ids only grow, so new
+    documents are appended without re-encoding. Files are tracked by
+    size and mtime so refresh() only digests what changed. Removed or
+    replaced files leave a tombstone until the index is compacted.
+    """
+
+    def __init__(self, directory: str = INDEX_DIR, pdf_dir: str = PDF_DIR, cache: Optional[ExtractionCache] = None):
+        self.directory = directory
+        self.pdf_dir = pdf_dir
+        self.cache = cache or extraction_cache
+        self._lock = threading.Lock()
+        self.docs: List[Dict] = []  # doc id -> metadata; None once deleted
+        self.files: Dict[str, List] = {}  # path -> [size, mtime, doc id or None, digest, indexed from partial text]
+        self.postings: Dict[str, bytearray] = {}
+        self._last_doc: Dict[str, int] = {}  # term -> last doc id in its postings
+        self._df: Dict[str, int] = {}
+        self.total_length = 0
+        self._refreshed: Optional[Tuple[float, Optional[float]]] = None  # (monotonic time, pdf_dir mtime)
+        self._load()
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "index.json")
+
+    @property
+    def _postings_path(self) -> str:
+        return os.path.join(self.directory, "postings.bin")
+
+    @property
+    def live_docs(self) -> int:
+        return sum(1 for d in self.docs if d is not None)
+
+    # --- persistence ---------------------------------------------------
+
+    def _load(self) -> None:
+        try:
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            if meta.get("version") != INDEX_VERSION:
+                return
+            with open(self._postings_path, 'rb') as f:
+                blob = f.read()
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Rebuilding unreadable local index: {e}")
+            return
+
+        self.docs = meta["docs"]
+        self.files = meta["files"]
+        self.total_length = meta["total_length"]
+        for term, (offset, size, df, last_doc) in meta["terms"].items():
+            self.postings[term] = bytearray(blob[offset:offset + size])
+            self._df[term] = df
+            self._last_doc[term] = last_doc
+
+    def save(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        blob = bytearray()
+        terms = {}
+        for term, data in self.postings.items():
+            terms[term] = [len(blob), len(data), self._df[term], self._last_doc[term]]
+            blob.extend(data)
+
+        for path, payload, mode in ((self._postings_path, bytes(blob), 'wb'),
+                                    (self._meta_path, json.dumps({
+                                        "version": INDEX_VERSION, "docs": self.docs, "files": self.files,
+                                        "total_length": self.total_length, "terms": terms,
+                                    }), 'w')):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, mode) as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+
+    # --- building ------------------------------------------------------
+
+    def _add(self, text: str, meta: Dict) -> int:
+        doc_id = len(self.docs)
+        counts = Counter(tokenize(text))
+        meta["length"] = sum(counts.values())
+        self.docs.append(meta)
+        self.total_length += meta["length"]
+        for term, tf in counts.items():
+            data = self.postings.setdefault(term, bytearray())
+            _encode_varint(doc_id - self._last_doc.get(term, 0), data)
+            _encode_varint(tf, data)
+            self._last_doc[term] = doc_id
+            self._df[term] = self._df.get(term, 0) + 1
+        return doc_id
+
+    def _remove(self, doc_ids: Iterable[int]) -> None:
+        """
+        Tombstones documents and takes them out of the document frequencies
+        in one pass over the postings (only terms whose postings reach the
+        removed ids are decoded). Postings keep pointing at the tombstones,
+        which search skips, until compact().
+        """
+        removed = {d for d in doc_ids if self.docs[d] is not None}
+        if not removed:
+            return
+        for doc_id in removed:
+            self.total_length -= self.docs[doc_id]["length"]
+            self.docs[doc_id] = None
+        first = min(removed)
+        for term, data in self.postings.items():
+            if self._last_doc[term] < first:
+                continue
+            hits = sum(1 for d, _ in _decode_postings(data) if d in removed)
+            if hits:
+                self._df[term] -= hits
+
+    def compact(self) -> None:
+        """
+        Rewrites the postings without deleted documents, renumbering doc ids.
+        """
+        remap = {}
+        docs = []
+        for doc_id, meta in enumerate(self.docs):
+            if meta is not None:
+                remap[doc_id] = len(docs)
+                docs.append(meta)
+
+        postings, last_doc, df = {}, {}, {}
+        for term, data in self.postings.items():
+            kept = [(remap[d], tf) for d, tf in _decode_postings(data) if d in remap]
+            if not kept:
+                continue
+            out = bytearray()
+            prev = 0
+            for d, tf in kept:
+                _encode_varint(d - prev, out)
+                _encode_varint(tf, out)
+                prev = d
+            postings[term], last_doc[term], df[term] = out, prev, len(kept)
+
+        self.docs, self.postings, self._last_doc, self._df = docs, postings, last_doc, df
+        for entry in self.files.values():
+            if entry[2] is not None:
+                entry[2] = remap.get(entry[2])
+
+    def refresh(self, extract_missing: bool = False) -> int:
+        """
+        Brings the index up to date with pdf_dir. PDFs without a cached
+        extraction are indexed from the pages a lazy extraction has cached
+        so far, or skipped (and retried next time) unless extract_missing
+        is set. Returns the number of documents added.
+        """
+        with self._lock:
+            dir_mtime = self._dir_mtime()
+            try:
+                names = sorted(n for n in os.listdir(self.pdf_dir) if n.lower().endswith(".pdf"))
+            except FileNotFoundError:
+                names = []
+            paths = {os.path.join(self.pdf_dir, n) for n in names}
+
+            changed = False
+            removed = []
+            for path in list(self.files):
+                if path not in paths:
+                    doc_id = self.files.pop(path)[2]
+                    if doc_id is not None:
+                        removed.append(doc_id)
+                    changed = True
+
+            added = 0
+            for path in sorted(paths):
+                stat = os.stat(path)
+                entry = self.files.get(path)
+                unchanged = entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime
+                # Indexed from a partial extraction: replaced once the full text is cached
+                was_partial = unchanged and entry[2] is not None and len(entry) > 4 and entry[4]
+                if unchanged and entry[2] is not None and not was_partial:
+                    continue
+                if entry and entry[2] is not None and not was_partial:
+                    removed.append(entry[2])
+                    changed = True
+
+                digest = entry[3] if unchanged else file_digest(path)
+                text = self.cache.get(digest)
+                if text is None and extract_missing:
+                    text = extract_text_cached(path)
+                partial = False
+                if not text and not was_partial:
+                    cached = load_partial(digest, self.cache)
+                    if cached is not None:
+                        text, partial = cached[0], True
+                if not text:
+                    if not unchanged:
+                        self.files[path] = [stat.st_size, stat.st_mtime, None, digest]
+                        changed = True
+                    continue
+                if was_partial:
+                    removed.append(entry[2])
+
+                stem = os.path.splitext(os.path.basename(path))[0]
+                doc_id = self._add(text, {"path": path, "paperId": stem, "digest": digest,
+                                          "title": _title_from_markdown(text, stem)})
+                self.files[path] = [stat.st_size, stat.st_mtime, doc_id, digest, partial]
+                added += 1
+                changed = True
+
+            self._remove(removed)
+            if len(self.docs) > 2 * max(1, self.live_docs):
+                self.compact()
+            if changed:
+                self.save()
+            self._refreshed = (time.monotonic(), dir_mtime)
+            return added
+
+    def _dir_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.pdf_dir).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def refresh_if_stale(self, max_age: float) -> int:
+        """
+        Runs refresh() if files were added to or removed from pdf_dir since
+        the last one, or it is more than max_age seconds old (to pick up
+        extractions cached in the meantime). Returns the number of documents added.
+        """
+        refreshed = self._refreshed
+        if refreshed and time.monotonic() - refreshed[0] < max_age and refreshed[1] == self._dir_mtime():
+            return 0
+        return self.refresh()
+
+    # --- querying ------------------------------------------------------
+
+    def search(self, query: str, limit: int = 10, min_match: float = 0.5) -> List[Tuple[float, Dict]]:
+        """
+        Returns up to limit (score, document) pairs ranked by BM25. A
+        document must contain at least min_match of the distinct query
+        terms, so one common word can't pull in unrelated papers.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n = self.live_docs
+            if not terms or not n:
+                return []
+            avg_length = self.total_length / n
+            scores: Dict[int, float] = {}
+            matched: Counter = Counter()
+            for term in terms:
+                data = self.postings.get(term)
+                if not data:
+                    continue
+                df = self._df[term]
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for doc_id, tf in _decode_postings(data):
+                    meta = self.docs[doc_id]
+                    if meta is None:
+                        continue
+                    norm = K1 * (1 - B + B * meta["length"] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+                    matched[doc_id] += 1
+
+            needed = math.ceil(min_match * len(terms))
+            ranked = sorted((s, d) for d, s in scores.items() if matched[d] >= needed)
+            return [(score, dict(self.docs[doc_id])) for score, doc_id in reversed(ranked[-limit:])] if limit > 0 else []
+
+LOCAL_INDEX = os.getenv("LOCAL_INDEX", "1") != "0"
+# Fraction of the topic's terms a local paper must contain to stand in for an online result
+LOCAL_INDEX_MIN_MATCH = float(os.getenv("LOCAL_INDEX_MIN_MATCH", "1.0"))
+# Seconds a refresh stays current for queries while pdf_dir itself is unchanged
+LOCAL_INDEX_REFRESH_INTERVAL = float(os.getenv("LOCAL_INDEX_REFRESH_INTERVAL", "60"))
+
+_index: Optional[LocalIndex] = None
+_index_lock = threading.Lock()
+
+def get_local_index() -> LocalIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LocalIndex()
+        return _index
+
+def search_local(topic: str, limit: int, exclude: Iterable[str] = ()) -> List[Dict]:
+    """
+    Returns paper dicts for indexed PDFs matching topic, best first.
+    Metadata comes from the Semantic Scholar cache when the file is named
+    after a known paperId; nothing here touches the network.
+    """
+    index = get_local_index()
+    try:
+        index.refresh_if_stale(LOCAL_INDEX_REFRESH_INTERVAL)
+    except Exception as e:
+        print(f"Local index refresh failed: {e}")
+    excluded = {os.path.abspath(p) for p in exclude}
+    hits = [doc for _, doc in index.search(topic, limit + len(excluded), LOCAL_INDEX_MIN_MATCH)
+            if os.path.abspath(doc["path"]) not in excluded][:limit]
+    if not hits:
+        return []
+
+    known = {}
+    try:
+        for item in get_client().get_papers([doc["paperId"] for doc in hits], offline=True):
+            known[item["paperId"]] = _parse_paper(item)
+    except Exception as e:
+        print(f"Could not load cached metadata for local hits: {e}")
+
+    papers = []
+    for doc in hits:
+        paper = known.get(doc["paperId"]) or {
+            "title": doc["title"],
+            "paperId": doc["paperId"],
+            "year": "Local",
+            "authors": [],
+            "url": "Local Index",
+        }
+        paper.update({"pdf_path": doc["path"], "is_local": True, "source": "local_index"})
+        papers.append(paper)
+    print(f"Local index: {len(papers)} match(es) for '{topic}'.")
+    return papers
+
+if __name__ == "__main__":
+    import sys
+    index = get_local_index()
+    print(f"Indexed {index.refresh(extract_missing=True)} new document(s); {index.live_docs} total.")
+    if len(sys.argv) > 1:
+        for score, doc in index.search(" ".join(sys.argv[1:])):
+            print(f"{score:6.2f}  {doc['title'][:70]}  ({doc['path']})")
@@ -1,21 +1,298 @@
 import os
+import time
+import asyncio
+import threading
+import weakref
+from typing import Callable, Optional
+import httpx
 from langchain_openai import ChatOpenAI
+from cache import ResponseCache
+from scheduler import get_scheduler
+from serving import single_flight
 
-def get_llm(temperature: float = 0.3):
+MODEL_NAME = "Meta-Llama-3.1-8B-Instruct"
+DEFAULT_MAX_TOKENS = 500
+
+# Responses are only reused for (near-)deterministic settings unless the
+# threshold is raised. Set LLM_CACHE=0 to disable caching entirely.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+# Minimum seconds between on_partial updates while a response streams in
+STREAM_PARTIAL_INTERVAL = float(os.getenv("LLM_STREAM_PARTIAL_INTERVAL", "0.1"))
+
+_response_cache = None
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache("llm_responses", ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES)
+    return _response_cache
+
+class _ConnectionMetrics:
     """
-    Returns an LLM instance using SambaNova API.
-    Requires SAMBANOVA_API_KEY to be set in the environment.
+    Counts requests and new connections across the shared HTTP pools.
+    httpcore reports each TCP connect through the request's "trace"
+    extension, which an httpx request hook attaches; a request that
+    opened no connection reused a pooled one.
     """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {"clients_created": 0, "clients_reused": 0, "requests": 0, "connections_opened": 0}
+
+    def bump(self, name: str) -> None:
+        with self.lock:
+            self.counts[name] += 1
+
+    def _trace(self, event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.complete":
+            self.bump("connections_opened")
+
+    async def _atrace(self, event: str, info: dict) -> None:
+        self._trace(event, info)
+
+    def on_request(self, request: httpx.Request) -> None:
+        self.bump("requests")
+        request.extensions["trace"] = self._trace
+
+    async def aon_request(self, request: httpx.Request) -> None:
+        self.bump("requests")
+        request.extensions["trace"] = self._atrace
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            counts = dict(self.counts)
+        counts["connections_reused"] = max(0, counts["requests"] - counts["connections_opened"])
+        return counts
+
+_metrics = _ConnectionMetrics()
+
+HTTP_POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", "20"))
+
+_clients = {}
+_clients_lock = threading.Lock()
+_http_client = None
+# httpx.AsyncClient connections are bound to the event loop that opened
+# them, so async clients are pooled per loop.
+_async_clients = weakref.WeakKeyDictionary()
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE)
+
+def _shared_http_client() -> httpx.Client:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(limits=_http_limits(), timeout=60, event_hooks={"request": [_metrics.on_request]})
+    return _http_client
+
+def _build_llm(temperature: float, max_tokens: int, http_client=None, http_async_client=None) -> ChatOpenAI:
     sambanova_key = os.getenv("SAMBANOVA_API_KEY")
     if not sambanova_key:
         print("Warning: SAMBANOVA_API_KEY not found in environment variables.")
-    
+
     # Using SambaNova API with Llama model
-    print("Using SambaNova API.")
+    print(f"Using SambaNova API (temperature={temperature}, max_tokens={max_tokens}).")
+    _metrics.bump("clients_created")
     return ChatOpenAI(
-        model="Meta-Llama-3.1-8B-Instruct",
+        model=MODEL_NAME,
         api_key=sambanova_key,
         base_url="https://api.sambanova.ai/v1",
         temperature=temperature,
-        max_tokens=500
+        max_tokens=max_tokens,
+        max_retries=0, # Retries are handled by the scheduler
+        http_client=http_client,
+        http_async_client=http_async_client
     )
+
+def get_llm(temperature: float = 0.3, max_tokens: int = DEFAULT_MAX_TOKENS):
+    """
+    Returns an LLM instance using SambaNova API.
+    Requires SAMBANOVA_API_KEY to be set in the environment.
+    Instances are shared per (model, temperature, max_tokens) and all of them
+    use one pooled HTTP client, so keep-alive connections are reused.
+    """
+    key = (MODEL_NAME, temperature, max_tokens)
+    with _clients_lock:
+        llm = _clients.get(key)
+        if llm is not None:
+            _metrics.bump("clients_reused")
+            return llm
+        llm = _build_llm(temperature, max_tokens, http_client=_shared_http_client())
+        _clients[key] = llm
+        return llm
+
+def get_async_llm(temperature: float = 0.3, max_tokens: int = DEFAULT_MAX_TOKENS):
+    """
+    Async counterpart of get_llm(): returns an instance whose async HTTP
+    pool belongs to the running event loop and is shared by every
+    coroutine on that loop.
+    """
+    loop = asyncio.get_running_loop()
+    key = (MODEL_NAME, temperature, max_tokens)
+    with _clients_lock:
+        registry = _async_clients.get(loop)
+        if registry is None:
+            http_async_client = httpx.AsyncClient(limits=_http_limits(), timeout=60,
+                                                  event_hooks={"request": [_metrics.aon_request]})
+            registry = {"http": http_async_client, "llms": {}}
+            _async_clients[loop] = registry
+        llm = registry["llms"].get(key)
+        if llm is not None:
+            _metrics.bump("clients_reused")
+            return llm
+        llm = _build_llm(temperature, max_tokens, http_async_client=registry["http"])
+        registry["llms"][key] = llm
+        return llm
+
+_llm_loop = None
+_llm_loop_lock = threading.Lock()
+
+def run_async(coro):
+    """
+    Runs a coroutine on the shared background LLM event loop and waits for
+    its result. Lets synchronous graph nodes use the async client without
+    creating (and tearing down the connection pool of) a new loop per call.
+    """
+    global _llm_loop
+    with _llm_loop_lock:
+        if _llm_loop is None:
+            _llm_loop = asyncio.new_event_loop()
+            threading.Thread(target=_llm_loop.run_forever, name="llm-async", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _llm_loop).result()
+
+def llm_client_metrics() -> dict:
+    """
+    Returns counters for LLM clients created/reused, requests sent, and HTTP connections opened/reused.
+    """
+    return _metrics.snapshot()
+
+def render_prompt(prompt_value) -> list:
+    """
+    Returns the prompt as a list of (role, content) pairs, the form used for cache keys.
+    """
+    return [(m.type, m.content) for m in prompt_value.to_messages()]
+
+def estimate_tokens(messages: list, max_tokens: int) -> int:
+    """Rough prompt + completion token count used for tokens/min limiting."""
+    return sum(len(content) for _, content in messages) // 4 + max_tokens
+
+class _PartialText:
+    """
+    Accumulates streamed tokens and hands the text so far to on_partial at
+    most once per STREAM_PARTIAL_INTERVAL seconds (and once at the end), so
+    joining the tokens costs O(n) per update rather than per token.
+    """
+
+    def __init__(self, on_partial: Callable[[str], None]):
+        self.on_partial = on_partial
+        self.parts = []
+        self.sent = 0
+        self.last = 0.0
+
+    def add(self, content: str) -> None:
+        self.parts.append(content)
+        now = time.monotonic()
+        if now - self.last >= STREAM_PARTIAL_INTERVAL:
+            self.last = now
+            self._send()
+
+    def _send(self) -> None:
+        if len(self.parts) > 1:
+            self.parts = ["".join(self.parts)]
+        self.sent = len(self.parts[0]) if self.parts else 0
+        self.on_partial(self.parts[0] if self.parts else "")
+
+    def finish(self) -> str:
+        text = "".join(self.parts)
+        if len(text) != self.sent:
+            self.parts = [text]
+            self._send()
+        return text
+
+def _stream_text(llm, prompt_value, on_partial: Callable[[str], None]) -> str:
+    partial = _PartialText(on_partial)
+    for chunk in llm.stream(prompt_value):
+        if chunk.content:
+            partial.add(chunk.content)
+    return partial.finish()
+
+def complete(prompt_value, temperature: float = 0.3, max_tokens: int = DEFAULT_MAX_TOKENS, use_cache: bool = True,
+             on_partial: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Sends a formatted prompt to the LLM and returns the response text.
+    The call goes through the shared scheduler (rate limits, retries).
+    Identical requests (model, temperature, max_tokens, rendered prompt) are
+    served from the persistent response cache when caching applies, and
+    shared between concurrent callers while in flight.
+    If on_partial is given the response is streamed and on_partial receives
+    the accumulated text as it grows, at most every STREAM_PARTIAL_INTERVAL
+    seconds and once complete (a retry starts it over).
+    """
+    messages = render_prompt(prompt_value)
+    cacheable = use_cache and LLM_CACHE_ENABLED and temperature <= LLM_CACHE_MAX_TEMPERATURE
+    key = None
+    if cacheable:
+        key = ResponseCache.make_key(MODEL_NAME, temperature, max_tokens, messages)
+        cached = get_response_cache().get(key)
+        if cached is not None:
+            if on_partial:
+                on_partial(cached)
+            return cached
+
+    def call():
+        llm = get_llm(temperature=temperature, max_tokens=max_tokens)
+        if on_partial:
+            return get_scheduler().run(lambda: _stream_text(llm, prompt_value, on_partial), estimate_tokens(messages, max_tokens))
+        return get_scheduler().run(lambda: llm.invoke(prompt_value), estimate_tokens(messages, max_tokens)).content
+
+    if not cacheable:
+        return call()
+
+    # Identical deterministic requests from concurrent sessions share one call
+    text = single_flight.do(("llm", key), call)
+    get_response_cache().put(key, text)
+    if on_partial:
+        on_partial(text)
+    return text
+
+async def _astream_text(llm, prompt_value, on_partial: Callable[[str], None]) -> str:
+    partial = _PartialText(on_partial)
+    async for chunk in llm.astream(prompt_value):
+        if chunk.content:
+            partial.add(chunk.content)
+    return partial.finish()
+
+async def acomplete(prompt_value, temperature: float = 0.3, max_tokens: int = DEFAULT_MAX_TOKENS, use_cache: bool = True,
+                    on_partial: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Async counterpart of complete(), sharing its cache and scheduler.
+    Response cache reads and writes (SQLite) run in a worker thread.
+    """
+    messages = render_prompt(prompt_value)
+    cacheable = use_cache and LLM_CACHE_ENABLED and temperature <= LLM_CACHE_MAX_TEMPERATURE
+    key = None
+    if cacheable:
+        key = ResponseCache.make_key(MODEL_NAME, temperature, max_tokens, messages)
+        cached = await asyncio.to_thread(get_response_cache().get, key)
+        if cached is not None:
+            if on_partial:
+                on_partial(cached)
+            return cached
+
+    async def call():
+        llm = get_async_llm(temperature=temperature, max_tokens=max_tokens)
+        if on_partial:
+            return await get_scheduler().arun(lambda: _astream_text(llm, prompt_value, on_partial), estimate_tokens(messages, max_tokens))
+        response = await get_scheduler().arun(lambda: llm.ainvoke(prompt_value), estimate_tokens(messages, max_tokens))
+        return response.content
+
+    if not cacheable:
+        return await call()
+
+    text = await single_flight.ado(("llm", key), call)
+    await asyncio.to_thread(get_response_cache().put, key, text)
+    if on_partial:
+        on_partial(text)
+    return text
@@ -0,0 +1,344 @@
+import os
+import mmap
+import zlib
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from cache import CACHE_ROOT
+
+TEXT_STORE_DIR = os.path.join(CACHE_ROOT, "texts")
+TEXT_CACHE_CHARS = int(os.getenv("TEXT_STORE_CACHE_CHARS", "4000000"))
+
+class TextStore:
+    """
+    Append-only, content-addressed store for paper text.
+
+    Each text is written once to texts.bin as a header followed by its
+    UTF-8 bytes, and read back through mmap. The handle of a text is the
+    hex SHA-256 of the whole text. A text that extends one already stored
+    (a paper whose extraction grew) is written as just the new suffix plus
+    the handle of its base, so growing a paper does not copy its prefix.
+
+    Headers start with a magic that cannot occur in UTF-8 and carry CRCs
+    of the header and the data. The offsets are rebuilt by scanning on
+    open, and entries appended by another process are picked up the same
+    way on a miss. A torn or interleaved write fails its CRC and the scan
+    resyncs at the next magic. Recently read texts are kept decoded, up to
+    TEXT_CACHE_CHARS characters. compact() drops unreferenced texts.
+    """
+    MAGIC = b"\xffTXT"
+    HEADER = struct.Struct("<4s32s32sQII")  # magic, digest, base digest, data length, header CRC, data CRC
+    NO_BASE = bytes(32)
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or TEXT_STORE_DIR
+        self.path = os.path.join(self.directory, "texts.bin")
+        self._lock = threading.Lock()
+        self._offsets: Dict[str, Tuple[int, int, Optional[str]]] = {}  # digest -> (data offset, byte length, base)
+        self._scanned = 0
+        self._inode = None
+        self._map = None
+        self._decoded: "OrderedDict[str, str]" = OrderedDict()
+        self._decoded_chars = 0
+        self._touched = set()  # Handles this process has read or written
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._scan()
+
+    def _reset(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._offsets.clear()
+        self._decoded.clear()
+        self._decoded_chars = 0
+        self._scanned = 0
+
+    def _scan(self) -> None:
+        """
+        Indexes complete entries past the last scanned offset (lock held).
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_ino != self._inode:
+                    # First scan, or the file was compacted
+                    self._reset()
+                    self._inode = stat.st_ino
+                size = stat.st_size
+                while self._scanned + self.HEADER.size <= size:
+                    f.seek(self._scanned)
+                    header = f.read(self.HEADER.size)
+                    magic, digest, base, length, header_crc, data_crc = self.HEADER.unpack(header)
+                    if magic != self.MAGIC or zlib.crc32(header[4:-8]) != header_crc:
+                        self._scanned = self._next_magic(f, self._scanned + 1, size)
+                        continue
+                    start = self._scanned + self.HEADER.size
+                    if start + length > size:
+                        # Still being written, unless a later entry shows it was torn
+                        resync = self._next_magic(f, start, size)
+                        if resync + self.HEADER.size > size:
+                            break
+                        self._scanned = resync
+                        continue
+                    if zlib.crc32(f.read(length)) != data_crc:
+                        self._scanned = self._next_magic(f, self._scanned + 1, size)
+                        continue
+                    self._offsets[digest.hex()] = (start, length, None if base == self.NO_BASE else base.hex())
+                    self._scanned = start + length
+        except FileNotFoundError:
+            pass
+
+    def _next_magic(self, f, pos: int, size: int) -> int:
+        """
+        Offset of the next magic at or after pos, or where a magic could still begin.
+        """
+        block = 1 << 16
+        while pos < size:
+            f.seek(pos)
+            data = f.read(block + len(self.MAGIC) - 1)
+            found = data.find(self.MAGIC)
+            if found != -1:
+                return pos + found
+            pos += block
+        return max(size - len(self.MAGIC) + 1, 0)
+
+    def _read(self, start: int, length: int) -> bytes:
+        if self._map is None or len(self._map) < start + length:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[start:start + length]
+
+    def _text(self, handle: str) -> str:
+        """
+        Decodes a text and the texts it extends, through the cache (lock held).
+        """
+        parts = []
+        current = handle
+        while current is not None and current not in self._decoded:
+            start, length, base = self._offsets[current]
+            parts.append(self._read(start, length).decode("utf-8") if length else "")
+            current = base
+        text = "".join(([self._decoded[current]] if current is not None else []) + parts[::-1])
+        if current is not None:
+            self._decoded.move_to_end(current)
+        if handle not in self._decoded and len(text) <= TEXT_CACHE_CHARS:
+            self._decoded[handle] = text
+            self._decoded_chars += len(text)
+            while self._decoded_chars > TEXT_CACHE_CHARS:
+                _, evicted = self._decoded.popitem(last=False)
+                self._decoded_chars -= len(evicted)
+        return text
+
+    def _append(self, entry: bytes) -> None:
+        # O_APPEND puts every write at the end; a write cut short and finished
+        # by a second one can interleave with another process's entry, which
+        # then fails its CRC and is skipped by _scan
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            view = memoryview(entry)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+
+    def _entry(self, digest: bytes, base: bytes, data: bytes) -> bytes:
+        fields = struct.pack("<32s32sQ", digest, base, len(data))
+        return self.HEADER.pack(self.MAGIC, digest, base, len(data), zlib.crc32(fields), zlib.crc32(data)) + data
+
+    def put(self, text: str, base: Optional[str] = None) -> str:
+        """
+        Stores text and returns its handle. If base is the handle of a
+        prefix of text, only the rest is written.
+        """
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).digest()
+        handle = digest.hex()
+        with self._lock:
+            self._touched.add(handle)
+            if self._stale(handle):
+                self._scan()
+            if handle in self._offsets:
+                return handle
+            base_digest = self.NO_BASE
+            if base is not None and base != handle and base in self._offsets:
+                prefix = self._text(base)
+                if prefix and text.startswith(prefix):
+                    data = text[len(prefix):].encode("utf-8")
+                    base_digest = bytes.fromhex(base)
+            self._append(self._entry(digest, base_digest, data))
+            self._scan()
+        return handle
+
+    def _stale(self, handle: str) -> bool:
+        # A miss may be an entry another process appended; a new inode means the file was compacted
+        if handle not in self._offsets:
+            return True
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return False
+
+    def get(self, handle: str) -> Optional[str]:
+        with self._lock:
+            if self._stale(handle):
+                self._scan()
+            if handle not in self._offsets:
+                return None
+            self._touched.add(handle)
+            return self._text(handle)
+
+    def __contains__(self, handle: str) -> bool:
+        with self._lock:
+            if self._stale(handle):
+                self._scan()
+            return handle in self._offsets
+
+    def compact(self, keep: Iterable[str]) -> int:
+        """
+        Rewrites the store with only the texts in keep, the texts this
+        process has used and the texts those extend; returns the bytes freed.
+        Entries another process appends while this runs are lost, so run
+        it before serving.
+        """
+        with self._lock:
+            self._scan()
+            live = set()
+            for handle in set(keep) | self._touched:
+                while handle in self._offsets and handle not in live:
+                    live.add(handle)
+                    handle = self._offsets[handle][2]
+            if len(live) == len(self._offsets):
+                return 0
+            old_size = os.path.getsize(self.path)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as out:
+                # Offset order writes every base before the texts extending it
+                for handle, (start, length, base) in sorted(self._offsets.items(), key=lambda kv: kv[1][0]):
+                    if handle in live:
+                        out.write(self._entry(bytes.fromhex(handle), bytes.fromhex(base) if base else self.NO_BASE,
+                                              self._read(start, length)))
+            os.replace(tmp_path, self.path)
+            self._inode = None
+            self._scan()
+            return old_size - os.path.getsize(self.path)
+
+_store: Optional[TextStore] = None
+_store_lock = threading.Lock()
+
+def get_text_store() -> TextStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TextStore()
+        return _store
+
+class PaperRecord(MutableMapping):
+    """
+    A paper as it travels through the graph: metadata in __slots__ and the
+    extracted text as a handle into the TextStore.
+
+    It behaves like the paper dicts the rest of the pipeline was written
+    for (get, [], in, pop, update), but reading full_text loads it from the
+    store (which keeps recent texts decoded) and assigning it writes it
+    there, so state updates, app.run_research's copy of the state and
+    checkpoints carry a 64-character handle instead of the paper's markdown.
+    """
+    FIELDS = ("paperId", "title", "abstract", "year", "authors", "venue", "citationCount", "url", "pdf_url",
+              "doi", "arxivId", "pdf_path", "is_local", "source", "pages_extracted", "page_count",
+              "pdf_digest", "analysis_key")
+    # An unset slot is an absent key; keys outside FIELDS go to _extra
+    __slots__ = FIELDS + ("text_handle", "_extra", "_store")
+
+    def __init__(self, data: Iterable = (), text_handle: Optional[str] = None, store: Optional[TextStore] = None):
+        self.text_handle = text_handle
+        self._extra = None
+        self._store = store
+        self.update(data)
+
+    @property
+    def store(self) -> TextStore:
+        return self._store or get_text_store()
+
+    def __getitem__(self, key: str):
+        if key == "full_text":
+            if self.text_handle is None:
+                raise KeyError(key)
+            text = self.store.get(self.text_handle)
+            if text is None:
+                print(f"Text of {self.get('title', 'Unknown')[:30]} is missing from the text store.")
+                return ""
+            return text
+        if key in self.FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key: str, value) -> None:
+        if key == "full_text":
+            # Stored as a suffix of the previous text when it only grew
+            self.text_handle = self.store.put(value or "", base=self.text_handle)
+        elif key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key == "full_text":
+            if self.text_handle is None:
+                raise KeyError(key)
+            self.text_handle = None
+        elif key in self.FIELDS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is None or key not in self._extra:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key) -> bool:
+        # Without loading the text
+        if key == "full_text":
+            return self.text_handle is not None
+        if key in self.FIELDS:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self.text_handle is not None:
+            yield "full_text"
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def metadata(self) -> dict:
+        """
+        Every field except full_text, as a plain dict.
+        """
+        return {k: self[k] for k in self if k != "full_text"}
+
+    def __repr__(self) -> str:
+        return f"PaperRecord({self.metadata()!r}, text_handle={self.text_handle!r})"
+
+def as_record(paper) -> PaperRecord:
+    return paper if isinstance(paper, PaperRecord) else PaperRecord(paper)
@@ -0,0 +1,114 @@
+import os
+import queue
+import threading
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from extraction import (
+    resolve_pdf_path, submit_extraction, submit_partial_extraction,
+    _apply_partial_result, get_text_budget,
+)
+from analysis import analyze_single_paper_wrapper
+
+QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+DOWNLOAD_STAGE_WORKERS = int(os.getenv("PIPELINE_DOWNLOAD_WORKERS", "5"))
+EXTRACT_STAGE_WORKERS = int(os.getenv("PIPELINE_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+ANALYZE_STAGE_WORKERS = int(os.getenv("PIPELINE_ANALYZE_WORKERS", "5"))
+
+_DONE = object()
+
+def _run_stage(name: str, fn: Callable, in_q: queue.Queue, out_q: Optional[queue.Queue], workers: int) -> threading.Thread:
+    """
+    Starts `workers` threads applying fn to items from in_q and forwarding
+    non-None results to out_q. When in_q is exhausted the stage closes out_q.
+    Returns a thread that finishes once the whole stage has drained.
+    """
+    def worker():
+        while True:
+            item = in_q.get()
+            if item is _DONE:
+                in_q.put(_DONE)  # Let sibling workers see the end of input too
+                return
+            try:
+                result = fn(item)
+            except Exception as e:
+                print(f"Pipeline {name} stage failed: {e}")
+                result = None
+            if result is not None and out_q is not None:
+                out_q.put(result)  # Blocks when the next stage is behind
+
+    threads = [threading.Thread(target=worker, name=f"pipeline-{name}-{i}", daemon=True) for i in range(workers)]
+    for t in threads:
+        t.start()
+
+    def closer():
+        for t in threads:
+            t.join()
+        if out_q is not None:
+            out_q.put(_DONE)
+
+    closing = threading.Thread(target=closer, name=f"pipeline-{name}-closer", daemon=True)
+    closing.start()
+    return closing
+
+def run_streaming_pipeline(papers: Iterable[dict], char_budget: Optional[int] = None, topic: Optional[str] = None,
+                           analyze_fn: Optional[Callable] = None) -> Tuple[List[dict], List[dict]]:
+    """
+    Moves each paper through download -> extract -> analyze as soon as the
+    previous stage is done with it, instead of waiting for the whole batch
+    at every stage. Bounded queues between the stages provide backpressure.
+    Returns (papers, analyses) in input order once every paper has drained.
+    analyze_fn(paper, topic) defaults to analyze_single_paper_wrapper.
+    """
+    if char_budget is None:
+        char_budget = get_text_budget()
+    if analyze_fn is None:
+        analyze_fn = analyze_single_paper_wrapper
+
+    download_q = queue.Queue(maxsize=QUEUE_SIZE)
+    extract_q = queue.Queue(maxsize=QUEUE_SIZE)
+    analyze_q = queue.Queue(maxsize=QUEUE_SIZE)
+    collected: List[dict] = []
+    analyses = {}
+    lock = threading.Lock()
+
+    def download(item):
+        i, paper = item
+        with lock:
+            collected.append((i, paper))
+        pdf_path = resolve_pdf_path(paper)
+        return (i, paper, pdf_path) if pdf_path else None
+
+    def extract(item):
+        i, paper, pdf_path = item
+        print(f"Extracting {paper['title'][:30]}...")
+        if char_budget:
+            _apply_partial_result(paper, pdf_path, submit_partial_extraction(pdf_path, char_budget).result())
+        else:
+            paper['full_text'] = submit_extraction(pdf_path).result()
+        return (i, paper)
+
+    def analyze(item):
+        i, paper = item
+        result = analyze_fn(paper, topic)
+        if result:
+            with lock:
+                analyses[i] = result
+        return None
+
+    stages = [
+        _run_stage("download", download, download_q, extract_q, DOWNLOAD_STAGE_WORKERS),
+        _run_stage("extract", extract, extract_q, analyze_q, EXTRACT_STAGE_WORKERS),
+        _run_stage("analyze", analyze, analyze_q, None, ANALYZE_STAGE_WORKERS),
+    ]
+
+    for item in enumerate(papers):
+        download_q.put(item)
+    download_q.put(_DONE)
+
+    # Final join: synthesis only starts once the last paper is analyzed
+    for stage in stages:
+        stage.join()
+
+    ordered_papers = [paper for _, paper in sorted(collected, key=lambda x: x[0])]
+    ordered_analyses = [analyses[i] for i in sorted(analyses)]
+    return ordered_papers, ordered_analyses
@@ -0,0 +1,440 @@
+import os
+import re
+import abc
+import time
+import queue
+import asyncio
+import weakref
+import threading
+import concurrent.futures
+import xml.etree.ElementTree as ET
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional
+
+import httpx
+import requests
+
+from cache import ResponseCache
+from scheduler import TokenBucket
+from search import search_papers, asearch_papers, iter_papers, aiter_papers, SEARCH_CACHE_TTL, SEARCH_REQUIRE_PDF
+
+# Seconds each provider gets before federated search moves on without it
+PROVIDER_TIMEOUT = float(os.getenv("SEARCH_PROVIDER_TIMEOUT", "10"))
+SEARCH_PROVIDERS = os.getenv("SEARCH_PROVIDERS", "semantic_scholar,arxiv")
+
+ARXIV_API_URL = "http://export.arxiv.org/api/query"
+# arXiv asks clients to wait about three seconds between calls
+ARXIV_RPM = float(os.getenv("ARXIV_RPM", "20"))
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+ARXIV_NS = "{http://arxiv.org/schemas/atom}"
+
+class SearchProvider(abc.ABC):
+    """
+    A source of paper metadata. Subclasses implement search() (and may
+    override asearch(), and iter_search()/aiter_search() to yield papers
+    as they load), returning paper dicts in the pipeline's format (see
+    search._parse_paper), best match first.
+    """
+    name = "provider"
+
+    def __init__(self, timeout: float = PROVIDER_TIMEOUT):
+        self.timeout = timeout
+
+    @abc.abstractmethod
+    def search(self, topic: str, limit: int) -> List[Dict[str, Any]]:
+        ...
+
+    async def asearch(self, topic: str, limit: int) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.search, topic, limit)
+
+    def iter_search(self, topic: str, limit: int) -> Iterator[Dict[str, Any]]:
+        yield from self.search(topic, limit)
+
+    async def aiter_search(self, topic: str, limit: int) -> AsyncIterator[Dict[str, Any]]:
+        for paper in await self.asearch(topic, limit):
+            yield paper
+
+class SemanticScholarProvider(SearchProvider):
+    name = "semantic_scholar"
+
+    def search(self, topic: str, limit: int) -> List[Dict[str, Any]]:
+        return search_papers(topic, limit=limit)
+
+    async def asearch(self, topic: str, limit: int) -> List[Dict[str, Any]]:
+        return await asearch_papers(topic, limit=limit)
+
+    def iter_search(self, topic: str, limit: int) -> Iterator[Dict[str, Any]]:
+        # Results pages stream in, so the first papers are ready before the last page loads
+        return iter_papers(topic, limit)
+
+    def aiter_search(self, topic: str, limit: int) -> AsyncIterator[Dict[str, Any]]:
+        return aiter_papers(topic, limit)
+
+def parse_arxiv_feed(xml_text: str) -> List[Dict[str, Any]]:
+    """
+    Converts an arXiv API Atom feed into paper dicts.
+    """
+    papers = []
+    root = ET.fromstring(xml_text)
+    for entry in root.findall(f"{ATOM}entry"):
+        abs_url = (entry.findtext(f"{ATOM}id") or "").strip()
+        if "/abs/" not in abs_url:
+            continue  # The feed reports query errors as an entry without a paper id
+        arxiv_id = re.sub(r"v\d+$", "", abs_url.split("/abs/", 1)[1])
+
+        pdf_url = None
+        for link in entry.findall(f"{ATOM}link"):
+            if link.get("title") == "pdf":
+                pdf_url = link.get("href")
+        published = entry.findtext(f"{ATOM}published") or ""
+        journal = entry.findtext(f"{ARXIV_NS}journal_ref")
+
+        papers.append({
+            "title": " ".join((entry.findtext(f"{ATOM}title") or "Unknown").split()),
+            "abstract": " ".join((entry.findtext(f"{ATOM}summary") or "").split()),
+            "year": int(published[:4]) if published[:4].isdigit() else None,
+            "authors": [name.strip() for name in (a.findtext(f"{ATOM}name") for a in entry.findall(f"{ATOM}author")) if name],
+            "venue": journal.strip() if journal else "arXiv",
+            "citationCount": 0,
+            "url": abs_url,
+            "pdf_url": pdf_url,
+            # Old-style ids contain a slash; paperId doubles as the PDF file name
+            "paperId": f"arXiv-{arxiv_id.replace('/', '_')}",
+            "doi": entry.findtext(f"{ARXIV_NS}doi"),
+            "arxivId": arxiv_id,
+        })
+    return papers
+
+class ArxivProvider(SearchProvider):
+    """
+    Queries the arXiv export API directly and parses the Atom feed with
+    ElementTree. Responses are cached and calls are spaced per arXiv's
+    usage guidelines.
+    """
+    name = "arxiv"
+
+    def __init__(self, timeout: float = PROVIDER_TIMEOUT, base_url: str = ARXIV_API_URL,
+                 requests_per_minute: float = ARXIV_RPM, cache: Optional[ResponseCache] = None):
+        super().__init__(timeout)
+        self.base_url = base_url
+        self.limiter = TokenBucket(rate_per_minute=requests_per_minute, capacity=1)
+        self.cache = cache or ResponseCache("arxiv", ttl=SEARCH_CACHE_TTL)
+        self.session = requests.Session()
+        # One client (and connection pool) per event loop, like self.session for sync calls
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _params(topic: str, limit: int) -> Dict[str, Any]:
+        return {"search_query": f"all:{topic}", "start": 0, "max_results": limit, "sortBy": "relevance"}
+
+    def _key(self, topic: str, limit: int) -> str:
+        return ResponseCache.make_key("arxiv-search", topic.strip().lower(), limit)
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                # The export API redirects some queries (e.g. http to https)
+                client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=True)
+                self._async_clients[loop] = client
+            return client
+
+    def search(self, topic: str, limit: int) -> List[Dict[str, Any]]:
+        key = self._key(topic, limit)
+        feed = self.cache.get(key)
+        if feed is None:
+            wait = self.limiter.reserve(1)
+            if wait > 0:
+                time.sleep(wait)
+            response = self.session.get(self.base_url, params=self._params(topic, limit), timeout=self.timeout)
+            response.raise_for_status()
+            feed = response.text
+            self.cache.put(key, feed)
+        return parse_arxiv_feed(feed)[:limit]
+
+    async def asearch(self, topic: str, limit: int) -> List[Dict[str, Any]]:
+        key = self._key(topic, limit)
+        # The SQLite cache blocks, so it runs off the event loop
+        feed = await asyncio.to_thread(self.cache.get, key)
+        if feed is None:
+            wait = self.limiter.reserve(1)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            response = await self._async_client().get(self.base_url, params=self._params(topic, limit))
+            response.raise_for_status()
+            feed = response.text
+            await asyncio.to_thread(self.cache.put, key, feed)
+        return parse_arxiv_feed(feed)[:limit]
+
+PROVIDERS = {
+    SemanticScholarProvider.name: SemanticScholarProvider,
+    ArxivProvider.name: ArxivProvider,
+}
+
+def normalize_title(title: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", (title or "").lower()).split())
+
+def _identity_keys(paper: Dict[str, Any]) -> List[str]:
+    keys = []
+    if paper.get("doi"):
+        keys.append(f"doi:{paper['doi'].lower()}")
+    if paper.get("arxivId"):
+        keys.append(f"arxiv:{re.sub(r'v[0-9]+$', '', paper['arxivId'].lower())}")
+    title = normalize_title(paper.get("title"))
+    if title and title != "unknown":
+        keys.append(f"title:{title}")
+    return keys
+
+def merge_results(results: List[List[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+    """
+    Interleaves per-provider result lists by rank and drops duplicates,
+    matched on DOI, arXiv id or normalized title. The first copy of a
+    paper wins; later copies only fill in fields it is missing (e.g. an
+    arXiv PDF link for a Semantic Scholar record without open access).
+    """
+    merged = []
+    seen = {}
+    depth = 0
+    while len(merged) < limit and any(depth < len(r) for r in results):
+        for papers in results:
+            if depth >= len(papers):
+                continue
+            paper = papers[depth]
+            keys = _identity_keys(paper)
+            existing = next((seen[k] for k in keys if k in seen), None)
+            if existing is not None:
+                for field, value in paper.items():
+                    if value and not existing.get(field):
+                        existing[field] = value
+                target = existing
+            elif len(merged) < limit:
+                target = dict(paper)
+                merged.append(target)
+            else:
+                continue
+            for k in _identity_keys(target):
+                seen.setdefault(k, target)
+        depth += 1
+    return merged
+
+def _with_pdfs(results: List[List[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+    if not SEARCH_REQUIRE_PDF:
+        return merge_results(results, limit)
+    # Merge everything first: a duplicate from another source may supply the PDF link
+    merged = merge_results(results, sum(len(r) for r in results))
+    return [p for p in merged if p.get("pdf_url")][:limit]
+
+_providers: Dict[str, SearchProvider] = {}
+_providers_lock = threading.Lock()
+
+def get_providers() -> List[SearchProvider]:
+    """
+    Returns the providers named in SEARCH_PROVIDERS. Instances are created
+    once per process, so their rate limiters, caches and HTTP sessions are
+    shared by every search.
+    """
+    names = [n.strip() for n in SEARCH_PROVIDERS.split(",") if n.strip()]
+    with _providers_lock:
+        for name in names:
+            if name in PROVIDERS and name not in _providers:
+                _providers[name] = PROVIDERS[name]()
+        return [_providers[n] for n in names if n in _providers]
+
+# Providers that overrun their timeout keep running here instead of blocking the caller
+_fanout_pool = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="search-provider")
+
+def federated_search(topic: str, limit: int = 10, providers: Optional[List[SearchProvider]] = None) -> List[Dict[str, Any]]:
+    """
+    Queries every provider in parallel and merges what arrives within each
+    provider's timeout; a slow or failing source is skipped, not waited on.
+    With SEARCH_REQUIRE_PDF, papers no source has a PDF for are dropped.
+    """
+    providers = providers if providers is not None else get_providers()
+    start = time.monotonic()
+    futures = [(p, _fanout_pool.submit(p.search, topic, limit)) for p in providers]
+
+    results = []
+    for provider, future in futures:
+        remaining = max(0.0, provider.timeout - (time.monotonic() - start))
+        try:
+            papers = future.result(timeout=remaining)
+            print(f"{provider.name}: {len(papers)} results in {time.monotonic() - start:.1f}s")
+            results.append(papers)
+        except concurrent.futures.TimeoutError:
+            print(f"{provider.name}: no answer within {provider.timeout:.0f}s, skipping.")
+        except Exception as e:
+            print(f"{provider.name}: search failed: {e}")
+    return _with_pdfs(results, limit)
+
+async def afederated_search(topic: str, limit: int = 10, providers: Optional[List[SearchProvider]] = None) -> List[Dict[str, Any]]:
+    """
+    Async version of federated_search().
+    """
+    providers = providers if providers is not None else get_providers()
+
+    async def run(provider):
+        try:
+            papers = await asyncio.wait_for(provider.asearch(topic, limit), provider.timeout)
+            print(f"{provider.name}: {len(papers)} results")
+            return papers
+        except asyncio.TimeoutError:
+            print(f"{provider.name}: no answer within {provider.timeout:.0f}s, skipping.")
+        except Exception as e:
+            print(f"{provider.name}: search failed: {e}")
+        return None
+
+    results = await asyncio.gather(*[run(p) for p in providers])
+    return _with_pdfs([r for r in results if r is not None], limit)
+
+class _StreamMerger:
+    """
+    Deduplicates papers as they arrive from several providers, matching
+    them like merge_results(). A paper with a PDF is ready at once; one
+    without waits until a duplicate from another source supplies the link.
+    """
+    def __init__(self):
+        self.seen = {}
+        self.held = []
+
+    def add(self, paper: Dict[str, Any]) -> List[Dict[str, Any]]:
+        existing = next((self.seen[k] for k in _identity_keys(paper) if k in self.seen), None)
+        if existing is None:
+            existing = dict(paper)
+            if existing.get("pdf_url"):
+                ready = [existing]
+            else:
+                self.held.append(existing)
+                ready = []
+        elif any(existing is p for p in self.held):
+            # Papers already handed out are not touched; held ones take missing fields
+            for field, value in paper.items():
+                if value and not existing.get(field):
+                    existing[field] = value
+            if existing.get("pdf_url"):
+                self.held = [p for p in self.held if p is not existing]
+                ready = [existing]
+            else:
+                ready = []
+        else:
+            ready = []
+        for k in _identity_keys(existing):
+            self.seen.setdefault(k, existing)
+        return ready
+
+    def leftovers(self) -> List[Dict[str, Any]]:
+        return [] if SEARCH_REQUIRE_PDF else self.held
+
+def iter_federated(topic: str, limit: int = 10, providers: Optional[List[SearchProvider]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming version of federated_search(): yields merged papers as any
+    provider produces them, so downstream stages can start before the
+    slowest source answers. A provider that goes quiet for longer than its
+    timeout is skipped. Papers without a PDF come last, once every source
+    is done (or not at all with SEARCH_REQUIRE_PDF).
+    """
+    providers = providers if providers is not None else get_providers()
+    arrivals = queue.Queue()
+    stop = threading.Event()
+
+    def run(provider):
+        try:
+            for paper in provider.iter_search(topic, limit):
+                if stop.is_set():
+                    return
+                arrivals.put((provider, paper))
+        except Exception as e:
+            print(f"{provider.name}: search failed: {e}")
+        finally:
+            arrivals.put((provider, None))
+
+    start = time.monotonic()
+    for provider in providers:
+        _fanout_pool.submit(run, provider)
+    deadlines = {provider: start + provider.timeout for provider in providers}
+    counts = {provider: 0 for provider in providers}
+    merger = _StreamMerger()
+    yielded = 0
+    try:
+        while deadlines:
+            try:
+                provider, paper = arrivals.get(timeout=max(0.0, min(deadlines.values()) - time.monotonic()))
+            except queue.Empty:
+                now = time.monotonic()
+                for provider, deadline in list(deadlines.items()):
+                    if deadline <= now:
+                        print(f"{provider.name}: no answer within {provider.timeout:.0f}s, skipping.")
+                        del deadlines[provider]
+                continue
+            if provider not in deadlines:
+                continue  # Already skipped
+            if paper is None:
+                print(f"{provider.name}: {counts[provider]} results in {time.monotonic() - start:.1f}s")
+                del deadlines[provider]
+                continue
+            counts[provider] += 1
+            deadlines[provider] = time.monotonic() + provider.timeout
+            for ready in merger.add(paper):
+                yield ready
+                yielded += 1
+                if yielded >= limit:
+                    return
+        for ready in merger.leftovers()[:limit - yielded]:
+            yield ready
+    finally:
+        stop.set()
+
+async def aiter_federated(topic: str, limit: int = 10, providers: Optional[List[SearchProvider]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Async version of iter_federated().
+    """
+    providers = providers if providers is not None else get_providers()
+    arrivals = asyncio.Queue()
+
+    async def run(provider):
+        try:
+            async for paper in provider.aiter_search(topic, limit):
+                arrivals.put_nowait((provider, paper))
+        except Exception as e:
+            print(f"{provider.name}: search failed: {e}")
+        finally:
+            arrivals.put_nowait((provider, None))
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    tasks = {provider: asyncio.create_task(run(provider)) for provider in providers}
+    deadlines = {provider: start + provider.timeout for provider in providers}
+    counts = {provider: 0 for provider in providers}
+    merger = _StreamMerger()
+    yielded = 0
+    try:
+        while deadlines:
+            try:
+                provider, paper = await asyncio.wait_for(arrivals.get(), max(0.0, min(deadlines.values()) - loop.time()))
+            except asyncio.TimeoutError:
+                now = loop.time()
+                for provider, deadline in list(deadlines.items()):
+                    if deadline <= now:
+                        print(f"{provider.name}: no answer within {provider.timeout:.0f}s, skipping.")
+                        tasks[provider].cancel()
+                        del deadlines[provider]
+                continue
+            if provider not in deadlines:
+                continue
+            if paper is None:
+                print(f"{provider.name}: {counts[provider]} results in {loop.time() - start:.1f}s")
+                del deadlines[provider]
+                continue
+            counts[provider] += 1
+            deadlines[provider] = loop.time() + provider.timeout
+            for ready in merger.add(paper):
+                yield ready
+                yielded += 1
+                if yielded >= limit:
+                    return
+        for ready in merger.leftovers()[:limit - yielded]:
+            yield ready
+    finally:
+        for task in tasks.values():
+            task.cancel()
@@ -0,0 +1,271 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute.
+
+    reserve() never blocks: it takes the tokens immediately (letting the
+    balance go negative) and returns how long the caller must wait before
+    using them. That keeps one implementation usable from threads and
+    coroutines alike.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        if self.rate <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit: grows by roughly one slot per window of
+    successful calls and halves when the provider throttles us.
+
+    Each decrease starts a new epoch, and acquire() returns the epoch the
+    call started in. Throttles from calls started before the last decrease
+    were sent under the old limit, so they are ignored; a burst of 429s
+    halves the limit once rather than once per call.
+
+    Shared by threads and event loops: threads wait on the condition,
+    coroutines queue a future that release() completes on their own loop
+    when it hands them a slot.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 32, decrease: float = 0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self.epoch = 0
+        self.cond = threading.Condition()
+        self._waiters = deque()  # (loop, future) of coroutines waiting for a slot
+
+    def try_acquire(self) -> bool:
+        with self.cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self) -> int:
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+            return self.epoch
+
+    async def aacquire(self) -> int:
+        """Async counterpart of acquire(); waits without polling."""
+        with self.cond:
+            if self.in_flight < int(self.limit) and not self._waiters:
+                self.in_flight += 1
+                return self.epoch
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self.cond:
+                if (loop, waiter) in self._waiters:
+                    self._waiters.remove((loop, waiter))
+                elif waiter.done() and not waiter.cancelled():
+                    # Handed a slot just as we were cancelled
+                    self._give_back()
+            raise
+        with self.cond:
+            return self.epoch
+
+    def release(self, throttled: bool = False, epoch: Optional[int] = None) -> None:
+        with self.cond:
+            if throttled:
+                if epoch is None or epoch == self.epoch:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self.epoch += 1
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+            self._give_back()
+
+    def abandon(self) -> None:
+        """Frees a slot whose call never completed (e.g. was cancelled), leaving the limit as is."""
+        with self.cond:
+            self._give_back()
+
+    def _give_back(self) -> None:
+        # Called with cond held: frees a slot and hands free slots to waiters
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            loop, waiter = self._waiters.popleft()
+            try:
+                loop.call_soon_threadsafe(self._grant, waiter)
+            except RuntimeError:  # Its event loop has closed
+                continue
+            self.in_flight += 1
+        self.cond.notify_all()
+
+    def _grant(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            with self.cond:
+                self._give_back()
+        else:
+            waiter.set_result(None)
+
+def _status_code(exc: Exception) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+def is_retryable(exc: Exception) -> bool:
+    """
+    True for throttling, server errors and transient connection failures.
+    """
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    name = type(exc).__name__
+    return name in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "RemoteProtocolError")
+
+def is_throttled(exc: Exception) -> bool:
+    return _status_code(exc) == 429
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class LLMScheduler:
+    """
+    Central gate for LLM calls.
+
+    Every call reserves one request from a requests/min bucket and its
+    estimated tokens from a tokens/min bucket, then waits for a slot under
+    the adaptive concurrency limit. Throttling (429) and server errors
+    are retried with exponential backoff and full jitter.
+    """
+
+    def __init__(self, requests_per_minute: float = 60, tokens_per_minute: float = 100000,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 30.0,
+                 initial_concurrency: int = 4, max_concurrency: int = 32):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrency(initial=initial_concurrency, maximum=max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0}
+
+    def _bump(self, name: str) -> None:
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def _backoff(self, attempt: int, exc: Exception) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = _retry_after(exc)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+
+    def run(self, fn: Callable, estimated_tokens: int = 1000):
+        """Runs fn() under the rate limits, retrying transient failures."""
+        self._bump("calls")
+        attempt = 0
+        while True:
+            wait = self._reserve(estimated_tokens)
+            if wait > 0:
+                time.sleep(wait)
+            epoch = self.concurrency.acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                throttled = is_throttled(e)
+                self.concurrency.release(throttled=throttled, epoch=epoch)
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    self._bump("failures")
+                    raise
+                self._bump("throttled" if throttled else "retries")
+                time.sleep(self._backoff(attempt, e))
+                attempt += 1
+                continue
+            self.concurrency.release()
+            return result
+
+    async def arun(self, fn: Callable[[], Awaitable], estimated_tokens: int = 1000):
+        """Async counterpart of run(): fn() must return an awaitable."""
+        self._bump("calls")
+        attempt = 0
+        while True:
+            wait = self._reserve(estimated_tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            epoch = await self.concurrency.aacquire()
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                # Not a success: a cancelled call says nothing about the provider's capacity
+                self.concurrency.abandon()
+                raise
+            except Exception as e:
+                throttled = is_throttled(e)
+                self.concurrency.release(throttled=throttled, epoch=epoch)
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    self._bump("failures")
+                    raise
+                self._bump("throttled" if throttled else "retries")
+                await asyncio.sleep(self._backoff(attempt, e))
+                attempt += 1
+                continue
+            self.concurrency.release()
+            return result
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> LLMScheduler:
+    """
+    Returns the process-wide scheduler, configured from LLM_RPM / LLM_TPM / LLM_MAX_CONCURRENCY.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(
+                requests_per_minute=float(os.getenv("LLM_RPM", "60")),
+                tokens_per_minute=float(os.getenv("LLM_TPM", "100000")),
+                max_retries=int(os.getenv("LLM_MAX_RETRIES", "5")),
+                initial_concurrency=int(os.getenv("LLM_INITIAL_CONCURRENCY", "4")),
+                max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "32")),
+            )
+        return _scheduler
@@ -1,97 +1,481 @@
 import os
+import json
 import time
+import asyncio
+import weakref
+import threading
+import httpx
 import requests
-from typing import List, Dict, Any
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Any, AsyncIterator, Iterable, Iterator, Optional
 from dotenv import load_dotenv
 
+from cache import ResponseCache
+from scheduler import TokenBucket
+
 load_dotenv()
 
+GRAPH_API_URL = "https://api.semanticscholar.org/graph/v1"
+SEARCH_FIELDS = "title,abstract,authors,year,venue,citationCount,openAccessPdf,url,paperId,externalIds"
+
+# Public API allows roughly one request per second; keyed access is higher.
+SEARCH_RPS = float(os.getenv("SEMANTIC_SCHOLAR_RPS", "1.0"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL_HOURS", "24")) * 3600
+PAPER_CACHE_TTL = float(os.getenv("PAPER_CACHE_TTL_HOURS", "6")) * 3600
+BATCH_SIZE = 500 # Maximum ids per /paper/batch request
+PAGE_SIZE = 100 # Relevance search returns at most 100 results per page
+RELEVANCE_SEARCH_LIMIT = 1000 # Relevance search can't page past this offset; bulk search can
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "500"))
+# Papers without an open-access PDF never get analyzed, so don't fetch them
+SEARCH_REQUIRE_PDF = os.getenv("SEARCH_REQUIRE_PDF", "1") != "0"
+MAX_ATTEMPTS = 3
+# After a 403, requests go out without the API key for this long before it is tried again
+API_KEY_COOLDOWN = float(os.getenv("SEMANTIC_SCHOLAR_KEY_COOLDOWN", "600"))
+
+def _parse_paper(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Converts a Graph API paper record into the paper dict used by the pipeline.
+    """
+    title = item.get("title", "Unknown")
+
+    # Extract authors safely
+    authors_list = item.get("authors", [])
+    # authors_list handles cases where it might be Nonr
+    if authors_list is None: authors_list = []
+    author_names = [a.get("name") for a in authors_list if a.get("name")]
+
+    paper_data = {
+        "title": title,
+        "abstract": item.get("abstract", ""),
+        "year": item.get("year"),
+        "authors": author_names,
+        "venue": item.get("venue"),
+        "citationCount": item.get("citationCount", 0),
+        "url": item.get("url"),
+        "pdf_url": None,
+        "paperId": item.get("paperId"),
+        "doi": None,
+        "arxivId": None,
+    }
+
+    # External identifiers let federated search merge the same paper from other sources
+    external_ids = item.get("externalIds") or {}
+    paper_data["doi"] = external_ids.get("DOI")
+    paper_data["arxivId"] = external_ids.get("ArXiv")
+
+    # Check for Open Access PDF
+    open_access = item.get("openAccessPdf")
+    if open_access and isinstance(open_access, dict) and "url" in open_access:
+        paper_data["pdf_url"] = open_access["url"]
+    return paper_data
+
+def _parse_results(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    papers = []
+    count = 0
+    for item in items:
+        count += 1
+        print(f"Processing paper {count}: {item.get('title', 'Unknown')}")
+        papers.append(_parse_paper(item))
+
+    print(f"Successfully processed {len(papers)} papers.")
+    return papers
+
+class SemanticScholarClient:
+    """
+    Graph API client with a pooled session, a token-bucket rate limit and an
+    on-disk cache.
+
+    A search caches the ordered paperIds it returned (keyed by query, fields
+    and limit); paper metadata is cached per paperId with a shorter TTL and
+    refreshed in bulk through POST /paper/batch.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: str = GRAPH_API_URL,
+                 requests_per_second: float = SEARCH_RPS, cache: Optional[ResponseCache] = None,
+                 require_pdf: bool = SEARCH_REQUIRE_PDF):
+        self.base_url = base_url.rstrip("/")
+        self.require_pdf = require_pdf
+        self.api_key = api_key if api_key is not None else os.getenv("SEMANTIC_SCHOLAR_API_KEY")
+        self.limiter = TokenBucket(rate_per_minute=requests_per_second * 60, capacity=1)
+        self.cache = cache or ResponseCache("semantic_scholar", ttl=max(SEARCH_CACHE_TTL, PAPER_CACHE_TTL))
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._key_rejected_at: Optional[float] = None
+
+        if self.api_key:
+            print(f"Initializing Semantic Scholar with Private API Key: {self.api_key[:5]}...")
+        else:
+            print("WARNING: SEMANTIC_SCHOLAR_API_KEY not found. Using Public API (rate limits apply).")
+
+    def _use_key(self) -> bool:
+        rejected_at = self._key_rejected_at
+        return bool(self.api_key) and (rejected_at is None or time.monotonic() - rejected_at >= API_KEY_COOLDOWN)
+
+    def _reject_key(self) -> None:
+        print(f"Authentication failed or API key invalid. Using the public API for {API_KEY_COOLDOWN:.0f}s.")
+        self._key_rejected_at = time.monotonic()
+
+    def _headers(self, use_key: bool) -> Dict[str, str]:
+        return {"x-api-key": self.api_key} if use_key else {}
+
+    def _handle_status(self, status_code: int, text: str, attempt: int) -> Optional[float]:
+        """
+        Decides what to do with a non-200 response: returns seconds to wait
+        before retrying, or None to give up.
+        """
+        if status_code in (429, 500, 502, 503, 504) and attempt < MAX_ATTEMPTS:
+            return 2.0 ** attempt
+        print(f"Error: API returned status code {status_code}")
+        print(f"Response: {text}")
+        return None
+
+    def _request(self, method: str, path: str, params: Dict[str, Any], body: Optional[Dict[str, Any]] = None):
+        use_key = self._use_key()
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            wait = self.limiter.reserve(1)
+            if wait > 0:
+                time.sleep(wait)
+            response = self.session.request(method, f"{self.base_url}{path}", params=params, json=body,
+                                            headers=self._headers(use_key), timeout=30)
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code == 403 and use_key:
+                # Retry this request on the public API; the key is tried again after the cooldown
+                self._reject_key()
+                use_key = False
+                continue
+            retry_in = self._handle_status(response.status_code, response.text, attempt)
+            if retry_in is None:
+                return None
+            time.sleep(retry_in)
+        return None
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = httpx.AsyncClient(timeout=30)
+                self._async_clients[loop] = client
+            return client
+
+    async def _arequest(self, method: str, path: str, params: Dict[str, Any], body: Optional[Dict[str, Any]] = None):
+        client = self._async_client()
+        use_key = self._use_key()
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            wait = self.limiter.reserve(1)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            response = await client.request(method, f"{self.base_url}{path}", params=params, json=body,
+                                            headers=self._headers(use_key))
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code == 403 and use_key:
+                self._reject_key()
+                use_key = False
+                continue
+            retry_in = self._handle_status(response.status_code, response.text, attempt)
+            if retry_in is None:
+                return None
+            await asyncio.sleep(retry_in)
+        return None
+
+    # --- cache helpers -------------------------------------------------
+
+    def _search_key(self, topic: str, limit: int, fields: str) -> str:
+        return ResponseCache.make_key("search", topic.strip().lower(), fields, limit, self.require_pdf)
+
+    def _paper_key(self, paper_id: str, fields: str) -> str:
+        return ResponseCache.make_key("paper", paper_id, fields)
+
+    def _cached_search(self, topic: str, limit: int, fields: str) -> Optional[List[str]]:
+        cached = self.cache.get(self._search_key(topic, limit, fields))
+        if cached is None:
+            return None
+        entry = json.loads(cached)
+        if time.time() - entry["at"] > SEARCH_CACHE_TTL:
+            return None
+        return entry["ids"]
+
+    def _cached_papers(self, paper_ids: Iterable[str], fields: str) -> Dict[str, Dict[str, Any]]:
+        keys = {self._paper_key(paper_id, fields): paper_id for paper_id in paper_ids}
+        found = {}
+        for key, cached in self.cache.get_many(keys).items():
+            entry = json.loads(cached)
+            if time.time() - entry["at"] <= PAPER_CACHE_TTL:
+                found[keys[key]] = entry["item"]
+        return found
+
+    def _store_search(self, topic: str, limit: int, fields: str, items: List[Dict[str, Any]]) -> None:
+        now = time.time()
+        ids = [item.get("paperId") for item in items if item.get("paperId")]
+        self._store_papers(items, fields, {self._search_key(topic, limit, fields): json.dumps({"at": now, "ids": ids})})
+
+    def _store_papers(self, items: List[Dict[str, Any]], fields: str, extra: Optional[Dict[str, str]] = None) -> None:
+        # One transaction for the whole batch (plus any extra entries) instead of a commit per paper
+        now = time.time()
+        entries = dict(extra or {})
+        for item in items:
+            if item and item.get("paperId"):
+                entries[self._paper_key(item["paperId"], fields)] = json.dumps({"at": now, "item": item})
+        self.cache.put_many(entries)
+
+    def _search_params(self, topic: str, limit: int, fields: str) -> Dict[str, Any]:
+        params = {"query": topic, "limit": limit, "fields": fields}
+        if self.require_pdf:
+            params["openAccessPdf"] = ""  # Flag parameter: only papers with a public PDF
+        return params
+
+    @staticmethod
+    def _batches(paper_ids: List[str]) -> List[List[str]]:
+        return [paper_ids[i:i + BATCH_SIZE] for i in range(0, len(paper_ids), BATCH_SIZE)]
+
+    # --- public API ----------------------------------------------------
+
+    def get_papers(self, paper_ids: List[str], fields: str = SEARCH_FIELDS, refresh: bool = False,
+                   offline: bool = False) -> List[Dict[str, Any]]:
+        """
+        Returns raw metadata records for paper_ids (in order, unknown ids
+        skipped). Fresh cached records are reused unless refresh is set;
+        the rest are fetched with as few /paper/batch calls as possible,
+        or left out when offline is set.
+        """
+        found = {} if refresh else self._cached_papers(paper_ids, fields)
+        missing = [] if offline else [pid for pid in paper_ids if pid not in found]
+        for batch in self._batches(missing):
+            items = self._request("POST", "/paper/batch", {"fields": fields}, {"ids": batch}) or []
+            items = [item for item in items if item]
+            self._store_papers(items, fields)
+            found.update({item["paperId"]: item for item in items if item.get("paperId")})
+        return [found[pid] for pid in paper_ids if pid in found]
+
+    async def aget_papers(self, paper_ids: List[str], fields: str = SEARCH_FIELDS, refresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        Async version of get_papers().
+        """
+        # The SQLite cache blocks, so it runs off the event loop
+        found = {} if refresh else await asyncio.to_thread(self._cached_papers, paper_ids, fields)
+        missing = [pid for pid in paper_ids if pid not in found]
+        for batch in self._batches(missing):
+            items = await self._arequest("POST", "/paper/batch", {"fields": fields}, {"ids": batch}) or []
+            items = [item for item in items if item]
+            await asyncio.to_thread(self._store_papers, items, fields)
+            found.update({item["paperId"]: item for item in items if item.get("paperId")})
+        return [found[pid] for pid in paper_ids if pid in found]
+
+    def search(self, topic: str, limit: int = 10, fields: str = SEARCH_FIELDS) -> List[Dict[str, Any]]:
+        """
+        Returns raw search result records, served from cache when the same
+        query was run recently.
+        """
+        ids = self._cached_search(topic, limit, fields)
+        if ids is not None:
+            print(f"Using cached search results for '{topic}' (limit={limit}).")
+            return self.get_papers(ids, fields)
+
+        print(f"Sending search request for '{topic}' with limit={limit}...")
+        data = self._request("GET", "/paper/search", self._search_params(topic, limit, fields))
+        if data is None:
+            return []
+        items = data.get("data", [])
+        self._store_search(topic, limit, fields, items)
+        return items
+
+    async def asearch(self, topic: str, limit: int = 10, fields: str = SEARCH_FIELDS) -> List[Dict[str, Any]]:
+        """
+        Async version of search().
+        """
+        ids = await asyncio.to_thread(self._cached_search, topic, limit, fields)
+        if ids is not None:
+            print(f"Using cached search results for '{topic}' (limit={limit}).")
+            return await self.aget_papers(ids, fields)
+
+        print(f"Sending search request for '{topic}' with limit={limit}...")
+        data = await self._arequest("GET", "/paper/search", self._search_params(topic, limit, fields))
+        if data is None:
+            return []
+        items = data.get("data", [])
+        await asyncio.to_thread(self._store_search, topic, limit, fields, items)
+        return items
+
+    # --- pagination ----------------------------------------------------
+
+    def _page_request(self, topic: str, fields: str, page_size: int, cursor, bulk: bool):
+        if bulk:
+            params = {"query": topic, "fields": fields}
+            if cursor:
+                params["token"] = cursor
+        else:
+            params = {"query": topic, "fields": fields, "limit": page_size, "offset": cursor or 0}
+        if self.require_pdf:
+            params["openAccessPdf"] = ""
+        return ("/paper/search/bulk" if bulk else "/paper/search"), params
+
+    @staticmethod
+    def _next_cursor(data: Dict[str, Any], bulk: bool):
+        return data.get("token") if bulk else data.get("next")
+
+    def _page_key(self, topic: str, fields: str, page_size: int, cursor, bulk: bool) -> str:
+        return ResponseCache.make_key("search-page", topic.strip().lower(), fields, page_size, cursor, bulk, self.require_pdf)
+
+    def _cached_page(self, key: str):
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        entry = json.loads(cached)
+        if time.time() - entry["at"] > SEARCH_CACHE_TTL:
+            return None
+        return entry
+
+    def _store_page(self, key: str, items: List[Dict[str, Any]], next_cursor, fields: str) -> None:
+        ids = [item.get("paperId") for item in items if item.get("paperId")]
+        self._store_papers(items, fields, {key: json.dumps({"at": time.time(), "ids": ids, "next": next_cursor})})
+
+    def iter_search(self, topic: str, max_results: int = SEARCH_MAX_RESULTS, fields: str = SEARCH_FIELDS,
+                    page_size: int = PAGE_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yields raw result records one page at a time, following the API's
+        offset/next (relevance search) or token (bulk search, used beyond
+        1000 results) continuation until max_results records were produced.
+        Relevance pages ask for at most page_size records and never more than
+        are still needed; bulk pages have a fixed size. Pages are cached like
+        single searches.
+        """
+        bulk = max_results > RELEVANCE_SEARCH_LIMIT
+        cursor = None
+        produced = 0
+        while produced < max_results:
+            size = page_size if bulk else min(page_size, max_results - produced)
+            key = self._page_key(topic, fields, size, cursor, bulk)
+            entry = self._cached_page(key)
+            if entry is not None:
+                items = self.get_papers(entry["ids"], fields)
+                next_cursor = entry["next"]
+            else:
+                path, params = self._page_request(topic, fields, size, cursor, bulk)
+                print(f"Fetching results {produced + 1}+ for '{topic}'...")
+                data = self._request("GET", path, params)
+                if data is None:
+                    return
+                items = data.get("data", [])
+                next_cursor = self._next_cursor(data, bulk)
+                self._store_page(key, items, next_cursor, fields)
+
+            items = items[:max_results - produced]
+            if items:
+                produced += len(items)
+                yield items
+            if not items or next_cursor is None:
+                return
+            cursor = next_cursor
+
+    async def aiter_search(self, topic: str, max_results: int = SEARCH_MAX_RESULTS, fields: str = SEARCH_FIELDS,
+                           page_size: int = PAGE_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Async version of iter_search().
+        """
+        bulk = max_results > RELEVANCE_SEARCH_LIMIT
+        cursor = None
+        produced = 0
+        while produced < max_results:
+            size = page_size if bulk else min(page_size, max_results - produced)
+            key = self._page_key(topic, fields, size, cursor, bulk)
+            entry = await asyncio.to_thread(self._cached_page, key)
+            if entry is not None:
+                items = await self.aget_papers(entry["ids"], fields)
+                next_cursor = entry["next"]
+            else:
+                path, params = self._page_request(topic, fields, size, cursor, bulk)
+                print(f"Fetching results {produced + 1}+ for '{topic}'...")
+                data = await self._arequest("GET", path, params)
+                if data is None:
+                    return
+                items = data.get("data", [])
+                next_cursor = self._next_cursor(data, bulk)
+                await asyncio.to_thread(self._store_page, key, items, next_cursor, fields)
+
+            items = items[:max_results - produced]
+            if items:
+                produced += len(items)
+                yield items
+            if not items or next_cursor is None:
+                return
+            cursor = next_cursor
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> SemanticScholarClient:
+    """
+    Returns the process-wide Semantic Scholar client.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SemanticScholarClient()
+        return _client
+
 def search_papers(topic: str, limit: int = 10) -> List[Dict[str, Any]]:
     """
     Searches for papers on Semantic Scholar using the Graph API directly.
     """
-    api_key = os.getenv("SEMANTIC_SCHOLAR_API_KEY")
-    base_url = "https://api.semanticscholar.org/graph/v1/paper/search"
-    
-    headers = {}
-    if api_key:
-        print(f"Initializing Semantic Scholar with Private API Key: {api_key[:5]}...")
-        headers["x-api-key"] = api_key
-    else:
-        print("WARNING: SEMANTIC_SCHOLAR_API_KEY not found. Using Public API (rate limits apply).")
-    
+    if limit > PAGE_SIZE:
+        return list(iter_papers(topic, limit))
     print(f"Searching Semantic Scholar for: {topic}")
-    
-    # Rate limiting: 1 request per second to be safe
-    time.sleep(1.0)
-    
-    query_params = {
-        "query": topic,
-        "limit": limit,
-        "fields": "title,abstract,authors,year,venue,citationCount,openAccessPdf,url,paperId"
-    }
-    
     try:
-        print(f"Sending search request for '{topic}' with limit={limit}...")
-        response = requests.get(base_url, params=query_params, headers=headers)
-        
-        if response.status_code == 403:
-             print("Authentication failed or API key invalid. Falling back to public API (removing key).")
-             headers.pop("x-api-key", None)
-             # Wait a bit before retrying
-             time.sleep(2.0)
-             response = requests.get(base_url, params=query_params, headers=headers)
-
-        if response.status_code != 200:
-            print(f"Error: API returned status code {response.status_code}")
-            print(f"Response: {response.text}")
-            return []
-            
-        data = response.json()
-        results = data.get("data", [])
-        print("Search request sent. Processing results...")
-        
-        papers = []
-        count = 0
-        for item in results:
-            count += 1
-            title = item.get("title", "Unknown")
-            print(f"Processing paper {count}: {title}")
-            
-            # Extract authors safely
-            authors_list = item.get("authors", [])
-            # authors_list handles cases where it might be Nonr
-            if authors_list is None: authors_list = []
-            author_names = [a.get("name") for a in authors_list if a.get("name")]
-            
-            paper_data = {
-                "title": title,
-                "abstract": item.get("abstract", ""),
-                "year": item.get("year"),
-                "authors": author_names,
-                "venue": item.get("venue"),
-                "citationCount": item.get("citationCount", 0),
-                "url": item.get("url"),
-                "pdf_url": None,
-                "paperId": item.get("paperId")
-            }
-            
-            # Check for Open Access PDF
-            open_access = item.get("openAccessPdf")
-            if open_access and isinstance(open_access, dict) and "url" in open_access:
-                paper_data["pdf_url"] = open_access["url"]
-            
-            papers.append(paper_data)
-            
-        print(f"Successfully processed {len(papers)} papers.")
-        return papers
+        return _parse_results(get_client().search(topic, limit))
+    except Exception as e:
+        print(f"Error searching Semantic Scholar: {e}")
+        import traceback
+        traceback.print_exc()
+        return []
 
+async def asearch_papers(topic: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Async version of search_papers().
+    """
+    if limit > PAGE_SIZE:
+        return [paper async for paper in aiter_papers(topic, limit)]
+    print(f"Searching Semantic Scholar for: {topic}")
+    try:
+        return _parse_results(await get_client().asearch(topic, limit))
     except Exception as e:
         print(f"Error searching Semantic Scholar: {e}")
         import traceback
         traceback.print_exc()
         return []
 
+def iter_papers(topic: str, max_results: int = SEARCH_MAX_RESULTS) -> Iterator[Dict[str, Any]]:
+    """
+    Yields papers as each results page arrives, so downstream stages can
+    start on the first papers while later pages are still loading.
+    max_results is capped at SEARCH_MAX_RESULTS.
+    """
+    max_results = min(max_results, SEARCH_MAX_RESULTS)
+    print(f"Searching Semantic Scholar for: {topic} (up to {max_results} results)")
+    try:
+        for page in get_client().iter_search(topic, max_results):
+            for item in page:
+                yield _parse_paper(item)
+    except Exception as e:
+        print(f"Error searching Semantic Scholar: {e}")
+
+async def aiter_papers(topic: str, max_results: int = SEARCH_MAX_RESULTS) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Async version of iter_papers().
+    """
+    max_results = min(max_results, SEARCH_MAX_RESULTS)
+    print(f"Searching Semantic Scholar for: {topic} (up to {max_results} results)")
+    try:
+        async for page in get_client().aiter_search(topic, max_results):
+            for item in page:
+                yield _parse_paper(item)
+    except Exception as e:
+        print(f"Error searching Semantic Scholar: {e}")
+
 if __name__ == "__main__":
     # Test
     found = search_papers("Agentic AI workflows", limit=1)
@@ -0,0 +1,203 @@
+import os
+import asyncio
+import threading
+import concurrent.futures
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Hashable
+
+class SingleFlight:
+    """
+    In-flight deduplication of identical work across sessions.
+
+    While a call for a key is running, later callers with the same key
+    wait for and share its result instead of starting the work again.
+    Keys are forgotten as soon as the call finishes, so this never serves
+    stale results; persistence is left to the caches.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.stats = {"leaders": 0, "followers": 0}
+
+    def _join_or_lead(self, key: Hashable):
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["followers"] += 1
+                return future, False
+            future = concurrent.futures.Future()
+            self._inflight[key] = future
+            self.stats["leaders"] += 1
+            return future, True
+
+    def _finish(self, key: Hashable, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def do(self, key: Hashable, fn: Callable):
+        """
+        Runs fn() once per key at a time; concurrent callers share the result.
+        Only errors (Exception) are shared. If the leader is interrupted
+        (KeyboardInterrupt, cancellation), the key is dropped and a waiting
+        caller takes over the work.
+        """
+        while True:
+            future, leader = self._join_or_lead(key)
+            if leader:
+                break
+            try:
+                return future.result()
+            except concurrent.futures.CancelledError:
+                continue
+        try:
+            result = fn()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            self._finish(key, future)
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._finish(key, future)
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """Async version of do(): fn() must return an awaitable."""
+        while True:
+            future, leader = self._join_or_lead(key)
+            if leader:
+                break
+            try:
+                # Shielded so a cancelled follower leaves the shared future alone
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+        try:
+            result = await fn()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            self._finish(key, future)
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._finish(key, future)
+
+    def submit(self, key: Hashable, submit_fn: Callable[[], concurrent.futures.Future]) -> concurrent.futures.Future:
+        """
+        For APIs that already return futures: returns the in-flight future
+        for key, or calls submit_fn() and tracks the new one until it completes.
+        submit_fn() runs outside the lock (it may block, e.g. on a full pool),
+        so the leader registers a placeholder first and chains the result
+        into it. Cancelling the returned future cancels the submitted work.
+        """
+        future, leader = self._join_or_lead(key)
+        if not leader:
+            return future
+        future.add_done_callback(lambda f: self._finish(key, f))
+        try:
+            inner = submit_fn()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+
+        def copy(done):
+            try:
+                if done.cancelled():
+                    future.cancel()
+                elif done.exception() is not None:
+                    future.set_exception(done.exception())
+                else:
+                    future.set_result(done.result())
+            except concurrent.futures.InvalidStateError:
+                pass  # The placeholder was cancelled first
+
+        inner.add_done_callback(copy)
+        future.add_done_callback(lambda f: f.cancelled() and inner.cancel())
+        return future
+
+# Shared by downloads, extraction and LLM calls; keys are namespaced by the caller.
+single_flight = SingleFlight()
+
+class FairJobQueue:
+    """
+    Global admission queue for review jobs.
+
+    At most max_concurrent jobs run at once. Waiting jobs are admitted
+    round-robin across users, so one user submitting many reviews cannot
+    starve everyone else. Must be used from a single event loop.
+    """
+
+    def __init__(self, max_concurrent: int = 4):
+        self.max_concurrent = max_concurrent
+        self.running = 0
+        self._waiting = OrderedDict()  # user -> deque of tickets
+        self._granted = set()
+
+    def enqueue(self, user: Hashable) -> asyncio.Future:
+        """
+        Returns a ticket that completes when the job may start.
+        Every ticket must be handed back to release(), whether or not it was admitted.
+        """
+        ticket = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(user, deque()).append(ticket)
+        self._dispatch()
+        return ticket
+
+    def position(self, ticket: asyncio.Future) -> int:
+        """
+        1-based position in the admission order (0 once admitted).
+        """
+        if ticket.done():
+            return 0
+        queues = [list(q) for q in self._waiting.values()]
+        order = []
+        depth = 0
+        while any(depth < len(q) for q in queues):
+            order.extend(q[depth] for q in queues if depth < len(q))
+            depth += 1
+        return order.index(ticket) + 1 if ticket in order else 0
+
+    def release(self, ticket: asyncio.Future) -> None:
+        if id(ticket) in self._granted:
+            self._granted.discard(id(ticket))
+            self.running -= 1
+        else:
+            ticket.cancel()
+            for user, q in list(self._waiting.items()):
+                if ticket in q:
+                    q.remove(ticket)
+                    if not q:
+                        del self._waiting[user]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self.running < self.max_concurrent and self._waiting:
+            user, q = next(iter(self._waiting.items()))
+            ticket = q.popleft()
+            # Rotate: this user goes to the back of the line
+            del self._waiting[user]
+            if q:
+                self._waiting[user] = q
+            if ticket.done():
+                continue
+            self.running += 1
+            self._granted.add(id(ticket))
+            ticket.set_result(None)
+
+MAX_CONCURRENT_REVIEWS = int(os.getenv("MAX_CONCURRENT_REVIEWS", "4"))
+
+job_queue = FairJobQueue(MAX_CONCURRENT_REVIEWS)
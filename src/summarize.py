@@ -0,0 +1,124 @@
+import os
+import asyncio
+from typing import Dict, List, Optional
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from llm import acomplete, run_async
+from extraction import aensure_text, register_text_budget, strip_back_matter
+from vectors import chunk_text
+
+# Map-reduce summarization reads whole papers instead of a fixed prefix.
+# MAP_REDUCE is only the default: a run can turn it on per request.
+MAP_REDUCE = os.getenv("MAP_REDUCE", "0") == "1"
+SUMMARY_SOURCE_CHARS = int(os.getenv("SUMMARY_SOURCE_CHARS", "200000"))
+SUMMARY_CHUNK_CHARS = int(os.getenv("SUMMARY_CHUNK_CHARS", "6000"))
+SUMMARY_MAX_CHUNKS = int(os.getenv("SUMMARY_MAX_CHUNKS", "32"))
+SUMMARY_TOKENS = 300 # Completion cap for every map and reduce call
+REDUCE_FAN_IN = int(os.getenv("REDUCE_FAN_IN", "6"))
+
+register_text_budget("summary", SUMMARY_SOURCE_CHARS)
+
+def _map_prompt(chunk: str, title: str, topic: Optional[str]):
+    focus = f" Focus on what matters for a review of '{topic}'." if topic else ""
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Summarize this excerpt of a research paper: claims, methods, data and quantitative results."
+                   " Be concise and keep numbers." + focus),
+        ("user", "Paper: {title}\n\n{chunk}")
+    ])
+    return prompt.invoke({"title": title, "chunk": chunk})
+
+def _reduce_prompt(parts: List[str], instruction: str):
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", instruction),
+        ("user", "{parts}")
+    ])
+    return prompt.invoke({"parts": "\n\n".join(f"[{i}] {part}" for i, part in enumerate(parts, start=1))})
+
+PAPER_REDUCE = ("Merge these summaries of consecutive parts of one paper into a single summary of the paper:"
+                " problem, method, key results (with numbers) and limitations. Drop repetition.")
+CORPUS_REDUCE = ("Merge these summaries of research papers into one synthesis: common themes, contrasting"
+                 " findings and open gaps. Attribute findings to paper titles.")
+
+async def areduce(parts: List[str], instruction: str, fan_in: int = REDUCE_FAN_IN) -> str:
+    """
+    Reduces parts to one text in a tree: each level merges groups of at most
+    fan_in parts concurrently, so every call sees at most fan_in summaries
+    of SUMMARY_TOKENS each and the number of levels grows as log(len(parts)).
+    """
+    if not parts:
+        return ""
+    fan_in = max(2, fan_in)
+    level = 0
+    while len(parts) > 1:
+        groups = [parts[i:i + fan_in] for i in range(0, len(parts), fan_in)]
+        level += 1
+        print(f"Reduce level {level}: {len(parts)} -> {len(groups)}")
+
+        async def merge(group):
+            if len(group) == 1:
+                return group[0]
+            return await acomplete(_reduce_prompt(group, instruction), temperature=0, max_tokens=SUMMARY_TOKENS)
+
+        parts = list(await asyncio.gather(*[merge(g) for g in groups]))
+    return parts[0]
+
+async def asummarize_text(text: str, title: str, topic: Optional[str] = None) -> str:
+    """
+    Summarizes a whole paper: chunks are summarized concurrently (the LLM
+    scheduler bounds how many calls run), then reduced into one summary.
+    """
+    chunks = chunk_text(strip_back_matter(text), SUMMARY_CHUNK_CHARS, overlap=200)[:SUMMARY_MAX_CHUNKS]
+    if not chunks:
+        return ""
+    print(f"Summarizing {title[:30]} in {len(chunks)} chunk(s)...")
+    summaries = await asyncio.gather(*[
+        acomplete(_map_prompt(chunk, title, topic), temperature=0, max_tokens=SUMMARY_TOKENS) for chunk in chunks
+    ])
+    return await areduce(list(summaries), PAPER_REDUCE)
+
+async def asummarize_paper(paper, topic: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """
+    Map-reduce counterpart of aanalyze_single_paper_wrapper(): returns
+    {"title", "analysis"} built from the full text, or None.
+    """
+    title = paper.get('title', 'Unknown')
+    text = await aensure_text(paper, SUMMARY_SOURCE_CHARS)
+    if not text:
+        return None
+    try:
+        return {"title": title, "analysis": await asummarize_text(text, title, topic)}
+    except Exception as e:
+        print(f"Summarization failed for {title[:30]}: {e}")
+        return None
+
+async def asummarize_papers(papers, topic: Optional[str] = None) -> List[Dict[str, str]]:
+    results = await asyncio.gather(*[asummarize_paper(paper, topic) for paper in papers])
+    return [r for r in results if r and r["analysis"]]
+
+async def asynthesize_summaries(analyses: List[Dict[str, str]], fan_in: int = REDUCE_FAN_IN) -> str:
+    """
+    Tree-reduces per-paper summaries into one synthesis with bounded fan-in.
+    """
+    try:
+        return await areduce([f"{a['title']}: {a['analysis']}" for a in analyses], CORPUS_REDUCE, fan_in)
+    except Exception as e:
+        return f"Error: {e}"
+
+def summarize_paper(paper, topic: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """
+    Synchronous wrapper around asummarize_paper().
+    """
+    return run_async(asummarize_paper(paper, topic))
+
+def summarize_papers(papers, topic: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    Synchronous wrapper around asummarize_papers().
+    """
+    return run_async(asummarize_papers(papers, topic))
+
+def synthesize_summaries(analyses: List[Dict[str, str]], fan_in: int = REDUCE_FAN_IN) -> str:
+    """
+    Synchronous wrapper around asynthesize_summaries().
+    """
+    return run_async(asynthesize_summaries(analyses, fan_in))
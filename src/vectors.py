@@ -0,0 +1,320 @@
+import os
+import re
+import json
+import zlib
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cache import CACHE_ROOT
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # Optional: fall back to the hashing vectorizer
+    SentenceTransformer = None
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+HASH_DIM = int(os.getenv("HASH_EMBEDDING_DIM", "1024"))
+VECTOR_DIR = os.path.join(CACHE_ROOT, "vectors")
+
+CHUNK_CHARS = int(os.getenv("CHUNK_CHARS", "800"))
+CHUNK_OVERLAP = 100
+SEARCH_BLOCK_ROWS = 8192 # Rows scored per matrix product in VectorIndex.search
+
+def chunk_spans(text: str, size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[Tuple[int, int]]:
+    """
+    Splits text into (start, end) spans of at most size characters,
+    cutting at the last paragraph, line, sentence or word break in the
+    second half of the window. Consecutive spans share about overlap
+    characters so a sentence on a boundary stays retrievable. A span
+    depends only on the text up to start + size, so spans that end before
+    the end of a text are unchanged when more text is appended.
+    """
+    spans = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            for sep in ("\n\n", "\n", ". ", " "):
+                cut = text.rfind(sep, start + size // 2, end)
+                if cut != -1:
+                    end = cut + len(sep)
+                    break
+        if text[start:end].strip():
+            spans.append((start, end))
+        if end >= len(text):
+            break
+        # Start the next chunk on a word boundary inside the overlap
+        next_start = max(end - overlap, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+    return spans
+
+def chunk_text(text: str, size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    Splits text into overlapping chunks of at most size characters (see chunk_spans).
+    """
+    return [text[start:end].strip() for start, end in chunk_spans(text, size, overlap)]
+
+class HashingEmbedder:
+    """
+    Model-free embedder: hashes unigrams and bigrams into a fixed number of
+    signed buckets and L2-normalizes. Captures lexical overlap only, but
+    needs nothing beyond NumPy.
+    """
+
+    def __init__(self, dim: int = HASH_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = re.findall(r"[a-z0-9]+", text.lower())
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            if not features:
+                continue
+            hashes = np.fromiter((zlib.crc32(f.encode()) for f in features), dtype=np.uint32, count=len(features))
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(vectors[row], hashes % self.dim, signs)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+class SentenceTransformerEmbedder:
+    """
+    Small CPU embedding model via sentence-transformers.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=32, normalize_embeddings=True,
+                                 convert_to_numpy=True).astype(np.float32)
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder():
+    """
+    Returns the sentence-transformers embedder when the package and model
+    are available, otherwise the hashing fallback.
+    """
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            if SentenceTransformer is not None:
+                try:
+                    _embedder = SentenceTransformerEmbedder()
+                except Exception as e:
+                    print(f"Could not load embedding model {EMBEDDING_MODEL}: {e}. Using hashing vectors.")
+            if _embedder is None:
+                _embedder = HashingEmbedder()
+        return _embedder
+
+class VectorIndex:
+    """
+    Append-only on-disk store of unit-length chunk vectors.
+
+    Vectors are raw float32 rows in vectors.f32, read through np.memmap so
+    searches page in only what they touch. Chunks are keyed by document
+    (the PDF digest where known) and character span, with a CRC of their
+    text: when a partially extracted paper grows, only the chunks that
+    are new or changed get embedded. chunks.jsonl gets one line per batch
+    of new chunks, so adding to the index never rewrites it.
+    """
+
+    def __init__(self, embedder, directory: Optional[str] = None):
+        self.embedder = embedder
+        self.dim = embedder.dim
+        self.directory = directory or os.path.join(VECTOR_DIR, embedder.name)
+        self._lock = threading.Lock()
+        self._matrix = None
+        self.docs: Dict[str, Dict[Tuple[int, int], Tuple[int, int]]] = {}  # key -> {(start, end): (row, crc)}
+        self.rows = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.f32")
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "chunks.jsonl")
+
+    def _load(self) -> None:
+        try:
+            rows = os.path.getsize(self._vectors_path) // (4 * self.dim)
+            with open(self._meta_path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # A write cut short by a crash
+            if entry.get("dim") != self.dim:
+                continue
+            chunks = self.docs.setdefault(entry["key"], {})
+            for start, end, row, crc in entry["chunks"]:
+                # Drop chunks whose rows never made it to disk
+                if row < rows:
+                    chunks[(start, end)] = (row, crc)
+        self.rows = max((row + 1 for chunks in self.docs.values() for row, _ in chunks.values()), default=0)
+
+    def matrix(self) -> np.ndarray:
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[0] != self.rows:
+                self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode='r',
+                                         shape=(self.rows, self.dim)) if self.rows else np.zeros((0, self.dim), np.float32)
+            return self._matrix
+
+    @staticmethod
+    def doc_key(text: str) -> str:
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def add(self, key: str, text: str, spans: List[Tuple[int, int]]) -> List[int]:
+        """
+        Returns the row of each span of text, embedding the spans not
+        stored for key with the same content yet.
+        """
+        crcs = [zlib.crc32(text[start:end].encode()) for start, end in spans]
+
+        def missing():
+            stored = self.docs.get(key, {})
+            return [i for i, (span, crc) in enumerate(zip(spans, crcs)) if stored.get(span, (None, None))[1] != crc]
+
+        with self._lock:
+            todo = missing()
+        if todo:
+            vectors = self.embedder.embed([text[spans[i][0]:spans[i][1]].strip() for i in todo])
+            with self._lock:
+                todo_now = set(missing())
+                new = [(i, v) for i, v in zip(todo, vectors) if i in todo_now]
+                if new:
+                    with open(self._vectors_path, 'r+b' if os.path.exists(self._vectors_path) else 'wb') as f:
+                        # Overwrite any rows a crashed writer left behind
+                        f.seek(self.rows * 4 * self.dim)
+                        f.write(np.ascontiguousarray([v for _, v in new], dtype=np.float32).tobytes())
+                        f.truncate()
+                    chunks = self.docs.setdefault(key, {})
+                    entry = []
+                    for row, (i, _) in enumerate(new, start=self.rows):
+                        chunks[spans[i]] = (row, crcs[i])
+                        entry.append([spans[i][0], spans[i][1], row, crcs[i]])
+                    self.rows += len(new)
+                    with open(self._meta_path, 'a') as f:
+                        f.write(json.dumps({"key": key, "dim": self.dim, "chunks": entry}) + "\n")
+        with self._lock:
+            stored = self.docs[key] if spans else {}
+            return [stored[span][0] for span in spans]
+
+    def search(self, queries: np.ndarray, k: int, rows: Optional[List[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cosine top-k for a batch of unit-length query vectors, scanning the
+        matrix block by block, or only the given row ids (one document's
+        chunks). Returns (scores, row ids), each of shape (len(queries), <=k), best first.
+        """
+        queries = np.atleast_2d(queries).astype(np.float32)
+        matrix = self.matrix()
+        if rows is not None:
+            ids = np.asarray(rows, dtype=np.int64)
+            scores = queries @ np.asarray(matrix[ids]).T if len(ids) else np.zeros((len(queries), 0), np.float32)
+            order = np.argsort(-scores, axis=1)[:, :k]
+            return np.take_along_axis(scores, order, axis=1), ids[order]
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+        for block_start in range(0, matrix.shape[0], SEARCH_BLOCK_ROWS):
+            block_end = min(block_start + SEARCH_BLOCK_ROWS, matrix.shape[0])
+            scores = queries @ np.asarray(matrix[block_start:block_end]).T
+            ids = np.broadcast_to(np.arange(block_start, block_end), scores.shape)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            ids = np.concatenate([best_ids, ids], axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                ids = np.take_along_axis(ids, top, axis=1)
+            best_scores, best_ids = scores, ids
+
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_ids, order, axis=1)
+
+def cluster_vectors(vectors: np.ndarray, k: int, iterations: int = 20) -> np.ndarray:
+    """
+    Spherical k-means over unit-length rows; returns one label per row.
+    Seeding is deterministic (first row, then repeatedly the row least
+    similar to every chosen centroid), so the same inputs always give
+    the same clusters.
+    """
+    n = len(vectors)
+    k = max(1, min(k, n))
+    chosen = [0]
+    closest = vectors @ vectors[0]
+    for _ in range(1, k):
+        nxt = int(np.argmin(closest))
+        chosen.append(nxt)
+        closest = np.maximum(closest, vectors @ vectors[nxt])
+    centroids = vectors[chosen].copy()
+
+    labels = None
+    for _ in range(iterations):
+        new_labels = np.argmax(vectors @ centroids.T, axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # An emptied cluster keeps its previous centroid
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+    return labels
+
+_index: Optional[VectorIndex] = None
+_index_lock = threading.Lock()
+
+def get_vector_index() -> VectorIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = VectorIndex(get_embedder())
+        return _index
+
+def select_relevant_text(text: str, topic: str, budget: int, doc_key: Optional[str] = None) -> str:
+    """
+    Returns up to budget characters of text made of the chunks most
+    similar to topic, in document order. Text that already fits is
+    returned unchanged. doc_key (e.g. the PDF digest) lets a later call
+    on a longer extraction of the same paper reuse the chunk vectors;
+    without it the text itself is the key.
+    """
+    if len(text) <= budget or not topic:
+        return text
+    spans = chunk_spans(text)
+    if not spans:
+        return text[:budget]
+    chunks = [text[start:end].strip() for start, end in spans]
+
+    index = get_vector_index()
+    key = f"{doc_key}:{CHUNK_CHARS}:{CHUNK_OVERLAP}" if doc_key else index.doc_key(text)
+    rows = index.add(key, text, spans)
+    position = {row: i for i, row in enumerate(rows)}
+    _, ids = index.search(index.embedder.embed([topic]), k=len(rows), rows=rows)
+
+    picked = []
+    used = 0
+    for row in ids[0]:
+        chunk = chunks[position[int(row)]]
+        if used + len(chunk) > budget:
+            continue
+        picked.append(position[int(row)])
+        used += len(chunk) + 5
+    if not picked:
+        return chunks[position[int(ids[0][0])]][:budget]
+    return "\n...\n".join(chunks[i] for i in sorted(picked))
@@ -0,0 +1,262 @@
+import os
+import asyncio
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional
+
+from cache import CACHE_ROOT, file_digest
+from llm import MODEL_NAME
+from extraction import _pdf_filename
+from vectors import EMBEDDING_MODEL, CHUNK_CHARS, CHUNK_OVERLAP
+from analysis import ANALYSIS_CHAR_BUDGET, ANALYSIS_SOURCE_CHARS, RETRIEVAL, SYNTHESIS_GROUP_SIZE, extend_groups
+from summarize import SUMMARY_SOURCE_CHARS, SUMMARY_CHUNK_CHARS, SUMMARY_MAX_CHUNKS, REDUCE_FAN_IN
+
+# Opt-in: reviews keep their per-paper analyses and reduce outputs between
+# runs of the same session and topic
+WORKSPACE = os.getenv("REVIEW_WORKSPACE", "0") == "1"
+WORKSPACE_DIR = os.path.join(CACHE_ROOT, "workspaces")
+WORKSPACE_MAX_ANALYSES = int(os.getenv("WORKSPACE_MAX_ANALYSES", "2000"))
+MEMOS_PER_STEP = 8 # Recent outputs kept per reduce step, enough to undo a few edits
+
+def content_hash(*parts) -> str:
+    """
+    Stable hash of JSON-serializable inputs.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+def analysis_settings(topic: Optional[str], map_reduce: bool) -> list:
+    """
+    Everything besides the paper itself that an analysis depends on; a
+    change to any of it invalidates the stored analyses.
+    """
+    if map_reduce:
+        return ["map_reduce", topic, MODEL_NAME, SUMMARY_SOURCE_CHARS, SUMMARY_CHUNK_CHARS,
+                SUMMARY_MAX_CHUNKS, REDUCE_FAN_IN]
+    return ["analysis", topic, MODEL_NAME, ANALYSIS_CHAR_BUDGET, ANALYSIS_SOURCE_CHARS, RETRIEVAL,
+            EMBEDDING_MODEL, CHUNK_CHARS, CHUNK_OVERLAP, SYNTHESIS_GROUP_SIZE]
+
+def _local_pdf(paper) -> Optional[str]:
+    """
+    Path of the paper's PDF if it is already on disk, without downloading.
+    """
+    for path in (paper.get('pdf_path'), _pdf_filename(paper)):
+        if path and os.path.exists(path):
+            return path
+    return None
+
+class ReviewWorkspace:
+    """
+    Persisted state of one review, so a changed paper set costs only the delta.
+
+    Per-paper analyses are stored under a hash of the paper's PDF (or text)
+    and the analysis settings: a paper seen before is neither extracted nor
+    analyzed again. Reduce steps (synthesis, writing, critique) are memoized
+    on a hash of their inputs and re-run only when those inputs change.
+    Analyses are handed to the reduce steps in the order they were first
+    computed, and each keeps the synthesis group it was first put in, so
+    a new paper leaves the other groups (and their cached LLM calls)
+    untouched.
+
+    Entries live in SQLite, one row per analysis or memo, so recording
+    one never rewrites the others.
+    """
+
+    def __init__(self, workspace_id: str, directory: str = WORKSPACE_DIR):
+        self.workspace_id = workspace_id
+        self.path = os.path.join(directory, f"{workspace_id}.sqlite3")
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS analyses (key TEXT PRIMARY KEY, title TEXT NOT NULL, "
+                "analysis TEXT NOT NULL, added REAL NOT NULL, used REAL NOT NULL, grp INTEGER)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS analyses_used ON analyses (used)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS memos (step TEXT NOT NULL, inputs TEXT NOT NULL, "
+                "output TEXT NOT NULL, at REAL NOT NULL, PRIMARY KEY (step, inputs))"
+            )
+
+    @staticmethod
+    def id_for(topic: Optional[str], owner: Optional[str] = None) -> str:
+        """
+        Workspace id of a topic, private to owner (e.g. a session) when given.
+        """
+        return content_hash(owner or "", " ".join((topic or "").lower().split()))[:16]
+
+    def prune(self) -> None:
+        """
+        Drops the least recently used analyses beyond WORKSPACE_MAX_ANALYSES.
+        """
+        with self._lock, self._conn:
+            count = self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+            if count > WORKSPACE_MAX_ANALYSES:
+                self._conn.execute(
+                    "DELETE FROM analyses WHERE key IN (SELECT key FROM analyses ORDER BY used LIMIT ?)",
+                    (count - WORKSPACE_MAX_ANALYSES,),
+                )
+
+    # --- per-paper analyses ---
+
+    @staticmethod
+    def analysis_key(paper, settings: list) -> Optional[str]:
+        """
+        Hash of the paper's content and settings: the PDF bytes when the
+        file is on disk, otherwise the extracted text. None if neither exists.
+        """
+        pdf_path = _local_pdf(paper)
+        if pdf_path:
+            if paper.get('pdf_digest') is None:
+                paper['pdf_digest'] = file_digest(pdf_path)
+            return content_hash("pdf", paper['pdf_digest'], settings)
+        if paper.get('full_text'):
+            return content_hash("text", paper['full_text'], settings)
+        return None
+
+    def lookup(self, paper, settings: list) -> Optional[Dict[str, str]]:
+        """
+        Returns the stored analysis for paper, if any, and tags the paper
+        with its analysis_key so analyses_for() can find it.
+        """
+        try:
+            key = self.analysis_key(paper, settings)
+        except OSError as e:
+            print(f"Error reading {paper.get('title', 'Unknown')[:30]}: {e}")
+            return None
+        if not key:
+            return None
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT title, analysis FROM analyses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE analyses SET used = ? WHERE key = ?", (time.time(), key))
+        paper['analysis_key'] = key
+        paper['pdf_path'] = _local_pdf(paper)
+        return {"title": row[0], "analysis": row[1]}
+
+    def store(self, paper, settings: list, result: Optional[Dict[str, str]]) -> None:
+        if not result:
+            return
+        key = self.analysis_key(paper, settings)
+        if not key:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analyses (key, title, analysis, added, used, grp) VALUES (?, ?, ?, ?, ?, NULL)",
+                (key, result["title"], result["analysis"], now, now),
+            )
+        paper['analysis_key'] = key
+
+    def analyze_one(self, paper, settings: list, analyze_fn: Callable) -> Optional[Dict[str, str]]:
+        """
+        The stored analysis of paper, or analyze_fn(paper) stored for next time.
+        """
+        cached = self.lookup(paper, settings)
+        if cached is not None:
+            return cached
+        result = analyze_fn(paper)
+        self.store(paper, settings, result)
+        return result
+
+    async def aanalyze_one(self, paper, settings: list, analyze_fn: Callable) -> Optional[Dict[str, str]]:
+        """
+        Async version of analyze_one(); analyze_fn(paper) returns an awaitable.
+        The SQLite lookups and PDF hashing run off the event loop.
+        """
+        cached = await asyncio.to_thread(self.lookup, paper, settings)
+        if cached is not None:
+            return cached
+        result = await analyze_fn(paper)
+        await asyncio.to_thread(self.store, paper, settings, result)
+        return result
+
+    def _entries(self, papers: List[dict]) -> List[Dict]:
+        # Called with the lock held; stored analyses of papers, oldest first
+        keys = list({p['analysis_key']: None for p in papers if p.get('analysis_key')})
+        entries = []
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            entries.extend(
+                {"key": row[0], "title": row[1], "analysis": row[2], "added": row[3], "grp": row[4]}
+                for row in self._conn.execute(
+                    f"SELECT key, title, analysis, added, grp FROM analyses WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                )
+            )
+        return sorted(entries, key=lambda e: e["added"])
+
+    def analyses_for(self, papers: List[dict]) -> List[Dict[str, str]]:
+        """
+        Stored analyses of papers, oldest first.
+        """
+        with self._lock:
+            entries = self._entries(papers)
+        return [{"title": e["title"], "analysis": e["analysis"]} for e in entries]
+
+    def groups_for(self, papers: List[dict], group_size: int = SYNTHESIS_GROUP_SIZE) -> List[List[Dict[str, str]]]:
+        """
+        Stored analyses of papers in synthesis groups. Analyses keep the
+        group they were first put in; new ones join existing groups via
+        extend_groups(), and the assignment is stored for the next run.
+        """
+        with self._lock:
+            entries = self._entries(papers)
+            grouped: Dict[int, List[Dict]] = {}
+            new = []
+            for entry in entries:
+                (grouped.setdefault(entry["grp"], []) if entry["grp"] is not None else new).append(entry)
+            ids = sorted(grouped)
+            groups = extend_groups([grouped[g] for g in ids], new, group_size)
+            if new:
+                next_id = (self._conn.execute("SELECT MAX(grp) FROM analyses").fetchone()[0] or 0) + 1
+                ids += range(next_id, next_id + len(groups) - len(ids))
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE analyses SET grp = ? WHERE key = ?",
+                        [(ids[i], e["key"]) for i, group in enumerate(groups) for e in group if e["grp"] != ids[i]],
+                    )
+        return [[{"title": e["title"], "analysis": e["analysis"]} for e in group] for group in groups]
+
+    # --- reduce steps ---
+
+    def recall(self, step: str, inputs) -> Optional[object]:
+        """
+        Returns the stored output of step for these inputs, if any.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT output FROM memos WHERE step = ? AND inputs = ?",
+                                     (step, content_hash(inputs))).fetchone()
+        if row is not None:
+            print(f"Workspace: inputs of {step} unchanged, reusing its output.")
+            return json.loads(row[0])
+        return None
+
+    def remember(self, step: str, inputs, output) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO memos (step, inputs, output, at) VALUES (?, ?, ?, ?)",
+                               (step, content_hash(inputs), json.dumps(output), time.time()))
+            self._conn.execute(
+                "DELETE FROM memos WHERE step = ? AND inputs NOT IN "
+                "(SELECT inputs FROM memos WHERE step = ? ORDER BY at DESC LIMIT ?)",
+                (step, step, MEMOS_PER_STEP),
+            )
+
+_workspaces: Dict[str, ReviewWorkspace] = {}
+_workspaces_lock = threading.Lock()
+
+def get_workspace(workspace_id: Optional[str]) -> Optional[ReviewWorkspace]:
+    """
+    Returns the shared ReviewWorkspace for workspace_id, or None without an id.
+    """
+    if not workspace_id:
+        return None
+    with _workspaces_lock:
+        if workspace_id not in _workspaces:
+            _workspaces[workspace_id] = ReviewWorkspace(workspace_id)
+        return _workspaces[workspace_id]
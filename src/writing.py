@@ -1,26 +1,94 @@
-from llm import get_llm
+import asyncio
+from typing import Dict, List, Optional
+from llm import complete, acomplete
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
-def write_review_section(section_name: str, synthesis: str, context: str = "") -> str:
-    """
-    Generates a specific section of the review.
-    """
-    llm = get_llm(temperature=0.3)
-    
+# Review sections in output order. Each one is written from the synthesis;
+# sections listed in depends_on are passed in as context and waited for.
+DEFAULT_SECTIONS = [
+    {"name": "Abstract", "prompt": "Abstract", "depends_on": []},
+    {"name": "Methodology", "prompt": "Methodology Comparison", "depends_on": []},
+    {"name": "Results", "prompt": "Results Synthesis", "depends_on": []},
+]
+
+def _section_prompt(section_name: str, synthesis: str, context: str = ""):
     prompt = ChatPromptTemplate.from_messages([
         ("system", f"Write {section_name}. Max 100 words."),
         ("user", "{content}")
     ])
-    
+    short_synthesis = synthesis[:800]
+    if context:
+        short_synthesis += f"\n\nPreceding sections:\n{context}"
+    return prompt.invoke({"content": short_synthesis})
+
+def write_review_section(section_name: str, synthesis: str, context: str = "", on_partial=None) -> str:
+    """
+    Generates a specific section of the review.
+    on_partial, if given, receives the section text as it streams in.
+    """
     try:
-        short_synthesis = synthesis[:800]
-        formatted_prompt = prompt.invoke({"content": short_synthesis})
-        response = llm.invoke(formatted_prompt)
-        return response.content
+        return complete(_section_prompt(section_name, synthesis, context), temperature=0.3, on_partial=on_partial)
     except Exception as e:
         return f"Error writing {section_name}: {e}"
 
+async def awrite_review_section(section_name: str, synthesis: str, context: str = "", on_partial=None) -> str:
+    """
+    Async version of write_review_section().
+    """
+    try:
+        return await acomplete(_section_prompt(section_name, synthesis, context), temperature=0.3, on_partial=on_partial)
+    except Exception as e:
+        return f"Error writing {section_name}: {e}"
+
+def validate_sections(sections: List[dict]) -> None:
+    """
+    Raises ValueError if a section depends on an unknown section or the dependencies form a cycle.
+    """
+    names = [s['name'] for s in sections]
+    deps = {s['name']: list(s.get('depends_on', [])) for s in sections}
+    for name, required in deps.items():
+        for dep in required:
+            if dep not in deps:
+                raise ValueError(f"Section '{name}' depends on unknown section '{dep}'")
+
+    visiting, done = set(), set()
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Section dependency cycle involving '{name}'")
+        visiting.add(name)
+        for dep in deps[name]:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+    for name in names:
+        visit(name)
+
+async def write_sections(synthesis: str, sections: Optional[List[dict]] = None, on_partial=None) -> Dict[str, str]:
+    """
+    Writes all review sections concurrently. A section starts as soon as the
+    sections it depends on are finished, so independent sections cost one
+    LLM round-trip in total. on_partial(name, text) receives streamed text.
+    Returns {section name: text} in the configured order.
+    """
+    sections = sections or DEFAULT_SECTIONS
+    validate_sections(sections)
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def write(section):
+        context = ""
+        for dep in section.get('depends_on', []):
+            context += f"{dep}:\n{await tasks[dep]}\n\n"
+        callback = (lambda text: on_partial(section['name'], text)) if on_partial else None
+        return await awrite_review_section(section.get('prompt', section['name']), synthesis, context.strip(), on_partial=callback)
+
+    for section in sections:
+        tasks[section['name']] = asyncio.ensure_future(write(section))
+    await asyncio.gather(*tasks.values())
+    return {name: task.result() for name, task in tasks.items()}
+
 def format_references(papers: list) -> str:
     """
     Formats the list of papers into APA style references.
@@ -0,0 +1,35 @@
+import os
+import sys
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from analysis import pack_batches, parse_batch_response
+
+def test_parses_fenced_array_with_chatter():
+    response = 'Here you go:\n```json\n[{"id": 1, "analysis": " First. "}, {"id": 2, "analysis": "Second [see 3]."}]\n```\nDone.'
+    assert parse_batch_response(response, 2) == {1: "First.", 2: "Second [see 3]."}
+
+def test_keeps_complete_objects_of_a_truncated_reply():
+    response = '[{"id": 1, "analysis": "Uses {braces} and ]."}, {"id": 2, "analysis": "Cut off mid-sent'
+    assert parse_batch_response(response, 2) == {1: "Uses {braces} and ]."}
+
+def test_skips_malformed_and_out_of_range_entries():
+    response = ('[{"id": "x", "analysis": "bad id"}, {"id": 3, "analysis": "no such paper"}, '
+                '{"id": 1, "analysis": ""}, {"id": 2, "analysis": "ok"}, {"id": 1 "analysis": "broken"}]')
+    assert parse_batch_response(response, 2) == {2: "ok"}
+    assert parse_batch_response("I cannot help with that.", 2) == {}
+
+def test_pack_batches_respects_the_budget():
+    items = [{"title": f"T{i}", "text": "x" * size} for i, size in enumerate([40, 40, 10, 200, 5])]
+    batches = pack_batches(items, context_budget=100)
+    # An item larger than the budget still gets a batch of its own
+    assert [[item["title"] for item in batch] for batch in batches] == [["T0", "T1", "T2"], ["T3"], ["T4"]]
+    assert pack_batches([], context_budget=100) == []
+
+if __name__ == "__main__":
+    test_parses_fenced_array_with_chatter()
+    test_keeps_complete_objects_of_a_truncated_reply()
+    test_skips_malformed_and_out_of_range_entries()
+    test_pack_batches_respects_the_budget()
+    print("All analysis tests passed!")
@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import tempfile
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from cache import ExtractionCache, ResponseCache
+
+def test_eviction_keeps_recently_used_entries():
+    with tempfile.TemporaryDirectory() as tmp:
+        # Random-looking text so compression can't shrink it below the budget
+        texts = {f"doc{i}": os.urandom(3000).hex() for i in range(4)}
+        cache = ExtractionCache(tmp, max_bytes=11000)
+        for i, (digest, text) in enumerate(texts.items()):
+            cache.put(digest, text)
+            if i == 1:
+                time.sleep(0.05)
+                assert cache.get("doc0") == texts["doc0"]  # Touch doc0 so doc1 is the oldest
+            time.sleep(0.05)
+
+        assert cache.get("doc1") is None
+        assert cache.get("doc0") == texts["doc0"]
+        assert cache.get("doc3") == texts["doc3"]
+        assert cache._total <= cache.max_bytes
+
+def test_response_cache_prunes_periodically():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache("test", max_entries=300, path=os.path.join(tmp, "responses.sqlite3"))
+        assert cache.prune_every == 3
+        for i in range(1000):
+            cache.put(str(i), "value")
+            rows = cache._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            assert rows <= cache.max_entries + cache.prune_every
+        assert cache.get("999") == "value" and cache.get("0") is None
+
+def test_response_cache_batches_in_one_transaction():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache("test", path=os.path.join(tmp, "responses.sqlite3"))
+        statements = []
+        cache._conn.set_trace_callback(statements.append)
+        cache.put_many({f"paper-{i}": f"record {i}" for i in range(50)})
+        assert statements.count("COMMIT") == 1
+        found = cache.get_many(["paper-3", "missing", "paper-49"])
+        assert found == {"paper-3": "record 3", "paper-49": "record 49"}
+        assert statements.count("COMMIT") == 2
+
+if __name__ == "__main__":
+    test_eviction_keeps_recently_used_entries()
+    test_response_cache_prunes_periodically()
+    test_response_cache_batches_in_one_transaction()
+    print("All cache tests passed!")
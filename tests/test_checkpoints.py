@@ -0,0 +1,154 @@
+import os
+import sys
+import sqlite3
+import hashlib
+import time
+import tempfile
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from papers import TextStore
+from checkpoints import TextRefSerializer, checkpoint_time, compact_text_store, prune_checkpoints, run_config
+from graph.graph import build_graph
+
+LONG_TEXT = "Findings of the paper. " * 500
+
+def make_serde(tmp):
+    return TextRefSerializer(TextStore(os.path.join(tmp, "text")))
+
+def test_full_text_is_stored_by_reference():
+    with tempfile.TemporaryDirectory() as tmp:
+        serde = make_serde(tmp)
+        papers = [{"title": "A", "full_text": LONG_TEXT}, {"title": "B", "full_text": "short"}]
+        type_, data = serde.dumps_typed(papers)
+        assert len(data) < 1000
+        assert papers[0]["full_text"] == LONG_TEXT  # The live state is left alone
+
+        # Another process reads the same store
+        assert make_serde(tmp).loads_typed((type_, data)) == papers
+
+class FlakyNodes:
+    """Records node calls; analyze fails on its first call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def node(self, name, update):
+        def run(state):
+            self.calls.append(name)
+            if name == "analyze" and self.calls.count("analyze") == 1:
+                raise ConnectionError("transient")
+            return update
+        return run
+
+def test_failed_run_resumes_after_last_completed_node():
+    with tempfile.TemporaryDirectory() as tmp:
+        nodes = FlakyNodes()
+        saver = SqliteSaver(sqlite3.connect(os.path.join(tmp, "checkpoints.sqlite"), check_same_thread=False),
+                            serde=make_serde(tmp))
+        graph = build_graph({
+            "search": nodes.node("search", {"papers": [{"title": "A"}]}),
+            "extract": nodes.node("extract", {"papers": [{"title": "A", "full_text": LONG_TEXT}]}),
+            "analyze": nodes.node("analyze", {"synthesis": "S"}),
+            "pipeline": nodes.node("pipeline", {}),
+            "write": nodes.node("write", {"final_review": "R"}),
+            "critique": nodes.node("critique", {"critique": "C"}),
+            "revise": nodes.node("revise", {}),
+        }, saver)
+        config = run_config("run-1")
+
+        try:
+            graph.invoke({"topic": "agents", "streaming": False}, config)
+            assert False, "analyze should have failed"
+        except ConnectionError:
+            pass
+        assert graph.get_state(config).next == ("analyze",)
+
+        final = graph.invoke(None, config)
+        assert nodes.calls == ["search", "extract", "analyze", "analyze", "write", "critique"]
+        assert final["final_review"] == "R"
+        assert final["papers"][0]["full_text"] == LONG_TEXT
+
+def test_compaction_keeps_checkpointed_texts():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "checkpoints.sqlite")
+        saver = SqliteSaver(sqlite3.connect(db_path, check_same_thread=False), serde=make_serde(tmp))
+        graph = build_graph({
+            "search": lambda state: {"papers": [{"title": "A", "full_text": LONG_TEXT}]},
+            "extract": lambda state: {},
+            "analyze": lambda state: {"synthesis": "S"},
+            "pipeline": lambda state: {},
+            "write": lambda state: {"final_review": "R"},
+            "critique": lambda state: {"critique": "C"},
+            "revise": lambda state: {},
+        }, saver)
+        graph.invoke({"topic": "agents", "streaming": False}, run_config("run-1"))
+        orphan = TextStore(os.path.join(tmp, "text")).put("No run refers to this. " * 100)
+
+        store = TextStore(os.path.join(tmp, "text"))
+        assert compact_text_store(store, db_path) > 0
+        assert store.get(orphan) is None
+        state = graph.get_state(run_config("run-1")).values
+        assert state["papers"][0]["full_text"] == LONG_TEXT
+
+def test_abandoned_runs_are_pruned_after_the_ttl():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "checkpoints.sqlite")
+        saver = SqliteSaver(sqlite3.connect(db_path, check_same_thread=False), serde=make_serde(tmp))
+        graph = build_graph({name: (lambda state: {}) for name in
+                             ("search", "extract", "analyze", "pipeline", "write", "critique", "revise")}, saver)
+        start = time.time()
+        graph.invoke({"topic": "agents", "streaming": False}, run_config("old"))
+        checkpoint_id = saver.get_tuple(run_config("old")).config["configurable"]["checkpoint_id"]
+        assert abs(checkpoint_time(checkpoint_id) - start) < 60
+
+        assert prune_checkpoints(db_path, ttl=3600) == 0
+        assert saver.get_tuple(run_config("old")) is not None
+        assert prune_checkpoints(db_path, ttl=3600, now=start + 7200) == 1
+        assert saver.get_tuple(run_config("old")) is None
+
+def test_texts_of_finished_and_pruned_runs_are_reclaimed():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "checkpoints.sqlite")
+        saver = SqliteSaver(sqlite3.connect(db_path, check_same_thread=False), serde=make_serde(tmp))
+        texts = {}
+
+        def run(run_id):
+            texts[run_id] = f"Findings of {run_id}. " * 200
+            graph = build_graph({
+                "search": lambda state: {"papers": [{"title": run_id, "full_text": texts[run_id]}]},
+                **{name: (lambda state: {}) for name in ("extract", "analyze", "pipeline", "write", "critique", "revise")},
+            }, saver)
+            graph.invoke({"topic": "agents", "streaming": False}, run_config(run_id))
+
+        start = time.time()
+        for run_id in ("finished", "abandoned", "resumable"):
+            run(run_id)
+        saver.delete_thread("finished")  # As app.py does when a run completes
+        # Only "abandoned" has been idle past the TTL an hour from now
+        conn = sqlite3.connect(db_path)
+        with conn:
+            conn.execute("UPDATE checkpoints SET checkpoint_id = ? || substr(checkpoint_id, 9) WHERE thread_id = 'abandoned'",
+                         ("00000000",))
+        conn.close()
+
+        store = TextStore(os.path.join(tmp, "text"))
+        size = os.path.getsize(store.path)
+        assert compact_text_store(store, db_path, ttl=3600, now=start) > size / 2
+
+        fresh = TextStore(os.path.join(tmp, "text"))
+        handles = {run_id: hashlib.sha256(text.encode()).hexdigest() for run_id, text in texts.items()}
+        assert fresh.get(handles["resumable"]) == texts["resumable"]
+        assert fresh.get(handles["finished"]) is None and fresh.get(handles["abandoned"]) is None
+        assert saver.get_tuple(run_config("abandoned")) is None
+
+if __name__ == "__main__":
+    test_full_text_is_stored_by_reference()
+    test_failed_run_resumes_after_last_completed_node()
+    test_compaction_keeps_checkpointed_texts()
+    test_abandoned_runs_are_pruned_after_the_ttl()
+    test_texts_of_finished_and_pruned_runs_are_reclaimed()
+    print("All checkpoint tests passed!")
@@ -0,0 +1,148 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from download import AsyncDownloader, is_valid_pdf
+
+PDF_BYTES = b"%PDF-1.4\n" + os.urandom(256 * 1024) + b"\n%%EOF\n"
+SLOW_SECONDS = 0.1
+
+class PdfHandler(BaseHTTPRequestHandler):
+    """
+    Serves PDF_BYTES with Range support and records the requests it sees.
+    Paths under /slow/ wait SLOW_SECONDS first, counting how many are in
+    flight at once.
+    """
+    requests_seen = []
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        PdfHandler.requests_seen.append((self.path, range_header))
+        if self.path.startswith("/slow/"):
+            with PdfHandler.lock:
+                PdfHandler.active += 1
+                PdfHandler.max_active = max(PdfHandler.max_active, PdfHandler.active)
+            time.sleep(SLOW_SECONDS)
+            with PdfHandler.lock:
+                PdfHandler.active -= 1
+        if self.path == "/broken.pdf":
+            # Advertise the full body but drop the connection half way
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(PDF_BYTES)))
+            self.end_headers()
+            self.wfile.write(PDF_BYTES[:1000])
+            self.wfile.flush()
+            self.connection.close()
+            return
+
+        start = 0
+        if range_header:
+            start = int(range_header.split("=")[1].split("-")[0])
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(PDF_BYTES) - 1}/{len(PDF_BYTES)}")
+        else:
+            self.send_response(200)
+        body = PDF_BYTES[start:]
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PdfHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def _download(url, path, **kwargs):
+    downloader = AsyncDownloader(**kwargs)
+    try:
+        return await downloader.download(url, path)
+    finally:
+        await downloader.aclose()
+
+def test_download_writes_verified_pdf():
+    server, base = start_server()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "paper.pdf")
+        assert run(_download(f"{base}/paper.pdf", path))
+        assert open(path, 'rb').read() == PDF_BYTES
+        assert not os.path.exists(f"{path}.part")
+    server.shutdown()
+
+def test_existing_verified_pdf_skips_fetch():
+    server, base = start_server()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "paper.pdf")
+        with open(path, 'wb') as f:
+            f.write(PDF_BYTES)
+        PdfHandler.requests_seen = []
+        assert run(_download(f"{base}/paper.pdf", path))
+        assert PdfHandler.requests_seen == []
+    server.shutdown()
+
+def test_resumes_from_partial_file():
+    server, base = start_server()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "paper.pdf")
+        with open(f"{path}.part", 'wb') as f:
+            f.write(PDF_BYTES[:100000])
+        PdfHandler.requests_seen = []
+        assert run(_download(f"{base}/paper.pdf", path))
+        assert PdfHandler.requests_seen == [("/paper.pdf", "bytes=100000-")]
+        assert open(path, 'rb').read() == PDF_BYTES
+    server.shutdown()
+
+def test_failed_download_leaves_no_pdf():
+    server, base = start_server()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "paper.pdf")
+        assert not run(_download(f"{base}/broken.pdf", path, retries=1))
+        assert not os.path.exists(path)
+    server.shutdown()
+
+def test_downloads_overlap_up_to_the_host_limit():
+    server, base = start_server()
+    PdfHandler.max_active = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        async def fetch_all():
+            downloader = AsyncDownloader(per_host_limit=8)
+            try:
+                return await asyncio.gather(*[
+                    downloader.download(f"{base}/slow/{i}.pdf", os.path.join(tmp, f"{i}.pdf")) for i in range(20)
+                ])
+            finally:
+                await downloader.aclose()
+
+        start = time.perf_counter()
+        results = run(fetch_all())
+        elapsed = time.perf_counter() - start
+        assert all(results)
+        assert all(is_valid_pdf(os.path.join(tmp, f"{i}.pdf")) for i in range(20))
+        assert 1 < PdfHandler.max_active <= 8
+        # One at a time would take 20 * SLOW_SECONDS
+        assert elapsed < 10 * SLOW_SECONDS
+    server.shutdown()
+
+if __name__ == "__main__":
+    test_download_writes_verified_pdf()
+    test_existing_verified_pdf_skips_fetch()
+    test_resumes_from_partial_file()
+    test_failed_download_leaves_no_pdf()
+    test_downloads_overlap_up_to_the_host_limit()
+    print("All download tests passed!")
@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+import signal
+import tempfile
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import pymupdf
+import extraction
+from cache import ExtractionCache, file_digest
+from extraction import run_with_deadline, ExtractionTimeout, submit_partial_extraction, load_partial
+
+def test_deadline_interrupts_an_overrunning_conversion():
+    start = time.monotonic()
+    try:
+        run_with_deadline(time.sleep, 0.2, 5)
+        assert False, "should have timed out"
+    except ExtractionTimeout:
+        pass
+    assert time.monotonic() - start < 1.0
+    assert run_with_deadline(sum, 0.2, [1, 2]) == 3
+
+def test_deadline_starts_when_the_worker_does():
+    # The second task waits 0.3s in the queue; only its own 0.3s of work counts
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1) as pool:
+        futures = [pool.submit(run_with_deadline, time.sleep, 0.5, 0.3) for _ in range(2)]
+        assert [f.result() for f in futures] == [None, None]
+
+def stuck_conversion(seconds):
+    # Like a native call that never returns: the deadline's SIGALRM cannot interrupt it
+    extraction.WATCHDOG_GRACE = 0.2
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+    return run_with_deadline(time.sleep, 0.2, seconds)
+
+def slow_sum(values):
+    time.sleep(1.0)
+    return sum(values)
+
+def test_a_stuck_conversion_does_not_fail_its_neighbours():
+    stuck = extraction._submit_to_pool(stuck_conversion, 30, timed=True)
+    healthy = [extraction._submit_to_pool(run_with_deadline, slow_sum, 5, [i, 1], timed=True) for i in range(3)]
+    untimed = extraction._submit_to_pool(slow_sum, [1, 1])
+    assert [f.result(timeout=30) for f in healthy] == [1, 2, 3]
+    assert untimed.result(timeout=30) == 2
+    try:
+        stuck.result(timeout=30)
+        assert False, "the stuck conversion should fail"
+    except BrokenProcessPool:
+        pass
+
+def make_pdf(path, pages):
+    doc = pymupdf.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"Page {i + 1} reports finding number {i + 1}.")
+    doc.save(path)
+    doc.close()
+
+def test_partial_extraction_is_cached_and_resumed():
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "paper.pdf")
+        make_pdf(pdf_path, 6)
+        digest = file_digest(pdf_path)
+        saved = extraction.extraction_cache
+        extraction.extraction_cache = ExtractionCache(os.path.join(tmp, "cache"))
+        try:
+            text, next_page, page_count = submit_partial_extraction(pdf_path, 10).result()
+            assert "finding number 1" in text and next_page < page_count == 6
+            assert load_partial(digest) == (text, next_page, page_count)
+
+            # A budget the cached pages already cover needs no conversion
+            assert submit_partial_extraction(pdf_path, 10).done()
+
+            more, more_next, _ = submit_partial_extraction(pdf_path, len(text) + 10).result()
+            assert more.startswith(text) and more_next > next_page
+
+            full, _, _ = submit_partial_extraction(pdf_path, 10 ** 6).result()
+            assert "finding number 6" in full
+            assert extraction.extraction_cache.get(digest) == full
+        finally:
+            extraction.extraction_cache = saved
+
+def test_text_budget_for_the_stages_a_run_uses():
+    saved = dict(extraction._text_budgets)
+    try:
+        extraction._text_budgets.clear()
+        extraction.register_text_budget("analysis", 12000)
+        extraction.register_text_budget("summary", tokens=50000)
+        assert extraction.get_text_budget(["analysis"]) == 12000
+        assert extraction.get_text_budget(["summary"]) == 200000
+        assert extraction.get_text_budget() == 200000
+        assert extraction.get_text_budget(["unknown"]) is None
+    finally:
+        extraction._text_budgets.clear()
+        extraction._text_budgets.update(saved)
+
+if __name__ == "__main__":
+    test_deadline_interrupts_an_overrunning_conversion()
+    test_deadline_starts_when_the_worker_does()
+    test_a_stuck_conversion_does_not_fail_its_neighbours()
+    test_partial_extraction_is_cached_and_resumed()
+    test_text_budget_for_the_stages_a_run_uses()
+    print("All extraction tests passed!")
@@ -0,0 +1,118 @@
+import os
+import sys
+import tempfile
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from cache import ExtractionCache, file_digest
+from extraction import PARTIAL_SUFFIX
+from index import LocalIndex, _decode_postings, _encode_varint
+
+DOCS = {
+    "agents": "# Agentic Workflows\nLLM agents plan, call tools and revise their output. Agents agents.",
+    "vision": "# Image Segmentation\nConvolutional networks for medical image segmentation.",
+    "survey": "# A Survey of Tool Use\nLanguage models that call tools: a survey of tool-using agents.",
+}
+
+def make_corpus(tmp):
+    pdf_dir = os.path.join(tmp, "pdfs")
+    os.makedirs(pdf_dir)
+    cache = ExtractionCache(os.path.join(tmp, "extraction"))
+    for name, text in DOCS.items():
+        path = os.path.join(pdf_dir, f"{name}.pdf")
+        with open(path, 'wb') as f:
+            f.write(f"%PDF-1.4 {name}".encode())
+        cache.put(file_digest(path), text)
+    return pdf_dir, cache
+
+def test_postings_round_trip():
+    data = bytearray()
+    prev = 0
+    for doc_id, tf in [(0, 1), (3, 300), (70000, 2)]:
+        _encode_varint(doc_id - prev, data)
+        _encode_varint(tf, data)
+        prev = doc_id
+    assert _decode_postings(bytes(data)) == [(0, 1), (3, 300), (70000, 2)]
+
+def test_bm25_ranking_and_persistence():
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_dir, cache = make_corpus(tmp)
+        index = LocalIndex(os.path.join(tmp, "index"), pdf_dir, cache)
+        assert index.refresh() == 3
+
+        hits = index.search("agents tools")
+        assert [doc["paperId"] for _, doc in hits] == ["agents", "survey"]
+        assert hits[0][1]["title"] == "Agentic Workflows"
+        assert index.search("segmentation agents", min_match=1.0) == []
+
+        # Reloaded from disk, nothing to re-index
+        reloaded = LocalIndex(os.path.join(tmp, "index"), pdf_dir, cache)
+        assert reloaded.refresh() == 0
+        assert [doc["paperId"] for _, doc in reloaded.search("agents tools")] == ["agents", "survey"]
+
+def test_refresh_is_incremental():
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_dir, cache = make_corpus(tmp)
+        index = LocalIndex(os.path.join(tmp, "index"), pdf_dir, cache)
+        index.refresh()
+
+        os.remove(os.path.join(pdf_dir, "agents.pdf"))
+        new_path = os.path.join(pdf_dir, "uncached.pdf")
+        with open(new_path, 'wb') as f:
+            f.write(b"%PDF-1.4 uncached")
+        assert index.refresh() == 0
+        assert [doc["paperId"] for _, doc in index.search("agents tools")] == ["survey"]
+        # Document frequencies match an index built from the remaining files
+        rebuilt = LocalIndex(os.path.join(tmp, "rebuilt"), pdf_dir, cache)
+        rebuilt.refresh()
+        assert {t: df for t, df in index._df.items() if df} == rebuilt._df
+
+        # Indexed once its extraction shows up in the cache
+        cache.put(file_digest(new_path), "# Planning Agents\nAgents that plan with tools.")
+        assert index.refresh() == 1
+        assert {doc["paperId"] for _, doc in index.search("agents tools")} == {"survey", "uncached"}
+
+def test_partial_extraction_is_indexed_until_the_full_text_arrives():
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_dir, cache = make_corpus(tmp)
+        path = os.path.join(pdf_dir, "lazy.pdf")
+        with open(path, 'wb') as f:
+            f.write(b"%PDF-1.4 lazy")
+        digest = file_digest(path)
+        cache.put(digest + PARTIAL_SUFFIX, "2 9\n# Robot Planning\nFirst pages only.")
+        index = LocalIndex(os.path.join(tmp, "index"), pdf_dir, cache)
+        index.refresh()
+        assert [doc["paperId"] for _, doc in index.search("robot planning")] == ["lazy"]
+        assert index.search("appendix grasping") == []
+
+        cache.put(digest, "# Robot Planning\nFirst pages only. Appendix on grasping.")
+        assert index.refresh() == 1
+        assert [doc["paperId"] for _, doc in index.search("appendix grasping")] == ["lazy"]
+        assert index.live_docs == 4
+
+def test_refresh_if_stale_skips_unchanged_directory():
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_dir, cache = make_corpus(tmp)
+        index = LocalIndex(os.path.join(tmp, "index"), pdf_dir, cache)
+        assert index.refresh_if_stale(60) == 3
+
+        path = os.path.join(pdf_dir, "late.pdf")
+        with open(path, 'wb') as f:
+            f.write(b"%PDF-1.4 late")
+        cache.put(file_digest(path), "# Late Arrival\nAgents.")
+        assert index.refresh_if_stale(60) == 1  # The directory changed
+
+        last = index._refreshed
+        assert index.refresh_if_stale(60) == 0
+        assert index._refreshed == last  # Nothing re-read within the interval
+        index.refresh_if_stale(0)
+        assert index._refreshed != last
+
+if __name__ == "__main__":
+    test_postings_round_trip()
+    test_bm25_ranking_and_persistence()
+    test_refresh_is_incremental()
+    test_partial_extraction_is_indexed_until_the_full_text_arrives()
+    test_refresh_if_stale_skips_unchanged_directory()
+    print("All index tests passed!")
@@ -0,0 +1,72 @@
+import os
+import sys
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+os.environ.setdefault("SAMBANOVA_API_KEY", "test-key")
+import llm
+from llm import get_llm, get_async_llm, llm_client_metrics
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """Answers every request on a persistent HTTP/1.1 connection."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+def delta(before, after):
+    return {name: after[name] - before[name] for name in after}
+
+def test_clients_are_counted_once_per_settings():
+    before = llm_client_metrics()
+    first = get_llm(temperature=0.11)
+    assert get_llm(temperature=0.11) is first
+    assert get_llm(temperature=0.12) is not first
+    counts = delta(before, llm_client_metrics())
+    assert counts["clients_created"] == 2 and counts["clients_reused"] == 1
+
+def test_pooled_connections_are_counted_as_reused():
+    server, url = start_server()
+    try:
+        before = llm_client_metrics()
+        client = llm._shared_http_client()
+        for _ in range(3):
+            assert client.get(url).text == "ok"
+        counts = delta(before, llm_client_metrics())
+        assert counts["requests"] == 3
+        assert counts["connections_opened"] == 1 and counts["connections_reused"] == 2
+
+        async def three_requests():
+            get_async_llm(temperature=0.11)
+            client = llm._async_clients[asyncio.get_running_loop()]["http"]
+            for _ in range(3):
+                assert (await client.get(url)).text == "ok"
+            await client.aclose()
+
+        before = llm_client_metrics()
+        asyncio.run(three_requests())
+        counts = delta(before, llm_client_metrics())
+        assert counts["requests"] == 3
+        assert counts["connections_opened"] == 1 and counts["connections_reused"] == 2
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    test_clients_are_counted_once_per_settings()
+    test_pooled_connections_are_counted_as_reused()
+    print("All LLM client tests passed!")
@@ -0,0 +1,110 @@
+import os
+import sys
+import tempfile
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from papers import PaperRecord, TextStore
+from checkpoints import TextRefSerializer
+
+TEXT = "# Results\n\nAgents solved 42% of the tasks. " * 200
+
+def test_text_store_is_content_addressed_and_persistent():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TextStore(tmp)
+        handle = store.put(TEXT)
+        assert store.put(TEXT) == handle
+        empty = store.put("")
+        size = os.path.getsize(store.path)
+
+        # A second store (another process) scans the same file
+        other = TextStore(tmp)
+        assert other.get(handle) == TEXT and other.get(empty) == ""
+        late = store.put("added later é")
+        assert other.get(late) == "added later é"
+        assert other.get("0" * 64) is None
+        assert os.path.getsize(store.path) > size
+
+def test_scan_resyncs_after_a_torn_write():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TextStore(tmp)
+        first = store.put("first text")
+        # A writer that died halfway through an entry, followed by a good one
+        torn = store._entry(b"\x01" * 32, store.NO_BASE, "never finished".encode())
+        with open(store.path, 'ab') as f:
+            f.write(torn[:len(torn) // 2])
+        second = store.put("second text")
+
+        other = TextStore(tmp)
+        assert other.get(first) == "first text" and other.get(second) == "second text"
+        assert len(other._offsets) == 2
+
+def test_grown_text_stores_only_the_suffix():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TextStore(tmp)
+        paper = PaperRecord({"title": "A"}, store=store)
+        paper["full_text"] = TEXT
+        size = os.path.getsize(store.path)
+        paper["full_text"] = TEXT + "Appendix."
+        assert os.path.getsize(store.path) - size < 200
+        assert TextStore(tmp).get(paper.text_handle) == TEXT + "Appendix."
+        # The handle is the same as for the whole text stored at once
+        assert TextStore(tmp).put(TEXT + "Appendix.") == paper.text_handle
+
+def test_compact_keeps_referenced_texts():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TextStore(tmp)
+        dropped = store.put("dropped " * 100)
+        base = store.put(TEXT)
+        grown = store.put(TEXT + "More.", base=base)
+
+        fresh = TextStore(tmp)  # Has used nothing yet
+        assert fresh.compact([grown]) > 0
+        assert fresh.get(grown) == TEXT + "More." and fresh.get(dropped) is None
+        assert base in fresh and fresh.compact([grown]) == 0
+        # The writer notices the file was replaced
+        assert store.get(grown) == TEXT + "More." and store.get(dropped) is None
+
+def test_record_behaves_like_a_paper_dict():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TextStore(tmp)
+        paper = PaperRecord({"title": "A", "year": None, "venue_note": "extra"}, store=store)
+        assert not hasattr(paper, "__dict__")
+        assert paper.get("year", "n.d.") is None  # Present but None, as in a dict
+        assert paper.get("url", "") == "" and "url" not in paper
+        assert paper["venue_note"] == "extra"
+
+        assert paper.get("full_text", "") == "" and "full_text" not in paper
+        paper["full_text"] = TEXT
+        paper["pages_extracted"] = 3
+        assert paper["full_text"] == TEXT and paper.text_handle in store
+        paper["full_text"] = paper.get("full_text", "") + "More."
+        assert paper["full_text"].endswith("More.")
+        assert paper.pop("pages_extracted", None) == 3 and paper.pop("pages_extracted", None) is None
+
+        paper.update({"pdf_path": "a.pdf"})
+        assert set(paper) == {"title", "year", "pdf_path", "full_text", "venue_note"}
+        assert dict(paper)["full_text"].endswith("More.")
+
+def test_checkpoint_keeps_only_the_handle():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TextStore(tmp)
+        serde = TextRefSerializer(store)
+        paper = PaperRecord({"title": "A", "authors": ["X"], "full_text": TEXT}, store=store)
+        type_, data = serde.dumps_typed([paper])
+        assert len(data) < 500
+
+        restored = serde.loads_typed((type_, data))[0]
+        assert isinstance(restored, PaperRecord)
+        assert restored.text_handle == paper.text_handle
+        assert restored["full_text"] == TEXT and restored["authors"] == ["X"]
+
+if __name__ == "__main__":
+    test_text_store_is_content_addressed_and_persistent()
+    test_scan_resyncs_after_a_torn_write()
+    test_grown_text_stores_only_the_suffix()
+    test_compact_keeps_referenced_texts()
+    test_record_behaves_like_a_paper_dict()
+    test_checkpoint_keeps_only_the_handle()
+    print("All paper record tests passed!")
@@ -0,0 +1,59 @@
+import os
+import sys
+import tempfile
+import threading
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import pymupdf
+import pipeline
+import extraction
+from cache import ExtractionCache
+from pipeline import run_streaming_pipeline
+
+def make_pdf(path, text):
+    doc = pymupdf.open()
+    doc.new_page().insert_text((72, 72), text)
+    doc.save(path)
+    doc.close()
+
+def test_first_paper_is_analyzed_before_the_last_one_arrives():
+    with tempfile.TemporaryDirectory() as tmp:
+        pdfs = {}
+        for i in range(4):
+            pdfs[f"p{i}"] = os.path.join(tmp, f"p{i}.pdf")
+            make_pdf(pdfs[f"p{i}"], f"Paper {i} reports finding number {i}.")
+        first_analyzed = threading.Event()
+        events = []
+
+        def papers():
+            for i in range(4):
+                if i == 3:
+                    # Only a pipeline gets here: p0 went through download, extraction and analysis on its own
+                    events.append(("analyzed p0 before p3 arrived", first_analyzed.wait(30)))
+                yield {"title": f"p{i}", "paperId": f"p{i}"}
+            yield {"title": "unavailable", "paperId": "missing"}
+
+        def analyze(paper, topic):
+            if paper["title"] == "p0":
+                first_analyzed.set()
+            return {"title": paper["title"], "analysis": paper["full_text"].strip()}
+
+        saved = (pipeline.resolve_pdf_path, extraction.extraction_cache)
+        pipeline.resolve_pdf_path = lambda paper: pdfs.get(paper["paperId"])
+        extraction.extraction_cache = ExtractionCache(os.path.join(tmp, "cache"))
+        try:
+            done, analyses = run_streaming_pipeline(papers(), char_budget=0, topic="findings", analyze_fn=analyze)
+        finally:
+            pipeline.resolve_pdf_path, extraction.extraction_cache = saved
+
+        assert events == [("analyzed p0 before p3 arrived", True)]
+        # Input order is kept; a paper whose PDF could not be fetched is not analyzed
+        assert [p["title"] for p in done] == ["p0", "p1", "p2", "p3", "unavailable"]
+        assert [a["title"] for a in analyses] == ["p0", "p1", "p2", "p3"]
+        assert all(f"finding number {i}" in a["analysis"] for i, a in enumerate(analyses))
+
+if __name__ == "__main__":
+    test_first_paper_is_analyzed_before_the_last_one_arrives()
+    print("All pipeline tests passed!")
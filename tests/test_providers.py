@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import time
+import asyncio
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from search import _parse_paper
+from providers import (
+    SearchProvider, get_providers, parse_arxiv_feed, merge_results, federated_search, afederated_search,
+    iter_federated, aiter_federated,
+)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+with open(os.path.join(FIXTURES, "arxiv_search.xml")) as f:
+    ARXIV_FEED = f.read()
+with open(os.path.join(FIXTURES, "semantic_scholar_search.json")) as f:
+    S2_PAPERS = [_parse_paper(item) for item in json.load(f)["data"]]
+
+class StaticProvider(SearchProvider):
+    """Returns fixed results after an optional delay."""
+
+    def __init__(self, name, papers, delay=0.0, timeout=1.0):
+        super().__init__(timeout)
+        self.name = name
+        self.papers = papers
+        self.delay = delay
+
+    def search(self, topic, limit):
+        time.sleep(self.delay)
+        return self.papers[:limit]
+
+    async def asearch(self, topic, limit):
+        await asyncio.sleep(self.delay)
+        return self.papers[:limit]
+
+def test_parse_arxiv_feed():
+    papers = parse_arxiv_feed(ARXIV_FEED)
+    assert [p["arxivId"] for p in papers] == ["2401.00001", "1001.3771", "hep-th/9901001"]
+    assert papers[0]["title"] == "Agentic Workflows for Software Engineering"
+    assert papers[0]["pdf_url"] == "http://arxiv.org/pdf/2401.00001v2"
+    assert papers[0]["year"] == 2024 and papers[0]["authors"] == ["A. Researcher", "B. Engineer"]
+    assert papers[1]["venue"] == "J. Tools 1 (2010)"
+    assert papers[2]["paperId"] == "arXiv-hep-th_9901001"
+
+def test_merge_dedups_by_id_and_title():
+    arxiv = parse_arxiv_feed(ARXIV_FEED)
+    merged = merge_results([S2_PAPERS, arxiv], limit=10)
+    # First paper matches on arXiv id/DOI, second only on normalized title
+    assert [p["title"] for p in merged] == [
+        "Agentic Workflows for Software Engineering",
+        "A Survey of Tool-Using Language Models",
+        "Strings Before Agents",
+    ]
+    # The Semantic Scholar record is kept, gaps are filled from arXiv
+    assert merged[1]["paperId"] == S2_PAPERS[1]["paperId"]
+    assert merged[1]["pdf_url"] == "http://arxiv.org/pdf/1001.3771v1"
+    assert merged[1]["authors"] == ["C. Surveyor"]
+
+def test_slow_provider_is_skipped():
+    fast = StaticProvider("fast", S2_PAPERS)
+    slow = StaticProvider("slow", parse_arxiv_feed(ARXIV_FEED), delay=2.0, timeout=0.2)
+
+    start = time.monotonic()
+    papers = federated_search("agents", limit=5, providers=[slow, fast])
+    assert time.monotonic() - start < 1.0
+    # Only papers with a PDF to analyze are kept
+    with_pdf = [p["paperId"] for p in S2_PAPERS if p["pdf_url"]]
+    assert [p["paperId"] for p in papers] == with_pdf
+
+    papers = asyncio.run(afederated_search("agents", limit=5, providers=[slow, fast]))
+    assert [p["paperId"] for p in papers] == with_pdf
+
+def test_streamed_search_merges_every_provider():
+    arxiv = StaticProvider("arxiv", parse_arxiv_feed(ARXIV_FEED))
+    s2 = StaticProvider("s2", S2_PAPERS)
+    slow = StaticProvider("slow", S2_PAPERS, delay=2.0, timeout=0.2)
+    expected = [p["title"] for p in merge_results([S2_PAPERS, parse_arxiv_feed(ARXIV_FEED)], limit=10) if p["pdf_url"]]
+
+    async def collect():
+        return [p async for p in aiter_federated("agents", limit=10, providers=[s2, arxiv, slow])]
+
+    start = time.monotonic()
+    for papers in (list(iter_federated("agents", limit=10, providers=[s2, arxiv, slow])), asyncio.run(collect())):
+        # Duplicates are merged, whichever source answers first; arXiv supplies missing PDF links
+        assert sorted(p["title"] for p in papers) == sorted(expected)
+        assert all(p["pdf_url"] for p in papers)
+    assert time.monotonic() - start < 2.0
+
+    first = next(iter_federated("agents", limit=1, providers=[s2, arxiv]))
+    assert first["pdf_url"]
+
+def test_providers_are_created_once():
+    first, second = get_providers(), get_providers()
+    assert first and all(a is b for a, b in zip(first, second))
+
+if __name__ == "__main__":
+    test_parse_arxiv_feed()
+    test_merge_dedups_by_id_and_title()
+    test_slow_provider_is_skipped()
+    test_streamed_search_merges_every_provider()
+    test_providers_are_created_once()
+    print("All provider tests passed!")
@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import asyncio
+import time
+import threading
+import urllib.error
+import urllib.request
+import concurrent.futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from scheduler import LLMScheduler, TokenBucket, AdaptiveConcurrency
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI-compatible /chat/completions endpoint.
+    Throttles (429) the first `throttle_next` requests and, when
+    `max_in_flight` is set, any request beyond that concurrency.
+    """
+    lock = threading.Lock()
+    throttle_next = 0
+    max_in_flight = None
+    in_flight = 0
+    calls = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with FakeOpenAIHandler.lock:
+            FakeOpenAIHandler.calls += 1
+            FakeOpenAIHandler.in_flight += 1
+            throttle = FakeOpenAIHandler.throttle_next > 0 or (
+                FakeOpenAIHandler.max_in_flight is not None and FakeOpenAIHandler.in_flight > FakeOpenAIHandler.max_in_flight
+            )
+            if FakeOpenAIHandler.throttle_next > 0:
+                FakeOpenAIHandler.throttle_next -= 1
+        try:
+            if throttle:
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            time.sleep(0.02)
+            payload = json.dumps({
+                "id": "chatcmpl-test",
+                "object": "chat.completion",
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "ok"}}],
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        finally:
+            with FakeOpenAIHandler.lock:
+                FakeOpenAIHandler.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code, headers):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"status_code": status_code, "headers": headers})()
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+def chat(url):
+    request = urllib.request.Request(
+        url, data=json.dumps({"model": "fake", "messages": [{"role": "user", "content": "hi"}]}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())["choices"][0]["message"]["content"]
+    except urllib.error.HTTPError as e:
+        raise FakeAPIError(e.code, dict(e.headers))
+
+def reset_server(throttle_next=0, max_in_flight=None):
+    FakeOpenAIHandler.throttle_next = throttle_next
+    FakeOpenAIHandler.max_in_flight = max_in_flight
+    FakeOpenAIHandler.calls = 0
+
+def test_retries_through_throttling():
+    server, url = start_server()
+    reset_server(throttle_next=3)
+    scheduler = LLMScheduler(requests_per_minute=6000, base_delay=0.01, max_delay=0.05)
+    assert scheduler.run(lambda: chat(url)) == "ok"
+    assert FakeOpenAIHandler.calls == 4
+    assert scheduler.stats["throttled"] == 3
+    server.shutdown()
+
+def test_gives_up_after_max_retries():
+    server, url = start_server()
+    reset_server(throttle_next=10)
+    scheduler = LLMScheduler(requests_per_minute=6000, max_retries=2, base_delay=0.01, max_delay=0.05)
+    try:
+        scheduler.run(lambda: chat(url))
+        assert False, "expected the throttling error to propagate"
+    except FakeAPIError as e:
+        assert e.status_code == 429
+    assert FakeOpenAIHandler.calls == 3
+    server.shutdown()
+
+def test_non_retryable_errors_are_not_retried():
+    scheduler = LLMScheduler(requests_per_minute=6000)
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise FakeAPIError(400, {})
+
+    try:
+        scheduler.run(bad_request)
+    except FakeAPIError:
+        pass
+    assert len(calls) == 1
+
+def test_concurrency_backs_off_under_throttling():
+    server, url = start_server()
+    reset_server(max_in_flight=3)
+    scheduler = LLMScheduler(requests_per_minute=60000, base_delay=0.01, max_delay=0.05,
+                             initial_concurrency=8, max_concurrency=16)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda _: scheduler.run(lambda: chat(url)), range(40)))
+    assert results == ["ok"] * 40
+    assert scheduler.stats["throttled"] > 0
+    assert scheduler.concurrency.limit < 8
+    server.shutdown()
+
+def test_token_bucket_waits_when_empty():
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == 0
+    wait = bucket.reserve(1)
+    assert 0.9 < wait <= 1.0
+
+def test_additive_increase():
+    limiter = AdaptiveConcurrency(initial=2, maximum=4)
+    for _ in range(10):
+        assert limiter.try_acquire()
+        limiter.release()
+    assert limiter.limit > 3
+
+def test_burst_of_throttles_halves_once():
+    limiter = AdaptiveConcurrency(initial=8)
+    epochs = [limiter.acquire() for _ in range(8)]
+    for epoch in epochs:
+        limiter.release(throttled=True, epoch=epoch)
+    assert limiter.limit == 4
+
+    # A call started after the decrease can lower it again
+    limiter.release(throttled=True, epoch=limiter.acquire())
+    assert limiter.limit == 2
+
+def test_async_waiters_are_handed_slots():
+    limiter = AdaptiveConcurrency(initial=1, maximum=1)
+    order = []
+
+    async def worker(i):
+        await limiter.aacquire()
+        order.append(i)
+        await asyncio.sleep(0.01)
+        limiter.release()
+
+    async def main():
+        await asyncio.gather(*[worker(i) for i in range(5)])
+        # A cancelled waiter does not keep its slot
+        assert limiter.try_acquire()
+        waiting = asyncio.ensure_future(limiter.aacquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        limiter.release()
+        await asyncio.sleep(0.01)
+        assert waiting.cancelled()
+        assert limiter.in_flight == 0 and not limiter._waiters
+
+    asyncio.run(main())
+    assert order == [0, 1, 2, 3, 4]
+
+def test_cancelled_calls_do_not_grow_the_limit():
+    scheduler = LLMScheduler(requests_per_minute=6000, tokens_per_minute=10 ** 6)
+    limit = scheduler.concurrency.limit
+
+    async def main():
+        for _ in range(5):
+            call = asyncio.ensure_future(scheduler.arun(lambda: asyncio.sleep(10)))
+            await asyncio.sleep(0.01)
+            call.cancel()
+            try:
+                await call
+            except asyncio.CancelledError:
+                pass
+
+    asyncio.run(main())
+    assert scheduler.concurrency.limit == limit and scheduler.concurrency.in_flight == 0
+
+if __name__ == "__main__":
+    test_retries_through_throttling()
+    test_gives_up_after_max_retries()
+    test_non_retryable_errors_are_not_retried()
+    test_concurrency_backs_off_under_throttling()
+    test_token_bucket_waits_when_empty()
+    test_additive_increase()
+    test_burst_of_throttles_halves_once()
+    test_async_waiters_are_handed_slots()
+    test_cancelled_calls_do_not_grow_the_limit()
+    print("All scheduler tests passed!")
@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import asyncio
+import tempfile
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from cache import ResponseCache
+from search import SemanticScholarClient, API_KEY_COOLDOWN, _parse_results, _parse_paper
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "semantic_scholar_search.json")
+
+with open(FIXTURE) as f:
+    RECORDED_SEARCH = json.load(f)
+RECORDED_PAPERS = {item["paperId"]: item for item in RECORDED_SEARCH["data"]}
+
+class GraphApiStandIn(BaseHTTPRequestHandler):
+    """Replays recorded Graph API responses and counts the requests it serves."""
+    seen = []
+
+    def _reply(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        GraphApiStandIn.seen.append(("GET", url.path, parse_qs(url.query)))
+        if self.headers.get("x-api-key") == "revoked":
+            self._reply({"message": "Forbidden"}, status=403)
+        elif url.path == "/graph/v1/paper/search":
+            query = parse_qs(url.query)
+            offset = int(query.get("offset", ["0"])[0])
+            limit = int(query.get("limit", ["100"])[0])
+            data = RECORDED_SEARCH["data"]
+            page = {"total": len(data), "offset": offset, "data": data[offset:offset + limit]}
+            if offset + limit < len(data):
+                page["next"] = offset + limit
+            self._reply(page)
+        else:
+            self._reply({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        GraphApiStandIn.seen.append(("POST", url.path, body))
+        if url.path == "/graph/v1/paper/batch":
+            self._reply([RECORDED_PAPERS.get(pid) for pid in body["ids"]])
+        else:
+            self._reply({"error": "not found"}, status=404)
+
+    def log_message(self, *args):
+        pass
+
+def make_client(tmp, api_key=""):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GraphApiStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = SemanticScholarClient(
+        api_key=api_key,
+        base_url=f"http://127.0.0.1:{server.server_address[1]}/graph/v1",
+        requests_per_second=100,
+        cache=ResponseCache("test", path=os.path.join(tmp, "s2.sqlite3")),
+    )
+    GraphApiStandIn.seen = []
+    return server, client
+
+def test_search_parses_recorded_response():
+    with tempfile.TemporaryDirectory() as tmp:
+        server, client = make_client(tmp)
+        papers = _parse_results(client.search("agentic workflows", limit=2))
+        assert [p["paperId"] for p in papers] == list(RECORDED_PAPERS)
+        assert papers[0]["pdf_url"] == "https://arxiv.org/pdf/2401.00001"
+        assert papers[0]["authors"] == ["A. Researcher", "B. Engineer"]
+        assert papers[1]["pdf_url"] is None and papers[1]["authors"] == []
+        server.shutdown()
+
+def test_repeat_search_is_served_from_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        server, client = make_client(tmp)
+        first = client.search("agentic workflows", limit=2)
+        second = client.search("  Agentic Workflows ", limit=2)
+        assert first == second
+        assert len(GraphApiStandIn.seen) == 1
+        # A different limit is a different query
+        client.search("agentic workflows", limit=5)
+        assert len(GraphApiStandIn.seen) == 2
+        server.shutdown()
+
+def test_refresh_uses_one_batch_call():
+    with tempfile.TemporaryDirectory() as tmp:
+        server, client = make_client(tmp)
+        ids = list(RECORDED_PAPERS) + ["unknown-id"]
+        items = client.get_papers(ids, refresh=True)
+        assert [item["paperId"] for item in items] == list(RECORDED_PAPERS)
+        assert [(method, path) for method, path, _ in GraphApiStandIn.seen] == [("POST", "/graph/v1/paper/batch")]
+        assert GraphApiStandIn.seen[0][2] == {"ids": ids}
+
+        # Now cached: no further requests
+        client.get_papers(list(RECORDED_PAPERS))
+        assert len(GraphApiStandIn.seen) == 1
+        server.shutdown()
+
+def test_iter_search_follows_next_offsets():
+    with tempfile.TemporaryDirectory() as tmp:
+        server, client = make_client(tmp)
+        pages = list(client.iter_search("agentic workflows", max_results=10, page_size=1))
+        assert [[item["paperId"] for item in page] for page in pages] == [[pid] for pid in RECORDED_PAPERS]
+        offsets = [query["offset"] for _, path, query in GraphApiStandIn.seen if path == "/graph/v1/paper/search"]
+        assert offsets == [["0"], ["1"]]
+
+        # The cap stops paging early; cached pages need no search requests
+        GraphApiStandIn.seen = []
+        papers = [_parse_paper(item) for page in client.iter_search("agentic workflows", max_results=1, page_size=1)
+                  for item in page]
+        assert [p["paperId"] for p in papers] == list(RECORDED_PAPERS)[:1]
+        assert not any(path == "/graph/v1/paper/search" for _, path, _ in GraphApiStandIn.seen)
+
+        # Only as many results as are still wanted are requested
+        GraphApiStandIn.seen = []
+        list(client.iter_search("agent benchmarks", max_results=1))
+        assert [query["limit"] for _, path, query in GraphApiStandIn.seen if path == "/graph/v1/paper/search"] == [["1"]]
+        server.shutdown()
+
+def test_async_search_keeps_the_cache_off_the_event_loop():
+    with tempfile.TemporaryDirectory() as tmp:
+        server, client = make_client(tmp)
+        statements = []
+        client.cache._conn.set_trace_callback(lambda sql: statements.append((threading.get_ident(), sql)))
+
+        async def search_twice():
+            loop_thread = threading.get_ident()
+            first = await client.asearch("agentic workflows", limit=2)
+            second = await client.asearch("agentic workflows", limit=2)
+            return loop_thread, first, second
+
+        loop_thread, first, second = asyncio.run(search_twice())
+        assert first == second and len(GraphApiStandIn.seen) == 1
+        assert statements and all(thread != loop_thread for thread, _ in statements)
+        # The search and both papers were written in a single commit
+        inserts = [i for i, (_, sql) in enumerate(statements) if sql.startswith("INSERT")]
+        assert len(inserts) == 3
+        assert all(sql != "COMMIT" for _, sql in statements[inserts[0]:inserts[-1]])
+        server.shutdown()
+
+def test_rejected_key_falls_back_for_a_cooldown():
+    with tempfile.TemporaryDirectory() as tmp:
+        server, client = make_client(tmp, api_key="revoked")
+        assert len(client.search("agentic workflows", limit=2)) == 2
+        assert len(GraphApiStandIn.seen) == 2  # Rejected with the key, then served without it
+        assert client.api_key == "revoked" and not client._use_key()
+
+        client.search("agent benchmarks", limit=2)
+        assert len(GraphApiStandIn.seen) == 3  # Cooling down: straight to the public API
+
+        client._key_rejected_at -= API_KEY_COOLDOWN
+        assert client._use_key()
+        server.shutdown()
+
+if __name__ == "__main__":
+    test_search_parses_recorded_response()
+    test_repeat_search_is_served_from_cache()
+    test_refresh_uses_one_batch_call()
+    test_iter_search_follows_next_offsets()
+    test_async_search_keeps_the_cache_off_the_event_loop()
+    test_rejected_key_falls_back_for_a_cooldown()
+    print("All search tests passed!")
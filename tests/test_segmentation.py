@@ -0,0 +1,84 @@
+import os
+import sys
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from extraction import segment_text, strip_back_matter
+
+PAPER = """# **Routing With Graph Networks**
+
+A. Researcher
+
+**_Abstract_ - We route packets with graph neural networks.**
+
+## **1. Introduction**
+
+Routing matters.
+
+## **2. Method**
+
+We train a GNN.
+
+### **2.1 Training details**
+
+Adam, 10 epochs.
+
+## **3. Results**
+
+Latency drops by 40%.
+
+### **3.1. Ablations**
+
+Removing attention hurts.
+
+#### 3.1.2. Per-topology breakdown
+
+Meshes gain most.
+
+## **Acknowledgments**
+
+We thank our funders.
+
+## **References**
+
+[1] A. Author. Some paper. 2020.
+
+**[2] B. Author. Bold entry.**
+
+## **4. Conclusion**
+
+GNNs route well.
+
+## **Appendix A. Proofs**
+
+Lemma 1 holds.
+"""
+
+def test_sections_and_offsets():
+    sections = segment_text(PAPER)
+    assert [s["kind"] for s in sections] == [
+        "body", "abstract", "introduction", "methods", "methods", "results", "results", "results",
+        "acknowledgements", "references", "conclusion", "appendix",
+    ]
+    results = next(s for s in sections if s["kind"] == "results")
+    # Subsections numbered with a trailing dot ("3.1.") stay in their section
+    assert [s["title"] for s in sections if s["kind"] == "results"] == [
+        "3. Results", "3.1. Ablations", "3.1.2. Per-topology breakdown",
+    ]
+    assert PAPER[results["start"]:results["end"]].strip() == "## **3. Results**\n\nLatency drops by 40%."
+    # Offsets tile the document
+    assert sections[0]["start"] == 0 and sections[-1]["end"] == len(PAPER)
+    assert all(a["end"] == b["start"] for a, b in zip(sections, sections[1:]))
+
+def test_strip_back_matter():
+    stripped = strip_back_matter(PAPER)
+    assert "Latency drops" in stripped and "GNNs route well" in stripped
+    for removed in ("funders", "Some paper", "Bold entry", "Lemma 1"):
+        assert removed not in stripped
+    assert strip_back_matter("# Notes\n\nNo back matter here.") == "# Notes\n\nNo back matter here."
+
+if __name__ == "__main__":
+    test_sections_and_offsets()
+    test_strip_back_matter()
+    print("All segmentation tests passed!")
@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import concurrent.futures
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from serving import SingleFlight, FairJobQueue
+
+def test_single_flight_shares_result():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def work():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "result"
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(flight.do, "key", work)
+        started.wait()
+        followers = [executor.submit(flight.do, "key", work) for _ in range(3)]
+        assert leader.result() == "result"
+        assert [f.result() for f in followers] == ["result"] * 3
+    assert len(calls) == 1
+    assert flight.stats == {"leaders": 1, "followers": 3}
+
+def test_single_flight_forgets_finished_keys():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+
+def test_submit_does_not_hold_the_lock_while_submitting():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow_submit():
+        # Like submitting to a pool whose queue is full
+        calls.append("slow")
+        release.wait(5)
+        done = concurrent.futures.Future()
+        done.set_result("slow")
+        return done
+
+    def fast_submit():
+        calls.append("fast")
+        done = concurrent.futures.Future()
+        done.set_result("fast")
+        return done
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        leader = executor.submit(flight.submit, "slow", slow_submit)
+        while not calls:
+            time.sleep(0.01)
+        # Other keys go ahead, and the same key joins the pending placeholder
+        assert flight.submit("fast", fast_submit).result(timeout=1) == "fast"
+        follower = flight.submit("slow", slow_submit)
+        release.set()
+        assert follower.result(timeout=5) == "slow" and leader.result(timeout=5) is follower
+    assert calls == ["slow", "fast"]
+    assert flight.submit("slow", fast_submit).result() == "fast"  # Forgotten once finished
+
+def test_single_flight_async_followers():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "shared"
+
+    async def main():
+        return await asyncio.gather(*[flight.ado("key", work) for _ in range(5)])
+
+    assert asyncio.run(main()) == ["shared"] * 5
+    assert len(calls) == 1
+
+def test_cancelled_leader_hands_work_to_a_follower():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "done"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.ado("key", work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flight.ado("key", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await follower == "done"
+        assert leader.cancelled()
+
+        # Errors are still shared
+        async def fail():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            raise ValueError("bad")
+        results = await asyncio.gather(flight.ado("err", fail), flight.ado("err", fail), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+
+    asyncio.run(main())
+    assert len(calls) == 3
+
+def test_job_queue_round_robin_across_users():
+    async def main():
+        jobs = FairJobQueue(max_concurrent=1)
+        first = jobs.enqueue("alice")
+        alice = [jobs.enqueue("alice") for _ in range(3)]
+        bob = jobs.enqueue("bob")
+        assert first.done()
+        assert jobs.position(bob) == 2
+
+        order = []
+        pending = {t: f"alice{i}" for i, t in enumerate(alice)}
+        pending[bob] = "bob"
+        jobs.release(first)
+        while pending:
+            admitted = [t for t in pending if t.done()]
+            assert len(admitted) == 1
+            order.append(pending.pop(admitted[0]))
+            jobs.release(admitted[0])
+        return order
+
+    assert asyncio.run(main()) == ["alice0", "bob", "alice1", "alice2"]
+
+def test_job_queue_release_before_admission():
+    async def main():
+        jobs = FairJobQueue(max_concurrent=1)
+        running = jobs.enqueue("a")
+        waiting = jobs.enqueue("b")
+        jobs.release(waiting)
+        assert waiting.cancelled()
+        jobs.release(running)
+        assert jobs.running == 0
+
+    asyncio.run(main())
+
+if __name__ == "__main__":
+    test_single_flight_shares_result()
+    test_single_flight_forgets_finished_keys()
+    test_submit_does_not_hold_the_lock_while_submitting()
+    test_single_flight_async_followers()
+    test_cancelled_leader_hands_work_to_a_follower()
+    test_job_queue_round_robin_across_users()
+    test_job_queue_release_before_admission()
+    print("All serving tests passed!")
@@ -0,0 +1,72 @@
+import os
+import sys
+import asyncio
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import writing
+import critique
+from graph.graph import build_graph, awriting_node, acritique_node
+
+WORDS = ["streamed", "text", "arrives", "word", "by", "word"]
+
+async def streaming_llm(prompt_value, temperature=0, on_partial=None):
+    """Stands in for llm.acomplete: reports the text so far after every word."""
+    text = ""
+    for word in WORDS:
+        text = f"{text} {word}".strip()
+        if on_partial:
+            on_partial(text)
+        await asyncio.sleep(0)
+    return text
+
+def stub(update):
+    async def run(state):
+        return update
+    return run
+
+def test_sections_stream_before_their_node_finishes():
+    graph = build_graph({
+        "search": stub({"papers": [{"title": "A", "authors": ["X"], "year": 2024}]}),
+        "extract": stub({}),
+        "analyze": stub({"synthesis": "S"}),
+        "pipeline": stub({}),
+        "write": awriting_node,
+        "critique": acritique_node,
+        "revise": stub({}),
+    })
+
+    async def run():
+        events = []
+        async for mode, output in graph.astream({"topic": "t", "revision_count": 1}, stream_mode=["updates", "custom"]):
+            events.append((mode, output))
+        return events
+
+    saved = (writing.acomplete, critique.acomplete)
+    writing.acomplete = critique.acomplete = streaming_llm
+    try:
+        events = asyncio.run(run())
+    finally:
+        writing.acomplete, critique.acomplete = saved
+
+    nodes = [next(iter(output)) for mode, output in events if mode == "updates"]
+    assert nodes == ["search", "extract", "analyze", "write", "critique"]
+    final = " ".join(WORDS)
+    for section in [s["name"] for s in writing.DEFAULT_SECTIONS] + ["Critique"]:
+        texts = [output["text"] for mode, output in events if mode == "custom" and output["section"] == section]
+        # Text grows word by word and ends with the full section
+        assert texts[0] == WORDS[0] and texts[-1] == final
+        assert all(later.startswith(earlier) for earlier, later in zip(texts, texts[1:]))
+
+    # Partial text reaches the caller while its node is still running
+    position = {next(iter(output)): i for i, (mode, output) in enumerate(events) if mode == "updates"}
+    custom = [i for i, (mode, output) in enumerate(events) if mode == "custom"]
+    sections = [i for i in custom if events[i][1]["section"] != "Critique"]
+    critiques = [i for i in custom if events[i][1]["section"] == "Critique"]
+    assert position["analyze"] < min(sections) and max(sections) < position["write"]
+    assert position["write"] < min(critiques) and max(critiques) < position["critique"]
+
+if __name__ == "__main__":
+    test_sections_stream_before_their_node_finishes()
+    print("All streaming tests passed!")
@@ -0,0 +1,61 @@
+import os
+import sys
+import asyncio
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import summarize
+from summarize import areduce, asummarize_text
+
+class RecordingLLM:
+    """Stands in for llm.acomplete: records each prompt's part count and echoes a short summary."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, prompt_value, temperature=0, max_tokens=None):
+        user = prompt_value.to_messages()[-1].content
+        parts = user.count("\n\n[") + 1 if user.startswith("[1]") else 0
+        self.calls.append(parts)
+        return f"summary{len(self.calls)}"
+
+def with_fake_llm(fn):
+    def wrapper():
+        original = summarize.acomplete
+        summarize.acomplete = RecordingLLM()
+        try:
+            fn(summarize.acomplete)
+        finally:
+            summarize.acomplete = original
+    wrapper.__name__ = fn.__name__
+    return wrapper
+
+@with_fake_llm
+def test_tree_reduce_bounds_fan_in(llm):
+    result = asyncio.run(areduce([f"paper {i}" for i in range(50)], "merge", fan_in=6))
+    # 50 -> 9 -> 2 -> 1: three levels, never more than 6 inputs per call
+    assert llm.calls.count(6) == 8 + 1
+    assert len(llm.calls) == 9 + 2 + 1
+    assert max(llm.calls) <= 6
+    assert result == f"summary{len(llm.calls)}"
+
+@with_fake_llm
+def test_single_part_needs_no_reduce(llm):
+    assert asyncio.run(areduce(["only"], "merge")) == "only"
+    assert asyncio.run(areduce([], "merge")) == ""
+    assert llm.calls == []
+
+@with_fake_llm
+def test_paper_is_mapped_then_reduced(llm):
+    text = ("Findings paragraph. " * 100 + "\n\n") * 10 + "## References\n\n[1] Skipped."
+    asyncio.run(asummarize_text(text, "A Paper"))
+    map_calls = [c for c in llm.calls if c == 0]
+    assert len(map_calls) == len(summarize.chunk_text(text.split("## References")[0], summarize.SUMMARY_CHUNK_CHARS, 200))
+    assert len(llm.calls) > len(map_calls)
+
+if __name__ == "__main__":
+    test_tree_reduce_bounds_fan_in()
+    test_single_part_needs_no_reduce()
+    test_paper_is_mapped_then_reduced()
+    print("All summarization tests passed!")
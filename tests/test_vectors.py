@@ -0,0 +1,99 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import vectors
+from vectors import HashingEmbedder, VectorIndex, chunk_spans, chunk_text, cluster_vectors, select_relevant_text
+
+PAPER = "\n\n".join([
+    "# A Study of Things\nAuthors, affiliations and a long preamble about the venue.",
+    "## Introduction\n" + "Background on many unrelated topics. " * 40,
+    "## Results\nThe graph neural network reduced routing latency by 40 percent on all benchmarks.",
+    "## Acknowledgements\n" + "We thank our funders and colleagues. " * 40,
+])
+
+def test_chunks_cover_text_with_overlap():
+    text = "word " * 1000
+    chunks = chunk_text(text, size=300, overlap=50)
+    assert all(len(c) <= 300 for c in chunks)
+    assert len(chunks) > len(text) // 300
+    assert all(c.startswith("word") for c in chunks)
+    assert chunk_text("") == []
+
+def test_index_search_and_reload():
+    embedder = HashingEmbedder(dim=4096)
+    text_a = "routing latency of networks|funding and thanks"
+    text_b = "image segmentation|routing tables|latency of routing"
+    with tempfile.TemporaryDirectory() as tmp:
+        index = VectorIndex(embedder, tmp)
+        rows_a = index.add("a", text_a, [(0, 27), (28, 46)])
+        rows_b = index.add("b", text_b, [(0, 18), (19, 33), (34, 52)])
+        assert rows_a == [0, 1] and rows_b == [2, 3, 4]
+        assert index.add("a", text_a, [(0, 27), (28, 46)]) == rows_a
+
+        query = embedder.embed(["routing latency"])
+        scores, ids = index.search(query, k=2)
+        assert set(ids[0].tolist()) == {0, 4}
+        assert scores[0][0] >= scores[0][1]
+
+        # Restricted to one document's rows, from a fresh memory map
+        reloaded = VectorIndex(embedder, tmp)
+        assert reloaded.rows == 5
+        _, ids = reloaded.search(query, k=1, rows=rows_b)
+        assert ids[0].tolist() == [4]
+        assert np.allclose(np.asarray(reloaded.matrix()[:5]), np.asarray(index.matrix()))
+
+def test_growing_text_embeds_only_new_chunks():
+    embedder = HashingEmbedder(dim=512)
+    calls = []
+    embed = embedder.embed
+    embedder.embed = lambda texts: calls.append(len(texts)) or embed(texts)
+    text = " ".join(f"word{i}" for i in range(400))
+    with tempfile.TemporaryDirectory() as tmp:
+        index = VectorIndex(embedder, tmp)
+        partial = text[:1500]
+        first = index.add("pdf", partial, chunk_spans(partial))
+        spans = chunk_spans(text)
+        rows = index.add("pdf", text, spans)
+        # Chunks that ended before the end of the partial text are reused
+        assert rows[:len(first) - 1] == first[:-1]
+        assert calls[1] == len(spans) - len(first) + 1
+
+        # Metadata is appended, one line per batch, and survives a reload
+        with open(os.path.join(tmp, "chunks.jsonl")) as f:
+            assert len(f.readlines()) == 2
+        assert VectorIndex(embedder, tmp).add("pdf", text, spans) == rows
+        assert len(calls) == 2
+
+def test_select_relevant_text_keeps_findings():
+    with tempfile.TemporaryDirectory() as tmp:
+        vectors._index = VectorIndex(HashingEmbedder(dim=512), tmp)
+        try:
+            selected = select_relevant_text(PAPER, "graph neural network routing latency", budget=1000)
+            assert "reduced routing latency by 40 percent" in selected
+            assert len(selected) <= 1000
+            assert select_relevant_text("short", "anything", budget=1000) == "short"
+        finally:
+            vectors._index = None
+
+def test_cluster_vectors_groups_by_topic():
+    embedder = HashingEmbedder(dim=4096)
+    texts = ["graph neural network routing"] * 3 + ["protein folding structure prediction"] * 3
+    texts = [f"{t} paper {i}" for i, t in enumerate(texts)]
+    labels = cluster_vectors(embedder.embed(texts), k=2).tolist()
+    assert labels[:3] == [labels[0]] * 3 and labels[3:] == [labels[3]] * 3
+    assert labels[0] != labels[3]
+    assert cluster_vectors(embedder.embed(texts[:1]), k=4).tolist() == [0]
+
+if __name__ == "__main__":
+    test_chunks_cover_text_with_overlap()
+    test_index_search_and_reload()
+    test_growing_text_embeds_only_new_chunks()
+    test_select_relevant_text_keeps_findings()
+    test_cluster_vectors_groups_by_topic()
+    print("All vector tests passed!")
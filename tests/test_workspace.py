@@ -0,0 +1,130 @@
+import os
+import sys
+import asyncio
+import tempfile
+import threading
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from workspace import ReviewWorkspace
+
+SETTINGS = ["analysis", "agents"]
+
+def make_papers(tmp, names):
+    papers = []
+    for name in names:
+        path = os.path.join(tmp, f"{name}.pdf")
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(f"%PDF {name}".encode())
+        papers.append({"title": name, "paperId": name, "pdf_path": path, "is_local": True})
+    return papers
+
+class CountingAnalyzer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, paper):
+        self.calls.append(paper["title"])
+        return {"title": paper["title"], "analysis": f"analysis of {paper['title']}"}
+
+def analyze_all(workspace, papers, settings=SETTINGS):
+    analyzer = CountingAnalyzer()
+    for paper in papers:
+        workspace.analyze_one(paper, settings, analyzer)
+    workspace.prune()
+    return analyzer.calls, workspace.analyses_for(papers)
+
+def test_only_the_delta_is_analyzed():
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = ReviewWorkspace("review", directory=tmp)
+        calls, analyses = analyze_all(workspace, make_papers(tmp, ["a", "b", "c"]))
+        assert calls == ["a", "b", "c"]
+
+        # A fresh instance reads the persisted analyses; one new paper costs one analysis
+        workspace = ReviewWorkspace("review", directory=tmp)
+        calls, analyses = analyze_all(workspace, make_papers(tmp, ["d", "b", "a", "c"]))
+        assert calls == ["d"]
+        # Oldest first, so the new paper is appended to the reduce inputs
+        assert [a["title"] for a in analyses] == ["a", "b", "c", "d"]
+
+        calls, analyses = analyze_all(workspace, make_papers(tmp, ["a", "d"]))
+        assert calls == []
+        assert [a["title"] for a in analyses] == ["a", "d"]
+
+def test_changed_pdf_or_settings_are_reanalyzed():
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = ReviewWorkspace("review", directory=tmp)
+        analyze_all(workspace, make_papers(tmp, ["a", "b"]))
+
+        with open(os.path.join(tmp, "b.pdf"), 'wb') as f:
+            f.write(b"%PDF b, second version")
+        calls, _ = analyze_all(workspace, make_papers(tmp, ["a", "b"]))
+        assert calls == ["b"]
+
+        calls, _ = analyze_all(workspace, make_papers(tmp, ["a", "b"]), settings=["analysis", "tools"])
+        assert calls == ["a", "b"]
+
+def test_reduce_steps_rerun_only_on_changed_inputs():
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = ReviewWorkspace("review", directory=tmp)
+        inputs = [SETTINGS, [{"title": "a", "analysis": "x"}]]
+        assert workspace.recall("synthesis", inputs) is None
+        workspace.remember("synthesis", inputs, "synthesis of a")
+
+        reloaded = ReviewWorkspace("review", directory=tmp)
+        assert reloaded.recall("synthesis", inputs) == "synthesis of a"
+        assert reloaded.recall("synthesis", [SETTINGS, [{"title": "a", "analysis": "y"}]]) is None
+        assert reloaded.recall("write", inputs) is None
+
+def test_new_papers_join_existing_groups():
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = ReviewWorkspace("review", directory=tmp)
+        names = [f"routing {i}" for i in range(3)] + [f"protein folding {i}" for i in range(3)]
+        papers = make_papers(tmp, [n.replace(" ", "_") for n in names])
+        for paper, name in zip(papers, names):
+            workspace.store(paper, SETTINGS, {"title": name, "analysis": f"study of {name}"})
+        groups = workspace.groups_for(papers, group_size=4)
+        assert sum(len(g) for g in groups) == 6 and all(len(g) <= 4 for g in groups)
+
+        # A fresh instance keeps every earlier assignment and only places the newcomer
+        workspace = ReviewWorkspace("review", directory=tmp)
+        newcomer = make_papers(tmp, ["protein_folding_9"])
+        workspace.store(newcomer[0], SETTINGS, {"title": "protein folding 9", "analysis": "study of protein folding 9"})
+        regrouped = workspace.groups_for(papers + newcomer, group_size=4)
+        assert len(regrouped) == len(groups)
+        changed = [g for g in regrouped if g not in groups]
+        assert len(changed) == 1 and changed[0][:-1] in groups
+        assert changed[0][-1]["title"] == "protein folding 9"
+
+def test_async_analysis_keeps_sqlite_off_the_event_loop():
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = ReviewWorkspace("review", directory=tmp)
+        analyze_all(workspace, make_papers(tmp, ["a"]))
+        threads = []
+        workspace._conn.set_trace_callback(lambda sql: threads.append(threading.get_ident()))
+
+        async def analyze(papers):
+            async def analyzer(paper):
+                return {"title": paper["title"], "analysis": f"analysis of {paper['title']}"}
+            await asyncio.gather(*[workspace.aanalyze_one(p, SETTINGS, analyzer) for p in papers])
+            return threading.get_ident()
+
+        papers = make_papers(tmp, ["a", "b"])
+        loop_thread = asyncio.run(analyze(papers))
+        assert threads and loop_thread not in threads
+        assert [a["title"] for a in workspace.analyses_for(papers)] == ["a", "b"]
+
+def test_workspaces_are_per_owner():
+    assert ReviewWorkspace.id_for("Graph  Routing") == ReviewWorkspace.id_for("graph routing")
+    assert ReviewWorkspace.id_for("graph routing", "session-a") != ReviewWorkspace.id_for("graph routing", "session-b")
+
+if __name__ == "__main__":
+    test_only_the_delta_is_analyzed()
+    test_changed_pdf_or_settings_are_reanalyzed()
+    test_reduce_steps_rerun_only_on_changed_inputs()
+    test_new_papers_join_existing_groups()
+    test_async_analysis_keeps_sqlite_off_the_event_loop()
+    test_workspaces_are_per_owner()
+    print("All workspace tests passed!")
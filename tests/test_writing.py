@@ -0,0 +1,75 @@
+import os
+import sys
+import asyncio
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import writing
+from writing import write_sections, validate_sections
+
+class SectionLLM:
+    """Stands in for llm.acomplete: records each section's prompt and finishes sections in a set order."""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.prompts = {}
+        self.finished = []
+
+    async def __call__(self, prompt_value, temperature=0, on_partial=None):
+        system, user = [m.content for m in prompt_value.to_messages()]
+        name = system[len("Write "):].split(".")[0]
+        self.prompts[name] = user
+        await asyncio.sleep(self.delays.get(name, 0))
+        self.finished.append(name)
+        return f"<{name} text>"
+
+def run_with_fake_llm(llm, *args, **kwargs):
+    original = writing.acomplete
+    writing.acomplete = llm
+    try:
+        return asyncio.run(write_sections(*args, **kwargs))
+    finally:
+        writing.acomplete = original
+
+def test_sections_see_their_prerequisites():
+    sections = [
+        {"name": "Abstract", "depends_on": ["Results", "Discussion"]},
+        {"name": "Discussion", "depends_on": ["Results"]},
+        {"name": "Methods", "depends_on": []},
+        {"name": "Results", "depends_on": []},
+    ]
+    # Results is the slowest independent section; its dependents still wait for it
+    llm = SectionLLM({"Results": 0.1, "Methods": 0.0})
+    written = run_with_fake_llm(llm, "the synthesis", sections)
+
+    assert list(written) == ["Abstract", "Discussion", "Methods", "Results"]
+    assert written["Discussion"] == "<Discussion text>"
+    assert llm.finished == ["Methods", "Results", "Discussion", "Abstract"]
+    assert "Preceding sections" not in llm.prompts["Methods"]
+    assert "Results:\n<Results text>" in llm.prompts["Discussion"]
+    assert "Results:\n<Results text>" in llm.prompts["Abstract"]
+    assert "Discussion:\n<Discussion text>" in llm.prompts["Abstract"]
+
+def test_invalid_dependencies_are_rejected():
+    validate_sections(writing.DEFAULT_SECTIONS)
+    cycle = [
+        {"name": "Abstract", "depends_on": ["Discussion"]},
+        {"name": "Discussion", "depends_on": ["Results"]},
+        {"name": "Results", "depends_on": ["Abstract"]},
+    ]
+    unknown = [{"name": "Abstract", "depends_on": ["Conclusion"]}]
+    for sections, message in ((cycle, "cycle"), (unknown, "unknown section 'Conclusion'")):
+        llm = SectionLLM({})
+        try:
+            run_with_fake_llm(llm, "the synthesis", sections)
+            assert False, "should have been rejected"
+        except ValueError as e:
+            assert message in str(e)
+        # Nothing is written for an invalid configuration
+        assert llm.prompts == {}
+
+if __name__ == "__main__":
+    test_sections_see_their_prerequisites()
+    test_invalid_dependencies_are_rejected()
+    print("All writing tests passed!")